@@ -5,7 +5,10 @@ Utilities to compute joint angles and rolling stability metrics.
 """
 
 import math
-from typing import Tuple, Optional, Dict, List
+import numpy as np
+from typing import Tuple, Optional, Dict, List, Sequence, Union
+
+from landmarks import JOINT_INDEX, NUM_LANDMARKS, Landmarks, extend
 
 def calculate_angle(a: Tuple[float, float], b: Tuple[float, float], c: Tuple[float, float]) -> Optional[float]:
     """
@@ -42,35 +45,291 @@ def calculate_angle(a: Tuple[float, float], b: Tuple[float, float], c: Tuple[flo
     angle_rad = math.acos(cosine_angle)
     return math.degrees(angle_rad)
 
+def joint_triples(triples: Sequence[Tuple]) -> np.ndarray:
+    """
+    Converts (a, b, c) joint triples, given as names from landmarks.JOINT_INDEX
+    (e.g. 'mid_hip') or raw row indices, into an (M, 3) index table for
+    calculate_angles. The angle is measured at b.
+    """
+    return np.array(
+        [[JOINT_INDEX[j] if isinstance(j, str) else int(j) for j in t] for t in triples],
+        dtype=np.intp,
+    ).reshape(-1, 3)
+
+def calculate_angles(points: Union[Landmarks, np.ndarray], triples: np.ndarray, use_z: bool = False) -> np.ndarray:
+    """
+    Batched version of calculate_angle.
+
+    points: a Landmarks object, or a (..., K, >=2) array such as one frame
+            (33, 4) or a stack of frames (N, 33, 4). Arrays with 33 rows get
+            the left/right midpoints appended so triples may use 'mid_*' joints.
+    triples: (M, 3) index table, see joint_triples().
+    use_z: measure the angle in 3D using the z column.
+
+    Returns (..., M) angles in degrees (0-180); NaN where a vector is
+    degenerate or a landmark is missing.
+    """
+    if isinstance(points, Landmarks):
+        points = points.extended
+    else:
+        points = np.asarray(points)
+        if points.shape[-2] == NUM_LANDMARKS:
+            points = extend(points)
+
+    dims = 3 if use_z else 2
+    P = points[..., :dims].astype(np.float64, copy=False)
+    triples = np.asarray(triples, dtype=np.intp).reshape(-1, 3)
+
+    b = P[..., triples[:, 1], :]
+    ba = P[..., triples[:, 0], :] - b
+    bc = P[..., triples[:, 2], :] - b
+
+    dot = np.einsum('...i,...i->...', ba, bc)
+    norm = np.sqrt(np.einsum('...i,...i->...', ba, ba) * np.einsum('...i,...i->...', bc, bc))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cosine = dot / norm
+    # Clamp to [-1, 1] for floating point errors; NaN passes through
+    np.clip(cosine, -1.0, 1.0, out=cosine)
+    angles = np.degrees(np.arccos(cosine))
+    angles[norm == 0] = np.nan
+    return angles
+
+def angle_or_none(value) -> Optional[float]:
+    """ Scalar angle from calculate_angles as calculate_angle would return it. """
+    value = float(value)
+    return None if math.isnan(value) else value
+
+STABILITY_METHODS = ('std', 'ewma', 'mad')
+
+# Standard deviation of ~5 deg is "shaky" (score 100)
+_SHAKY_STDEV = 5.0
+# MAD -> standard deviation for normally distributed data
+_MAD_TO_STD = 1.4826
+
+def _stdev_to_score(stdev):
+    # Normalize: Standard deviation of ~5 deg is "shaky" (score 100)
+    # Standard deviation of < 1 deg is "stable" (score 0)
+    return np.minimum(100.0, (stdev / _SHAKY_STDEV) * 100.0)
+
+class _Ring:
+    """
+    Fixed-size ring buffer for one joint with running (shifted) sums.
+    The sums are rebuilt from the buffer each time it wraps, which bounds
+    floating point drift at amortized O(1) cost.
+    """
+    __slots__ = ('buf', 'pos', 'count', 'shift', 'total', 'total_sq', 'ewm_mean', 'ewm_var')
+
+    def __init__(self, window_size: int):
+        self.buf = np.zeros(window_size, dtype=np.float64)
+        self.pos = 0
+        self.count = 0
+        self.shift = 0.0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.ewm_mean = None
+        self.ewm_var = 0.0
+
+    def push(self, x: float, alpha: float):
+        buf = self.buf
+        window = len(buf)
+        if self.count == 0:
+            self.shift = x
+        d = x - self.shift
+        if self.count == window:
+            old = buf[self.pos] - self.shift
+            self.total -= old
+            self.total_sq -= old * old
+        else:
+            self.count += 1
+        buf[self.pos] = x
+        self.total += d
+        self.total_sq += d * d
+        self.pos += 1
+        if self.pos == window:
+            self.pos = 0
+            self._rebuild()
+
+        # Exponentially weighted mean / variance
+        if self.ewm_mean is None:
+            self.ewm_mean = x
+        else:
+            diff = x - self.ewm_mean
+            incr = alpha * diff
+            self.ewm_mean += incr
+            self.ewm_var = (1.0 - alpha) * (self.ewm_var + diff * incr)
+
+    def _rebuild(self):
+        data = self.buf[:self.count]
+        self.shift = float(data.mean())
+        centered = data - self.shift
+        self.total = float(centered.sum())
+        self.total_sq = float(centered @ centered)
+
+    def variance(self) -> float:
+        n = self.count
+        mean = self.total / n
+        return max(0.0, self.total_sq / n - mean * mean)
+
+    def values(self) -> np.ndarray:
+        """ Window contents, oldest first. """
+        if self.count < len(self.buf):
+            return self.buf[:self.count].copy()
+        return np.roll(self.buf, -self.pos)
+
 class RollingStability:
     """
     Tracks recent angle history to detect shaking/instability.
     returns a score from 0 (stable) to 100 (unstable).
+
+    Each joint keeps a preallocated ring buffer with running sums, so push()
+    and the default 'std' score are O(1) regardless of window size.
+    method:
+        'std'  - standard deviation over the window (default)
+        'ewma' - exponentially weighted standard deviation, alpha defaults
+                 to 2 / (window_size + 1); O(1)
+        'mad'  - median absolute deviation over the window (robust to single
+                 outlier frames); O(window) per score, cached between pushes
     """
-    def __init__(self, window_size: int = 10):
+    def __init__(self, window_size: int = 10, method: str = 'std', alpha: Optional[float] = None):
+        if method not in STABILITY_METHODS:
+            raise ValueError(f"Unknown stability method '{method}', expected one of {STABILITY_METHODS}")
         self.window_size = window_size
-        self.history: Dict[str, List[float]] = {}
+        self.method = method
+        self.alpha = alpha if alpha is not None else 2.0 / (window_size + 1)
+        self._rings: Dict[str, _Ring] = {}
+        self._mad_cache: Dict[str, float] = {}
 
     def push(self, joint_name: str, angle: Optional[float]):
         if angle is None:
             return
-        if joint_name not in self.history:
-            self.history[joint_name] = []
-        
-        self.history[joint_name].append(angle)
-        if len(self.history[joint_name]) > self.window_size:
-            self.history[joint_name].pop(0)
+        ring = self._rings.get(joint_name)
+        if ring is None:
+            ring = self._rings[joint_name] = _Ring(self.window_size)
+        ring.push(float(angle), self.alpha)
+        if self.method == 'mad':
+            self._mad_cache.pop(joint_name, None)
+
+    @property
+    def history(self) -> Dict[str, List[float]]:
+        """ Window contents per joint, oldest first. """
+        return {name: ring.values().tolist() for name, ring in self._rings.items()}
 
     def stability_score(self, joint_name: str) -> float:
-        data = self.history.get(joint_name, [])
-        if len(data) < 3:
+        ring = self._rings.get(joint_name)
+        if ring is None or ring.count < 3:
             return 0.0
-        
-        # Calculate standard deviation
-        avg = sum(data) / len(data)
-        variance = sum((x - avg) ** 2 for x in data) / len(data)
-        stdev = math.sqrt(variance)
-        
-        # Normalize: Standard deviation of ~5 deg is "shaky" (score 100)
-        # Standard deviation of < 1 deg is "stable" (score 0)
-        return min(100.0, (stdev / 5.0) * 100.0)
\ No newline at end of file
+
+        if self.method == 'ewma':
+            stdev = math.sqrt(ring.ewm_var)
+        elif self.method == 'mad':
+            cached = self._mad_cache.get(joint_name)
+            if cached is not None:
+                return cached
+            data = ring.buf[:ring.count]
+            stdev = _MAD_TO_STD * float(np.median(np.abs(data - np.median(data))))
+        else:
+            # Calculate standard deviation
+            stdev = math.sqrt(ring.variance())
+
+        score = float(_stdev_to_score(stdev))
+        if self.method == 'mad':
+            self._mad_cache[joint_name] = score
+        return score
+
+class RollingStabilityArray:
+    """
+    RollingStability for a fixed set of joints held in one
+    (n_joints, window_size) array, updated with one vectorized push per frame.
+    NaN entries are treated like a missing (None) angle for that joint.
+    """
+    def __init__(self, joints: Sequence[str], window_size: int = 10, method: str = 'std', alpha: Optional[float] = None):
+        if method not in STABILITY_METHODS:
+            raise ValueError(f"Unknown stability method '{method}', expected one of {STABILITY_METHODS}")
+        self.joints = list(joints)
+        self.index = {name: i for i, name in enumerate(self.joints)}
+        self.window_size = window_size
+        self.method = method
+        self.alpha = alpha if alpha is not None else 2.0 / (window_size + 1)
+
+        n = len(self.joints)
+        self.buf = np.zeros((n, window_size), dtype=np.float64)
+        self.pos = np.zeros(n, dtype=np.intp)
+        self.count = np.zeros(n, dtype=np.intp)
+        self.shift = np.zeros(n, dtype=np.float64)
+        self.total = np.zeros(n, dtype=np.float64)
+        self.total_sq = np.zeros(n, dtype=np.float64)
+        self.ewm_mean = np.full(n, np.nan, dtype=np.float64)
+        self.ewm_var = np.zeros(n, dtype=np.float64)
+        self._rows = np.arange(n)
+
+    def push(self, angles):
+        """ angles: (n_joints,) array in the order given at construction. """
+        x = np.asarray(angles, dtype=np.float64)
+        valid = ~np.isnan(x)
+        if not valid.any():
+            return
+        rows = self._rows[valid]
+        x = x[valid]
+        pos = self.pos[rows]
+
+        first = self.count[rows] == 0
+        self.shift[rows[first]] = x[first]
+        shift = self.shift[rows]
+
+        full = self.count[rows] == self.window_size
+        old = self.buf[rows, pos] - shift
+        old[~full] = 0.0
+        self.count[rows[~full]] += 1
+
+        d = x - shift
+        self.buf[rows, pos] = x
+        self.total[rows] += d - old
+        self.total_sq[rows] += d * d - old * old
+        pos = pos + 1
+        wrapped = pos == self.window_size
+        pos[wrapped] = 0
+        self.pos[rows] = pos
+        if wrapped.any():
+            self._rebuild(rows[wrapped])
+
+        # Exponentially weighted mean / variance
+        mean = self.ewm_mean[rows]
+        fresh = np.isnan(mean)
+        mean[fresh] = x[fresh]
+        diff = x - mean
+        incr = self.alpha * diff
+        self.ewm_mean[rows] = mean + incr
+        self.ewm_var[rows] = (1.0 - self.alpha) * (self.ewm_var[rows] + diff * incr)
+
+    def _rebuild(self, rows):
+        # Rows being rebuilt just wrapped, so their windows are full
+        data = self.buf[rows]
+        self.shift[rows] = data.mean(axis=1)
+        centered = data - self.shift[rows, None]
+        self.total[rows] = centered.sum(axis=1)
+        self.total_sq[rows] = (centered * centered).sum(axis=1)
+
+    def stability_scores(self) -> np.ndarray:
+        """ (n_joints,) scores, 0 for joints with fewer than 3 samples. """
+        n = np.maximum(self.count, 1)
+        if self.method == 'ewma':
+            stdev = np.sqrt(self.ewm_var)
+        elif self.method == 'mad':
+            # Only rows with 3+ samples (the rest score 0): nanmedian warns on all-NaN rows
+            stdev = np.zeros(len(self.count))
+            ready = self.count >= 3
+            if ready.any():
+                count = self.count[ready]
+                data = np.where(np.arange(self.window_size) < count[:, None], self.buf[ready], np.nan)
+                med = np.nanmedian(data, axis=1)
+                stdev[ready] = _MAD_TO_STD * np.nanmedian(np.abs(data - med[:, None]), axis=1)
+        else:
+            mean = self.total / n
+            stdev = np.sqrt(np.maximum(0.0, self.total_sq / n - mean * mean))
+        scores = _stdev_to_score(stdev)
+        scores[self.count < 3] = 0.0
+        return scores
+
+    def stability_score(self, joint_name: str) -> float:
+        return float(self.stability_scores()[self.index[joint_name]])
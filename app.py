@@ -1,18 +1,19 @@
+import os
 import streamlit as st
 import cv2
-import numpy as np
 import time
-from PIL import Image
 
 # Import your modules
-from pose_detection import PoseDetector
-from exercise_rules import SquatRule, PushupRule, BicepCurlRule
-from angle_calculation import RollingStability, calculate_angle
+from pose_detection import PoseDetector, InferenceScheduler, ComplexityController
+from exercise_rules import make_rule
 from session_summary import SessionSummary
 import config
 
 # Import utilities
-from utils import RepCounter, draw_overlay
+from utils import RepCounter, draw_overlay, encode_jpeg
+from pipeline import FramePipeline
+from smoothing import OneEuroFilter
+from profiler import PROFILER
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -75,87 +76,91 @@ st.markdown("""
 
 # --- Initialize Session State ---
 if 'counters' not in st.session_state:
-    st.session_state.counters = {
-        'squat': RepCounter(),
-        'pushup': RepCounter(),
-        'bicep_curl': RepCounter(),
-    }
+    st.session_state.counters = {ex: RepCounter() for ex in config.EXERCISES}
 
 if 'summary' not in st.session_state:
-    st.session_state.summary = {
-        'squat': SessionSummary(),
-        'pushup': SessionSummary(),
-        'bicep_curl': SessionSummary()
-    }
+    st.session_state.summary = {ex: SessionSummary() for ex in config.EXERCISES}
 
 # --- Load Detector ---
-@st.cache_resource
 def load_detector():
-    return PoseDetector()
+    # One per browser session: the sidebar settings (model, ROI, smoothing,
+    # adaptive rate) live on the detector. The warm-up inferences run in the
+    # background so the page renders now and "Start Camera" doesn't pay for
+    # graph set-up
+    if 'detector' not in st.session_state:
+        t0 = time.perf_counter()
+        detector = PoseDetector()
+        detector.load_s = time.perf_counter() - t0
+        detector.warmup(background=True)
+        st.session_state.detector = detector
+    return st.session_state.detector
 
 detector = load_detector()
 
 # --- Helper Functions ---
-def get_rule(exercise, mode):
-    base_thresholds = config.THRESHOLDS
-    mode_mods = config.MODES.get(mode, {})
-    
-    def apply_mod(base, mods):
-        t = base.copy()
-        for k, v in mods.items():
-            if k in t: t[k] += v 
-        return t
-
-    if exercise == 'squat':
-        return SquatRule(apply_mod(base_thresholds['squat'], mode_mods.get('squat', {})), RollingStability())
-    elif exercise == 'pushup':
-        return PushupRule(apply_mod(base_thresholds['pushup'], mode_mods.get('pushup', {})), RollingStability())
-    elif exercise == 'bicep_curl':
-        return BicepCurlRule(apply_mod(base_thresholds['bicep_curl'], mode_mods.get('bicep_curl', {})), RollingStability())
-    return None
-
-def process_reps(exercise, landmarks, rule):
+def process_reps(landmarks, rule, pose_result, counter, inferred=True):
     """
-    Calculates angles, updates RepCounter, and returns (did_rep_finish, current_angle).
+    Updates RepCounter from the rule's rep angle and returns (did_rep_finish, current_angle).
+    Angle and thresholds come from the exercise definition in config.EXERCISES.
     """
-    angle = None
-    thresh_enter = 0
-    thresh_exit = 0
-
-    if exercise == 'squat':
-        angle = calculate_angle(landmarks[23][:2], landmarks[25][:2], landmarks[27][:2])
-        thresh_enter = rule.thresholds.get('knee_angle_deep', 80)
-        thresh_exit = rule.thresholds.get('knee_angle_high', 160)
-        
-    elif exercise == 'pushup':
-        angle = calculate_angle(landmarks[11][:2], landmarks[13][:2], landmarks[15][:2])
-        thresh_enter = rule.thresholds.get('elbow_target', 100)
-        thresh_exit = rule.thresholds.get('elbow_reset', 160)
-        
-    elif exercise == 'bicep_curl': 
-        # --- ROBUST AUTO-DETECT ---
-        l_angle = calculate_angle(landmarks[11][:2], landmarks[13][:2], landmarks[15][:2])
-        r_angle = calculate_angle(landmarks[12][:2], landmarks[14][:2], landmarks[16][:2])
-        
-        # Use the arm that is "working" (closest to the flexion target)
-        if l_angle and r_angle:
-            angle = min(l_angle, r_angle)
-        elif l_angle:
-            angle = l_angle
-        elif r_angle:
-            angle = r_angle
-            
-        # Hard-coded, relaxed thresholds for better usability
-        thresh_enter = 95   
-        thresh_exit = 150   
+    angle = rule.rep_angle(pose_result)
+    thresh_enter, thresh_exit = rule.rep_thresholds
+
+    if detector.scheduler is not None:
+        detector.scheduler.update(angle, thresh_enter, thresh_exit, inferred)
 
     rep_finished = False
     if angle is not None:
-        counter = st.session_state.counters[exercise]
-        rep_finished = counter.process(angle, thresh_enter, thresh_exit)
+        rep_finished = counter.process(angle, thresh_enter, thresh_exit, time.perf_counter())
         
     return rep_finished, angle
 
+def process_frame(frame, exercise, rule, counter, summary, recorder=None):
+    """
+    Inference stage, run on the pipeline thread: detection, form check and rep
+    counting. Must not touch st.* (no script context on this thread).
+    """
+    # 1. Detection
+    # Frames come fresh from cap.read(), so annotate in place (no copy)
+    with PROFILER.span('detect'):
+        detection_result = detector.detect(frame, inplace=True)
+    image = detection_result['image']
+    landmarks = detection_result['landmarks']
+
+    # 2. Evaluate Form (Backend Check)
+    with PROFILER.span('rules'):
+        pose_result = rule.evaluate(landmarks)
+
+    # 3. Process Reps & Get Angle
+    current_angle = 180 
+    rep = 0
+    if landmarks:
+        with PROFILER.span('reps'):
+            just_finished_rep, angle = process_reps(
+                landmarks, rule, pose_result, counter, detection_result['inferred'])
+        if angle is not None:
+            current_angle = angle
+        
+        if just_finished_rep:
+            summary.push_rep(pose_result.correct, pose_result.score)
+            rep = summary.total_reps
+    elif detector.scheduler is not None:
+        detector.scheduler.update(None, 0, 0, detection_result['inferred'])
+
+    if recorder is not None:
+        recorder.record(landmarks, pose_result.score, pose_result.correct, rep)
+
+    return image, pose_result, current_angle
+
+def show_if_changed(shown, key, value, render):
+    """
+    Calls render(value) only when `value` differs from what the widget last
+    showed; every widget call is a websocket message and a browser re-render.
+    """
+    if key not in shown or shown[key] != value:
+        shown[key] = value
+        render(value)
+
 # --- Sidebar UI ---
 with st.sidebar:
     st.markdown("## ⚙️ Control Panel")
@@ -163,10 +168,40 @@ with st.sidebar:
     st.divider()
     
     st.markdown("### Choose Workout")
-    exercise_choice = st.selectbox("Exercise", ["squat", "pushup", "bicep_curl"])
+    exercise_choice = st.selectbox("Exercise", list(config.EXERCISES))
     
     st.divider()
     run_app = st.toggle("🔴 Start Camera", value=False)
+    adaptive = st.checkbox("⚡ Adaptive Inference", value=False,
+                           help="Lower the pose inference rate while you're idle or resting")
+    cpu_budget = st.slider("CPU Budget", 0.1, 1.0, 0.5, 0.05,
+                           help="Max share of time spent in pose inference while idle") if adaptive else None
+    with st.expander("🚀 Performance"):
+        use_roi = st.checkbox("Crop inference to body region", value=False,
+                              help="Only send a padded box around you to the pose model")
+        smooth = st.checkbox("Smooth landmarks", value=True,
+                             help="One Euro filter: steadier angles and rep counts, little lag")
+        model_complexity = st.selectbox("Pose model", ["auto", 0, 1, 2], index=2,
+                                        format_func=lambda c: "Auto (hold target FPS)" if c == "auto"
+                                        else ["Lite", "Full", "Heavy"][c],
+                                        help="Auto picks the model and inference resolution from measured latency")
+        if model_complexity == "auto":
+            target_fps = st.slider("Target FPS", 10, 60, 30, 5)
+            inference_width = None
+        else:
+            inference_width = st.selectbox("Inference resolution", [None, 960, 640, 480], index=0,
+                                           format_func=lambda w: "Native" if w is None else f"{w}px wide")
+        display_width = st.selectbox("Display resolution", [960, 640, 480, None], index=1,
+                                     format_func=lambda w: "Native" if w is None else f"{w}px wide",
+                                     help="Video is downscaled to this width before it is sent to the browser")
+        jpeg_quality = st.slider("Video quality", 40, 95, 75, 5, help="JPEG quality of the streamed video")
+        display_fps = st.slider("Display FPS", 5, 30, 15,
+                                help="Max video refresh rate; inference and rep counting still see every frame")
+        show_profiler = st.checkbox("Profiler overlay", value=False,
+                                    help="Time each per-frame stage and draw p50/p90 latency on the video")
+        startup_info = st.empty()
+    record_session = st.checkbox("💾 Record Session", value=False,
+                                 help="Save landmarks and scores to recordings/ for offline replay")
     
     st.divider()
     if st.button("🔄 Reset Stats"):
@@ -183,6 +218,7 @@ col_left, col_video, col_right = st.columns([1, 3, 1])
 with col_left:
     st.markdown("### 📊 Live Stats")
     metric_reps = st.empty()
+    pipeline_stats = st.empty()
     st.markdown("---")
     st.markdown("**Target Muscle:**")
     st.info(f"{exercise_choice.replace('_', ' ').title()}")
@@ -199,94 +235,159 @@ with col_right:
 
 # --- Main Logic Loop ---
 if run_app:
+    # Model first: a model that was never downloaded can fail to load offline
+    try:
+        if model_complexity == "auto":
+            if detector.auto_complexity is None or detector.auto_complexity.target_fps != target_fps:
+                detector.set_auto_complexity(ComplexityController(target_fps))
+        else:
+            detector.set_auto_complexity(None)
+            detector.set_model_complexity(model_complexity, inference_width)
+    except (OSError, RuntimeError) as e:
+        st.error(f"Pose model could not be loaded: {e}")
+        st.stop()
+    started = time.perf_counter()
     cap = cv2.VideoCapture(0)
-    rule = get_rule(exercise_choice, mode)
-
-    while cap.isOpened() and run_app:
-        ret, frame = cap.read()
-        if not ret:
-            st.error("Camera not accessible")
-            break
-
-        # 1. Detection
-        detection_result = detector.detect(frame)
-        image = detection_result['image']
-        landmarks = detection_result['landmarks']
-
-        # 2. Evaluate Form (Backend Check)
-        pose_result = rule.evaluate(landmarks)
-
-        # 3. Process Reps & Get Angle
-        current_angle = 180 
-        if landmarks:
-            just_finished_rep, current_angle = process_reps(exercise_choice, landmarks, rule)
-            
-            if just_finished_rep:
-                st.session_state.summary[exercise_choice].push_rep(pose_result.correct, pose_result.score)
-
-        # --- SANITY CHECK PROTOCOL (CRITICAL FIXES) ---
-
-        # A. Filter "Phantom Squeeze" Errors
-        # If angle > 50, it is IMPOSSIBLE to squeeze too hard. Delete the message.
-        if exercise_choice == 'bicep_curl' and current_angle > 50:
-            if pose_result.messages:
-                pose_result.messages = [m for m in pose_result.messages if "squeeze" not in m.lower()]
-
-        # B. Conflict Resolution (Score 100% vs Error Message)
-        # If there is an error message, Score CANNOT be 100%. Force it down.
-        if pose_result.messages and pose_result.score > 90:
-            pose_result.score = 75  # Downgrade score to reflect the error
-
-        # C. Idle Detection
-        is_idle = False
-        if exercise_choice == 'bicep_curl' and current_angle > 155: is_idle = True
-        elif exercise_choice == 'squat' and current_angle > 165: is_idle = True
-        elif exercise_choice == 'pushup' and current_angle > 165: is_idle = True
-
-        # 4. Update UI Elements
-        current_reps = st.session_state.summary[exercise_choice].total_reps
-        
-        # -- Stats Column --
-        metric_reps.metric(label="Total Reps", value=current_reps, delta="Count")
+    camera_s = time.perf_counter() - started
+    rule = make_rule(exercise_choice, mode)
+    detector.scheduler = InferenceScheduler(cpu_budget=cpu_budget) if adaptive else None
+    detector.roi = use_roi
+    detector.smoother = OneEuroFilter() if smooth else None
+    PROFILER.enabled = show_profiler
+    counter = st.session_state.counters[exercise_choice]
+    summary = st.session_state.summary[exercise_choice]
+    recorder = None
+    if record_session:
+        from session_recorder import SessionRecorder
+        recorder = SessionRecorder(
+            os.path.join("recordings", time.strftime(f"%Y%m%d-%H%M%S-{exercise_choice}.fitrec")),
+            exercise=exercise_choice, mode=mode, fps=cap.get(cv2.CAP_PROP_FPS) or 30.0,
+        )
+
+    pipeline = FramePipeline(
+        cap, lambda frame: process_frame(frame, exercise_choice, rule, counter, summary, recorder),
+        profiler=PROFILER,
+    )
+    pipeline.start()
+
+    shown = {}  # last value pushed to each widget
+    first_frame = True
+    frame_interval = 1.0 / display_fps
+    last_shown = last_stats = 0.0
+
+    try:
+        while cap.isOpened() and run_app:
+            item = pipeline.read()
+            if item is None:
+                if pipeline.running:
+                    continue
+                if pipeline.error is not None:
+                    # Capture or processing failed: show it, not a camera error
+                    st.error("Video processing failed")
+                    st.exception(pipeline.error)
+                else:
+                    st.error("Camera not accessible")
+                break
+
+            # Rate-limit rendering to the display refresh: reps were already
+            # counted on the inference thread, so surplus frames just drop
+            now = time.perf_counter()
+            if now - last_shown < frame_interval:
+                continue
+            last_shown = now
+
+            image, pose_result, current_angle = item
+
+            # --- SANITY CHECK PROTOCOL (CRITICAL FIXES) ---
+
+            # A. Filter "Phantom Squeeze" Errors
+            # If angle > 50, it is IMPOSSIBLE to squeeze too hard. Delete the message.
+            if exercise_choice == 'bicep_curl' and current_angle > 50:
+                if pose_result.messages:
+                    pose_result.messages = [m for m in pose_result.messages if "squeeze" not in m.lower()]
+
+            # B. Conflict Resolution (Score 100% vs Error Message)
+            # If there is an error message, Score CANNOT be 100%. Force it down.
+            if pose_result.messages and pose_result.score > 90:
+                pose_result.score = 75  # Downgrade score to reflect the error
+
+            # C. Idle Detection
+            is_idle = False
+            if exercise_choice == 'bicep_curl' and current_angle > 155: is_idle = True
+            elif exercise_choice == 'squat' and current_angle > 165: is_idle = True
+            elif exercise_choice == 'pushup' and current_angle > 165: is_idle = True
+
+            # 4. Update UI Elements
+            current_reps = st.session_state.summary[exercise_choice].total_reps
         
-        # -- Feedback Column (Strict Logic) --
+            # -- Feedback Column (Strict Logic) --
         
-        # Scenario 1: User hasn't started yet (0 reps)
-        if current_reps == 0:
-            score_bar.progress(0)
-            score_text.markdown("**Status: Ready to Start**")
-            if is_idle:
-                feedback_box.info("ℹ️ Perform your first rep to start tracking")
+            # Scenario 1: User hasn't started yet (0 reps)
+            if current_reps == 0:
+                score_val, status = 0, "**Status: Ready to Start**"
+                if is_idle:
+                    feedback = ('info', "ℹ️ Perform your first rep to start tracking")
+                else:
+                    feedback = ('info', "ℹ️ Go deeper to trigger count")
+
+            # Scenario 2: User is resting (Idle)
+            elif is_idle:
+                score_val, status = 0, "**Status: Resting**"  # Hide score while resting
+                feedback = ('info', "⬇️ Resetting for next rep...")
+
+            # Scenario 3: Active Rep
             else:
-                feedback_box.info("ℹ️ Go deeper to trigger count")
-
-        # Scenario 2: User is resting (Idle)
-        elif is_idle:
-            score_bar.progress(0) # Hide score while resting
-            score_text.markdown("**Status: Resting**")
-            feedback_box.info("⬇️ Resetting for next rep...")
-
-        # Scenario 3: Active Rep
-        else:
-            score_val = int(pose_result.score)
-            score_bar.progress(score_val)
-            score_text.markdown(f"**Form Consistency: {score_val}%**")
+                score_val = int(pose_result.score)
+                status = f"**Form Consistency: {score_val}%**"
             
-            if pose_result.messages:
-                # If we have messages (that survived the filter), show them!
-                feedback_box.warning(f"⚠️ {pose_result.messages[0]}")
-            elif score_val < 80:
-                feedback_box.info("ℹ️ Keep form steady")
-            else:
-                feedback_box.success("✅ Perfect Form!")
-
-        # -- Video Overlay --
-        draw_overlay(image, pose_result, current_reps, mode, exercise_choice)
+                if pose_result.messages:
+                    # If we have messages (that survived the filter), show them!
+                    feedback = ('warning', f"⚠️ {pose_result.messages[0]}")
+                elif score_val < 80:
+                    feedback = ('info', "ℹ️ Keep form steady")
+                else:
+                    feedback = ('success', "✅ Perfect Form!")
+
+            # Only push widgets whose value changed
+            show_if_changed(shown, 'reps', current_reps,
+                            lambda v: metric_reps.metric(label="Total Reps", value=v, delta="Count"))
+            show_if_changed(shown, 'score', score_val, score_bar.progress)
+            show_if_changed(shown, 'status', status, score_text.markdown)
+            show_if_changed(shown, 'feedback', feedback, lambda f: getattr(feedback_box, f[0])(f[1]))
+
+            # -- Video Overlay --
+            with PROFILER.span('draw_overlay'):
+                draw_overlay(image, pose_result, current_reps, mode, exercise_choice)
         
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        st_frame.image(image, channels="RGB", use_container_width=True)
-
-    cap.release()
+            # Downscaled JPEG straight from BGR: Streamlit forwards the bytes
+            # as-is instead of re-encoding a full-size PNG every frame
+            with PROFILER.span('display'):
+                st_frame.image(encode_jpeg(image, display_width, jpeg_quality),
+                               output_format="JPEG", use_container_width=True)
+
+            # Startup report: how long "Start Camera" took to show a frame
+            if first_frame:
+                first_frame = False
+                startup_info.caption(
+                    f"Startup: model load {detector.load_s:.2f}s, warm-up {detector.warmup_s or 0:.2f}s, "
+                    f"camera {camera_s:.2f}s, first frame {time.perf_counter() - started:.2f}s"
+                )
+
+            # Pipeline stats change every frame; refresh them once a second
+            if now - last_stats >= 1.0:
+                last_stats = now
+                stats_text = pipeline.stats_text()
+                if detector.scheduler is not None:
+                    stats_text += f" | infer x{detector.scheduler.stats()['inference_rate']:.2f}"
+                if detector.auto_complexity is not None:
+                    stats_text += f" | {detector.auto_complexity.label()}"
+                pipeline_stats.caption(stats_text)
+
+    finally:
+        pipeline.stop()
+        cap.release()
+        if recorder is not None:
+            recorder.close()
 else:
     with col_video:
         st.markdown(
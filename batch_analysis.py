@@ -0,0 +1,327 @@
+"""
+batch_analysis.py
+
+Headless offline scoring of recorded workout videos.
+
+Runs PoseDetector, the exercise rule and RepCounter over every frame of one
+or more video files as fast as the CPU allows (no camera pacing, no overlay
+drawing) and writes per-frame and per-rep results.
+
+Usage:
+    python batch_analysis.py clips/*.mp4 --exercise squat --mode beginner --out results/
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from pose_detection import PoseDetector
+from exercise_rules import make_rule
+from session_summary import SessionSummary
+from utils import Rep, segment_reps
+from worker_pool import LandmarkPool
+from landmark_cache import LandmarkCache
+from session_recorder import SessionReplay
+import config
+
+RECORDING_EXT = '.fitrec'
+
+@dataclass
+class FrameRecord:
+    frame: int
+    time_s: float
+    detected: bool
+    angle: Optional[float]
+    score: float
+    correct: bool
+    reps: int
+
+@dataclass
+class RepRecord:
+    rep: int
+    frame: int
+    time_s: float
+    correct: bool
+    score: float
+    min_angle: float = 0.0
+    max_angle: float = 0.0
+    rom: float = 0.0
+    eccentric_s: float = 0.0
+    bottom_s: float = 0.0
+    concentric_s: float = 0.0
+
+    @classmethod
+    def from_rep(cls, rep: Rep, frame: int, correct: bool, score: float) -> 'RepRecord':
+        return cls(rep.number, frame, round(rep.end_t, 3), correct, score,
+                   round(rep.min_angle, 2), round(rep.max_angle, 2), round(rep.rom, 2),
+                   round(rep.eccentric_s, 3), round(rep.bottom_s, 3), round(rep.concentric_s, 3))
+
+@dataclass
+class VideoResult:
+    path: str
+    exercise: str
+    mode: str
+    fps: float
+    frames: List[FrameRecord] = field(default_factory=list)
+    reps: List[RepRecord] = field(default_factory=list)
+    summary: Dict = field(default_factory=dict)
+    stats: SessionSummary = field(default_factory=SessionSummary, repr=False)  # mergeable form of `summary`
+    n_frames: int = 0
+    elapsed_s: float = 0.0
+
+    @property
+    def processing_fps(self) -> float:
+        return self.n_frames / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+def score_landmarks(path: str, frames: np.ndarray, fps: float, exercise: str,
+                    mode: str = 'beginner', keep_frames: bool = True, min_frames: int = 1,
+                    times: Optional[np.ndarray] = None) -> VideoResult:
+    """
+    Runs the exercise rule and rep segmentation over an (N, 33, 4) landmark
+    array (NaN rows = no detection), e.g. from PoseDetector.detect_video.
+    Angles, scores and rep boundaries for all frames are computed in
+    vectorized passes (segment_reps matches RepCounter exactly).
+    `min_frames` debounces rep transitions (see RepCounter). `times` are
+    per-frame timestamps in seconds (recordings skip dropped frames); video
+    frames default to idx / fps.
+    """
+    rule = make_rule(exercise, mode)
+    compiled = rule.compiled
+    summary = SessionSummary()
+    result = VideoResult(path, exercise, mode, fps, n_frames=len(frames))
+
+    frames = np.asarray(frames, dtype=np.float32)
+    detected = ~np.isnan(frames[:, 0, 0]) if len(frames) else np.zeros(0, dtype=bool)
+    angles = compiled.angles(frames) if len(frames) else np.zeros((0, len(compiled.angle_names)))
+    scores, correct = compiled.score(angles)
+    scores = np.where(detected, scores, 0.0)
+    correct = detected & correct
+    rep_angles = np.where(detected, angles[:, compiled.rep_col], np.nan)
+
+    times = np.arange(len(frames)) / fps if times is None else np.asarray(times, dtype=np.float64)
+    rep_frames, reps = segment_reps(rep_angles, *rule.rep_thresholds, min_frames=min_frames, times=times)
+    for idx, rep in zip(rep_frames.tolist(), reps):
+        score, ok = float(scores[idx]), bool(correct[idx])
+        summary.push_rep(ok, score)
+        result.reps.append(RepRecord.from_rep(rep, idx, ok, score))
+
+    if keep_frames:
+        reps_so_far = np.searchsorted(rep_frames, np.arange(len(frames)), side='right')
+        for idx in range(len(frames)):
+            angle = rep_angles[idx]
+            result.frames.append(FrameRecord(
+                idx, round(float(times[idx]), 3), bool(detected[idx]),
+                None if np.isnan(angle) else round(float(angle), 2),
+                float(scores[idx]), bool(correct[idx]), int(reps_so_far[idx]),
+            ))
+
+    result.stats = summary
+    result.summary = summary.as_dict()
+    return result
+
+class LazyDetector:
+    """
+    PoseDetector stand-in that builds the real one on the first cache miss,
+    so runs served entirely from the cache or recordings never load MediaPipe.
+    """
+    def __init__(self, **detector_kwargs):
+        self.detector_kwargs = detector_kwargs
+        self.settings = PoseDetector.settings_for(**detector_kwargs)
+        self._detector = None
+
+    def detect_video(self, *args, **kwargs):
+        if self._detector is None:
+            self._detector = PoseDetector(**self.detector_kwargs)
+        return self._detector.detect_video(*args, **kwargs)
+
+    def close(self):
+        if self._detector is not None:
+            self._detector.close()
+            self._detector = None
+
+def analyze_video(path: str, exercise: str, mode: str = 'beginner',
+                  detector: Optional[PoseDetector] = None, show: bool = False,
+                  keep_frames: bool = True, cache: Optional[LandmarkCache] = None,
+                  min_frames: int = 1) -> VideoResult:
+    """
+    Scores one video file. Pass a `detector` to reuse one MediaPipe graph
+    across many files; otherwise a fresh one is created and closed here.
+    With a `cache`, previously extracted landmarks are reused and detection
+    is skipped entirely. Session recordings (.fitrec) are replayed directly.
+    """
+    t_start = time.perf_counter()
+    if path.endswith(RECORDING_EXT):
+        # Session recordings already hold landmarks; replay without video decoding
+        replay = SessionReplay(path)
+        result = score_landmarks(path, replay.landmarks, replay.fps, exercise, mode, keep_frames, min_frames,
+                                 times=replay.times)
+        result.elapsed_s = time.perf_counter() - t_start
+        return result
+
+    settings = detector.settings if detector else PoseDetector.settings_for()
+    cached = cache.get(path, settings) if cache and not show else None
+    if cached is not None:
+        frames, fps = cached
+        result = score_landmarks(path, frames, fps, exercise, mode, keep_frames, min_frames)
+        result.elapsed_s = time.perf_counter() - t_start
+        return result
+
+    own_detector = detector is None
+    if own_detector:
+        detector = PoseDetector()
+
+    def preview(idx, data):
+        cv2.imshow("Batch Analysis", data['image'])
+        return not (cv2.waitKey(1) & 0xFF == ord('q'))
+
+    try:
+        frames, fps = detector.detect_video(path, on_frame=preview if show else None)
+    finally:
+        if own_detector:
+            detector.close()
+        if show:
+            cv2.destroyAllWindows()
+
+    if cache is not None and not show:
+        cache.put(path, settings, frames, fps)
+
+    result = score_landmarks(path, frames, fps, exercise, mode, keep_frames, min_frames)
+    result.elapsed_s = time.perf_counter() - t_start
+    return result
+
+def write_results(result: VideoResult, out_dir: str) -> Dict[str, str]:
+    """
+    Writes <name>.frames.csv, <name>.reps.csv and <name>.summary.json.
+    Returns the written paths.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(result.path))[0]
+    paths = {
+        'frames': os.path.join(out_dir, f"{stem}.frames.csv"),
+        'reps': os.path.join(out_dir, f"{stem}.reps.csv"),
+        'summary': os.path.join(out_dir, f"{stem}.summary.json"),
+    }
+
+    def write_csv(path, cls, rows):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(cls.__dataclass_fields__))
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(asdict(row))
+
+    if result.frames:
+        write_csv(paths['frames'], FrameRecord, result.frames)
+    else:
+        del paths['frames']
+    write_csv(paths['reps'], RepRecord, result.reps)
+
+    with open(paths['summary'], 'w') as f:
+        json.dump({
+            'path': result.path,
+            'exercise': result.exercise,
+            'mode': result.mode,
+            'video_fps': result.fps,
+            'frames': result.n_frames,
+            'elapsed_s': round(result.elapsed_s, 3),
+            'processing_fps': round(result.processing_fps, 1),
+            **result.summary,
+        }, f, indent=2)
+    return paths
+
+def write_combined(summary: SessionSummary, out_dir: str):
+    """ Writes the merged summary of all analyzed videos to combined.summary.json. """
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "combined.summary.json"), 'w') as f:
+        json.dump(summary.as_dict(), f, indent=2)
+    print(f"combined: {summary.total_reps} reps, avg {summary.average_score():.1f}, "
+          f"p90 {summary.quantile(0.9):.1f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score recorded workout videos offline.")
+    parser.add_argument('videos', nargs='+', help="Video files (or .fitrec session recordings) to analyze")
+    parser.add_argument('--exercise', choices=sorted(config.EXERCISES), default='squat')
+    parser.add_argument('--mode', choices=['beginner', 'advanced'], default='beginner')
+    parser.add_argument('--out', default='results', help="Output directory")
+    parser.add_argument('--show', action='store_true', help="Show a preview window (slower)")
+    parser.add_argument('--no-frames', action='store_true', help="Only write per-rep results and summary")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Worker processes for detection (one PoseDetector each)")
+    parser.add_argument('--model-complexity', type=int, choices=[0, 1, 2], default=1)
+    parser.add_argument('--cache', metavar='DIR',
+                        help="Landmark cache directory; re-runs skip detection for cached videos")
+    parser.add_argument('--cache-size-mb', type=int, default=2048)
+    parser.add_argument('--min-frames', type=int, default=1,
+                        help="Consecutive frames needed past a rep threshold (debounce)")
+    args = parser.parse_args(argv)
+
+    detector_kwargs = {'model_complexity': args.model_complexity}
+    cache = LandmarkCache(args.cache, args.cache_size_mb << 20) if args.cache else None
+
+    combined = SessionSummary()
+
+    def report(result):
+        write_results(result, args.out)
+        combined.merge(result.stats)
+        print(f"{result.path}: {result.summary['total_reps']} reps, "
+              f"{result.processing_fps:.1f} fps ({result.elapsed_s:.1f}s)")
+
+    if args.workers > 1:
+        # Cached videos are scored straight away, the rest go to the pool
+        pending = []
+        settings = PoseDetector.settings_for(**detector_kwargs)
+        for path in args.videos:
+            if path.endswith(RECORDING_EXT):
+                report(analyze_video(path, args.exercise, args.mode, keep_frames=not args.no_frames,
+                                    min_frames=args.min_frames))
+                continue
+            cached = cache.get(path, settings) if cache is not None and os.path.isfile(path) else None
+            if cached is None:
+                pending.append(path)
+                continue
+            t_start = time.perf_counter()
+            result = score_landmarks(path, cached[0], cached[1], args.exercise, args.mode,
+                                     keep_frames=not args.no_frames, min_frames=args.min_frames)
+            result.elapsed_s = time.perf_counter() - t_start
+            report(result)
+
+        # One PoseDetector per worker process; landmarks come back via shared memory
+        with LandmarkPool(workers=args.workers, **detector_kwargs) as pool:
+            for video in pool.extract(pending):
+                if video.error:
+                    print(f"[skip] {video.error}")
+                    continue
+                if cache is not None:
+                    cache.put(video.path, settings, video.frames, video.fps)
+                t_start = time.perf_counter()
+                result = score_landmarks(video.path, video.frames, video.fps, args.exercise,
+                                         args.mode, keep_frames=not args.no_frames,
+                                         min_frames=args.min_frames)
+                result.elapsed_s = video.elapsed_s + time.perf_counter() - t_start
+                report(result)
+        write_combined(combined, args.out)
+        return
+
+    detector = LazyDetector(**detector_kwargs)
+    try:
+        for path in args.videos:
+            try:
+                result = analyze_video(path, args.exercise, args.mode, detector=detector,
+                                       show=args.show, keep_frames=not args.no_frames,
+                                       cache=cache, min_frames=args.min_frames)
+            except IOError as e:
+                print(f"[skip] {e}")
+                continue
+            report(result)
+    finally:
+        detector.close()
+    write_combined(combined, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+benchmark.py
+
+Reproducible micro-benchmarks for the per-frame hot path. Needs no camera
+or GPU.
+
+Drives each stage (PoseDetector.detect, angle math, RollingStability, every
+exercise rule, RepCounter, smoothing, draw_overlay, draw_skeleton) over
+synthetic frames and a landmark fixture, and reports per-stage latency percentiles, throughput
+and bytes allocated per call as JSON. With --compare it exits non-zero when
+a stage's median latency regressed against a saved baseline.
+
+Usage:
+    python benchmark.py --out bench.json
+    python benchmark.py --fixture recordings/session.fitrec --no-detector
+    python benchmark.py --compare bench.json --tolerance 0.2
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+import config
+from angle_calculation import calculate_angle, RollingStability
+from exercise_rules import make_rule
+from landmarks import unstack
+from renderer import draw_skeleton
+from smoothing import OneEuroFilter
+from synthetic_pose import synthetic_landmarks
+from utils import RepCounter, draw_overlay
+
+# =========================
+# Fixtures
+# =========================
+def load_fixture(path: str) -> np.ndarray:
+    """ (N, 33, 4) landmarks from a session recording (.fitrec) or .npy file. """
+    if path.endswith('.npy'):
+        return np.load(path).astype(np.float32)
+    from session_recorder import SessionReplay
+    return np.array(SessionReplay(path).landmarks, dtype=np.float32)
+
+def synthetic_frames(n: int, width: int, height: int, seed: int = 0) -> List[np.ndarray]:
+    """ A few distinct noise frames, cycled (decoding cost is not measured). """
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(min(n, 8))]
+
+# =========================
+# Measurement
+# =========================
+def measure(fn: Callable[[int], object], n: int, warmup: int = 10, alloc_samples: int = 50) -> Dict:
+    """
+    Times fn(i) for i in range(n) after `warmup` calls, then re-runs a few
+    calls under tracemalloc for bytes allocated per call (peak above start).
+    """
+    for i in range(warmup):
+        fn(i)
+    times = np.empty(n)
+    clock = time.perf_counter
+    for i in range(n):
+        t0 = clock()
+        fn(i)
+        times[i] = clock() - t0
+
+    tracemalloc.start()
+    allocs = []
+    for i in range(min(n, alloc_samples)):
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        fn(i)
+        _, peak = tracemalloc.get_traced_memory()
+        allocs.append(peak - start)
+    tracemalloc.stop()
+
+    ms = times * 1000.0
+    mean = float(ms.mean())
+    return {
+        'n': n,
+        'mean_ms': round(mean, 4),
+        'p50_ms': round(float(np.percentile(ms, 50)), 4),
+        'p90_ms': round(float(np.percentile(ms, 90)), 4),
+        'p99_ms': round(float(np.percentile(ms, 99)), 4),
+        'max_ms': round(float(ms.max()), 4),
+        'fps': round(1000.0 / mean, 1) if mean > 0 else None,
+        'alloc_bytes_per_call': int(np.mean(allocs)) if allocs else 0,
+    }
+
+def run(n: int = 300, width: int = 640, height: int = 480, fixture: Optional[str] = None,
+        detector: bool = True, model_complexity: int = 1, stages: Optional[List[str]] = None) -> Dict:
+    """ Runs every stage (or just `stages`) and returns the JSON report. """
+    lm_array = load_fixture(fixture) if fixture else synthetic_landmarks(n, width, height)
+    lm_frames = [lm for lm in unstack(lm_array) if lm is not None]
+    if not lm_frames:
+        raise ValueError("Fixture has no frames with a detected person")
+    frames = synthetic_frames(n, width, height)
+    canvas = frames[0].copy()
+    k = len(lm_frames)
+
+    def lm(i):
+        return lm_frames[i % k]
+
+    bench = {}
+    # MediaPipe only loads when the detect stage will actually run
+    detector = detector and (not stages or 'detect' in stages)
+    if detector:
+        from pose_detection import PoseDetector
+        det = PoseDetector(model_complexity=model_complexity)
+        bench['detect'] = lambda i: det.detect(frames[i % len(frames)], draw=True)
+
+    pts = [(lm(i).xy('left_hip'), lm(i).xy('left_knee'), lm(i).xy('left_ankle')) for i in range(k)]
+    pts = [tuple(tuple(map(float, p)) for p in tri) for tri in pts]
+    bench['calculate_angle'] = lambda i: calculate_angle(*pts[i % k])
+
+    rolling = RollingStability()
+    angles = [calculate_angle(*p) for p in pts]
+    def stability(i):
+        rolling.push('knee', angles[i % k])
+        return rolling.stability_score('knee')
+    bench['rolling_stability'] = stability
+
+    rules = {ex: make_rule(ex, 'beginner') for ex in config.EXERCISES}
+    for ex, rule in rules.items():
+        bench[f'evaluate_{ex}'] = (lambda r: lambda i: r.evaluate(lm(i)))(rule)
+
+    rule = rules['squat']
+    results = [rule.evaluate(lm(i)) for i in range(k)]
+    rep_angles = [rule.rep_angle(r) for r in results]
+    counter = RepCounter()
+    enter, exit_ = rule.rep_thresholds
+    def rep_counter(i):
+        a = rep_angles[i % k]
+        return a is not None and counter.process(a, enter, exit_, i / 30.0)
+    bench['rep_counter'] = rep_counter
+
+    smoother = OneEuroFilter()
+    ticks = itertools.count()  # measure() restarts i, the filter needs rising times
+    bench['one_euro_filter'] = lambda i: smoother(lm(i), next(ticks) / 30.0)
+
+    # Rep count moves like the synthetic figure's (one rep per ~3 s), not every frame
+    bench['draw_overlay'] = lambda i: draw_overlay(canvas, results[i % k], i // 90, 'beginner', 'squat')
+    bench['draw_skeleton'] = lambda i: draw_skeleton(canvas, lm(i))
+
+    if stages:
+        bench = {name: fn for name, fn in bench.items() if name in stages}
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'frames': n,
+            'width': width,
+            'height': height,
+            'fixture': fixture or 'synthetic',
+            'landmark_frames': k,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'stages': {},
+    }
+    try:
+        for name, fn in bench.items():
+            report['stages'][name] = measure(fn, n)
+    finally:
+        if detector:
+            det.close()
+
+    # Whole per-frame path: detection (if measured) + rule + reps + overlay
+    path = [s for s in ('detect', 'evaluate_squat', 'rep_counter', 'draw_overlay') if s in report['stages']]
+    total = sum(report['stages'][s]['mean_ms'] for s in path)
+    report['frame'] = {
+        'stages': path,
+        'mean_ms': round(total, 4),
+        'fps': round(1000.0 / total, 1) if total > 0 else None,
+    }
+    return report
+
+def compare(report: Dict, baseline: Dict, tolerance: float = 0.2) -> List[str]:
+    """ Stages whose p50 latency is more than `tolerance` above the baseline. """
+    regressions = []
+    for name, stats in report['stages'].items():
+        base = baseline.get('stages', {}).get(name)
+        if not base or not base['p50_ms']:
+            continue
+        ratio = stats['p50_ms'] / base['p50_ms']
+        if ratio > 1.0 + tolerance:
+            regressions.append(f"{name}: p50 {base['p50_ms']:.4f} -> {stats['p50_ms']:.4f} ms (x{ratio:.2f})")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the per-frame hot path.")
+    parser.add_argument('--frames', type=int, default=300, help="Timed calls per stage")
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--fixture', help="Landmark fixture: session recording (.fitrec) or (N, 33, 4) .npy")
+    parser.add_argument('--no-detector', action='store_true', help="Skip the MediaPipe stage")
+    parser.add_argument('--model-complexity', type=int, choices=[0, 1, 2], default=1)
+    parser.add_argument('--stage', action='append', help="Only run this stage (repeatable)")
+    parser.add_argument('--out', help="Write the JSON report here (default: stdout)")
+    parser.add_argument('--compare', metavar='BASELINE', help="Baseline JSON; exit 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed p50 slowdown vs baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    report = run(args.frames, args.width, args.height, args.fixture,
+                 detector=not args.no_detector, model_complexity=args.model_complexity,
+                 stages=args.stage)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"[regression] {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 """
 config.py
 
-Configuration dictionaries for thresholds and modes.
+Configuration dictionaries for thresholds, modes and exercise definitions.
 """
 
 THRESHOLDS = {
@@ -24,7 +24,8 @@ THRESHOLDS = {
     },
     'bicep_curl': {
         # Angle 180 = Extended. Angle 40 = Curled.
-        'curl_flexion_thresh': 60,    # Angle must be < this to count rep
+        'curl_flexion_thresh': 60,    # Angle must be < this for full form score
+        'curl_rep_thresh': 95,        # Angle must be < this to count rep (relaxed for usability)
         'curl_extension_thresh': 150, # Angle must be > this to reset rep
         'elbow_safe_min': 20,
         'pass_score': 60,
@@ -42,4 +43,79 @@ MODES = {
         'pushup': {'elbow_target': 0},
         'bicep_curl': {}
     }
-}
\ No newline at end of file
+}
+
+# Declarative exercise definitions, compiled once per rule by exercise_rules.
+#
+# angles:    name -> (a, b, c) joint triple (angle at b), joint names from
+#            landmarks.JOINT_INDEX; or {'any': [triples...], 'reduce': 'min'|'max'}
+#            to take e.g. the more flexed of two arms.
+# checks:    evaluated in order for each angle that is visible:
+#            score_if  - conditions that earn a point (check counts toward the score)
+#            fail_msg  - message when score_if fails
+#            messages / warnings - [{'if': [conditions], 'text': ...}]
+#            A condition is (op, value) or (op, value, offset) where value is a
+#            THRESHOLDS key or a number, e.g. ('<=', 'knee_angle_deep', 10).
+# required:  angle that must be visible, otherwise only missing_msg is returned
+# pass:      (op, value) on the final 0-100 score for 'correct'
+# rep:       angle and (enter, exit) thresholds for rep counting
+# stability: angles pushed to RollingStability each frame
+EXERCISES = {
+    'squat': {
+        'angles': {
+            'knee': ('mid_hip', 'mid_knee', 'mid_ankle'),
+            'back': ('mid_shoulder', 'mid_hip', 'mid_knee'),
+        },
+        'checks': [
+            {'angle': 'knee',
+             'score_if': [('<=', 'knee_angle_deep', 10)],      # Close to target or deeper
+             'messages': [{'if': [('>', 'knee_angle_deep', 30), ('<', 160)], 'text': 'Go Lower'}],
+             'warnings': [{'if': [('<', 'knee_safe_min')], 'text': 'Knee stress!'}]},
+            {'angle': 'back',
+             'score_if': [('>=', 'back_min')],
+             'fail_msg': 'Keep Back Straight'},
+        ],
+        'pass': ('>', 60),
+        'rep': {'angle': 'knee', 'enter': 'knee_angle_deep', 'exit': 'knee_angle_high'},
+        'stability': ['knee'],
+    },
+    'pushup': {
+        'angles': {
+            'elbow': ('mid_shoulder', 'mid_elbow', 'mid_wrist'),
+            'body': ('mid_shoulder', 'mid_hip', 'mid_ankle'),
+        },
+        'checks': [
+            {'angle': 'elbow',
+             'score_if': [('<=', 'elbow_target')],
+             'messages': [{'if': [('>', 'elbow_target'), ('<', 150)], 'text': 'Go Lower'}]},
+            {'angle': 'body',
+             'score_if': [('>=', 'body_min')],
+             'fail_msg': 'Fix Hip Sag'},
+        ],
+        'pass': ('>', 60),
+        'rep': {'angle': 'elbow', 'enter': 'elbow_target', 'exit': 'elbow_reset'},
+        'stability': ['elbow'],
+    },
+    'bicep_curl': {
+        'angles': {
+            # Use the arm that is more flexed (active)
+            'elbow': {'any': [('left_shoulder', 'left_elbow', 'left_wrist'),
+                              ('right_shoulder', 'right_elbow', 'right_wrist')],
+                      'reduce': 'min'},
+        },
+        'required': 'elbow',
+        'missing_msg': 'Arms not visible',
+        'checks': [
+            {'angle': 'elbow',
+             'score_if': [('<=', 'curl_flexion_thresh')],      # Curl depth
+             'fail_msg': 'Curl higher'},
+            {'angle': 'elbow',
+             'score_if': [('>=', 'curl_extension_thresh')],    # Extension (no half reps)
+             'fail_msg': 'Fully extend arm',
+             'warnings': [{'if': [('<', 'elbow_safe_min')], 'text': 'Elbow stress!'}]},
+        ],
+        'pass': ('>=', 'pass_score'),
+        'rep': {'angle': 'elbow', 'enter': 'curl_rep_thresh', 'exit': 'curl_extension_thresh'},
+        'stability': ['elbow'],
+    },
+}
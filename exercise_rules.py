@@ -2,11 +2,23 @@
 exercise_rules.py
 
 Rule-based posture checks for different exercises.
+
+Exercises are declared as data in config.EXERCISES (joint triples,
+threshold checks, scoring, rep angle). Each rule compiles its spec once into
+a CompiledExercise that computes every angle in one batched call and scores
+one frame or a whole (N, 33, 4) stack with array operations. The same angles
+are reused for rep counting, so nothing is computed twice per frame.
 """
 
-from typing import Dict, List, Tuple
-from dataclasses import dataclass
-from angle_calculation import calculate_angle, RollingStability
+import operator
+from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from angle_calculation import calculate_angles, joint_triples, RollingStability
+from landmarks import Landmarks
+import config
 
 @dataclass
 class PoseCheckResult:
@@ -15,159 +27,225 @@ class PoseCheckResult:
     messages: list
     warnings: list
     stability: Dict[str, float]
-
-class ExerciseRule:
-    def __init__(self, thresholds: Dict, rolling: RollingStability):
+    angles: Dict[str, Optional[float]] = field(default_factory=dict)
+
+_OPS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+_REDUCE = {
+    'min': np.fmin.reduce,   # fmin/fmax ignore NaN unless all are NaN
+    'max': np.fmax.reduce,
+}
+
+class CompiledExercise:
+    """
+    An exercise spec (see config.EXERCISES) with thresholds resolved and all
+    joint triples packed into one index table.
+    """
+    def __init__(self, spec: Dict, thresholds: Dict):
+        self.spec = spec
         self.thresholds = thresholds
-        self.rolling = rolling
-
-    def evaluate(self, landmarks) -> PoseCheckResult:
-        raise NotImplementedError()
-
-class SquatRule(ExerciseRule):
-    def evaluate(self, landmarks) -> PoseCheckResult:
-        msgs = []
-        warns = []
-        if landmarks is None:
-            return PoseCheckResult(False, 0.0, ["No person detected"], [], {})
-
-        L = landmarks
-        # Indices: 23/24(hips), 25/26(knees), 27/28(ankles), 11/12(shoulders)
-        # Using simple average for left/right side
-        hip = ((L[23][0]+L[24][0])/2, (L[23][1]+L[24][1])/2)
-        knee = ((L[25][0]+L[26][0])/2, (L[25][1]+L[26][1])/2)
-        ankle = ((L[27][0]+L[28][0])/2, (L[27][1]+L[28][1])/2)
-        shoulder = ((L[11][0]+L[12][0])/2, (L[11][1]+L[12][1])/2)
-
-        knee_angle = calculate_angle(hip, knee, ankle)
-        back_angle = calculate_angle(shoulder, hip, knee)
-
-        self.rolling.push('knee', knee_angle)
-        
-        score = 0.0
-        checks = 0
-
-        # --- Squat Logic ---
-        if knee_angle is not None:
-            checks += 1
-            # If angle is between SAFE_MIN and DEEP_THRESHOLD, it's a good squat hold
-            target = self.thresholds.get('knee_angle_deep', 80)
-            
-            # Feedback: If user is trying to squat but angle is still 150, say "Go Lower"
-            # If user is at 60, they are deep enough (Good)
-            if knee_angle > target + 30: 
-                # Only warn "Go Lower" if they are clearly attempting it (e.g. < 160)
-                if knee_angle < 160: 
-                    msgs.append('Go Lower')
-            
-            if knee_angle <= target + 10: # Close to target or deeper
-                score += 1.0
-
-            if knee_angle < self.thresholds.get('knee_safe_min', 40):
-                warns.append('Knee stress!')
-
-        if back_angle is not None:
-            checks += 1
-            if back_angle >= self.thresholds.get('back_min', 140):
-                score += 1.0
+        self.angle_names = list(spec['angles'])
+        self.col = {name: i for i, name in enumerate(self.angle_names)}
+
+        # Flatten every angle source into one triple table; multi-source angles
+        # ('any') remember their column range and reduction
+        triples = []
+        self._groups = []
+        for name in self.angle_names:
+            defn = spec['angles'][name]
+            if isinstance(defn, dict):
+                start = len(triples)
+                triples.extend(defn['any'])
+                self._groups.append((start, len(triples), _REDUCE[defn.get('reduce', 'min')]))
             else:
-                msgs.append('Keep Back Straight')
+                self._groups.append((len(triples), len(triples) + 1, None))
+                triples.append(defn)
+        self.triples = joint_triples(triples)
+        self._direct = all(g[2] is None for g in self._groups)
+
+        # Checks -> (angle column, score conditions, fail message, messages, warnings)
+        self._checks = []
+        for chk in spec.get('checks', []):
+            self._checks.append((
+                self.col[chk['angle']],
+                [self._cond(c) for c in chk['score_if']] if 'score_if' in chk else None,
+                chk.get('fail_msg'),
+                [([self._cond(c) for c in m['if']], m['text']) for m in chk.get('messages', [])],
+                [([self._cond(c) for c in w['if']], w['text']) for w in chk.get('warnings', [])],
+            ))
+
+        self.required = self.col[spec['required']] if spec.get('required') else None
+        self.missing_msg = spec.get('missing_msg')
+        op, value = spec.get('pass', ('>', 60))
+        self._pass = (_OPS[op], self._value(value))
+
+        rep = spec['rep']
+        self.rep_col = self.col[rep['angle']]
+        self.rep_enter = self._value(rep['enter'])
+        self.rep_exit = self._value(rep['exit'])
+        self.stability = [(name, self.col[name]) for name in spec.get('stability', [])]
+
+    def _value(self, ref) -> float:
+        return float(self.thresholds[ref]) if isinstance(ref, str) else float(ref)
+
+    def _cond(self, cond) -> Tuple:
+        op, ref = cond[0], cond[1]
+        offset = cond[2] if len(cond) > 2 else 0
+        return _OPS[op], self._value(ref) + offset
+
+    # --- Angles ---
+    def angles(self, points) -> np.ndarray:
+        """
+        (..., n_angles) array of this exercise's angles (NaN = not visible)
+        for a Landmarks object, one (33, 4) frame or an (N, 33, 4) stack.
+        """
+        raw = calculate_angles(points, self.triples)
+        if self._direct:
+            return raw
+        out = np.empty(raw.shape[:-1] + (len(self._groups),), dtype=raw.dtype)
+        for i, (a, b, reduce) in enumerate(self._groups):
+            out[..., i] = raw[..., a] if reduce is None else reduce(raw[..., a:b], axis=-1)
+        return out
+
+    # --- Scoring ---
+    @staticmethod
+    def _all(conds, x):
+        ok = True
+        for op, v in conds:
+            ok = ok & op(x, v)
+        return ok
+
+    def score(self, A: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized 0-100 score and pass flag for an (..., n_angles) array.
+        Frames missing the required angle score 0.
+        """
+        A = np.asarray(A)
+        points = np.zeros(A.shape[:-1])
+        checks = np.zeros(A.shape[:-1])
+        for col, score_if, *_ in self._checks:
+            if score_if is None:
+                continue
+            x = A[..., col]
+            visible = ~np.isnan(x)
+            checks += visible
+            with np.errstate(invalid='ignore'):
+                points += visible & self._all(score_if, x)
+        final = points / np.maximum(1, checks) * 100.0
+        if self.required is not None:
+            final = np.where(np.isnan(A[..., self.required]), 0.0, final)
+        op, v = self._pass
+        return final, op(final, v)
+
+    def result(self, A: np.ndarray) -> PoseCheckResult:
+        """ Full result (score, messages, warnings) for one frame's angles. """
+        angles = {name: (None if np.isnan(A[i]) else float(A[i])) for i, name in enumerate(self.angle_names)}
+        if self.required is not None and np.isnan(A[self.required]):
+            return PoseCheckResult(False, 0.0, [self.missing_msg] if self.missing_msg else [], [], {}, angles)
 
-        final_score = (score / max(1, checks)) * 100.0
-        return PoseCheckResult(final_score > 60, final_score, msgs, warns, {})
-
-
-class PushupRule(ExerciseRule):
-    def evaluate(self, landmarks) -> PoseCheckResult:
         msgs = []
         warns = []
-        if landmarks is None:
-            return PoseCheckResult(False, 0.0, ["No person detected"], [], {})
-
-        L = landmarks
-        shoulder = ((L[11][0]+L[12][0])/2, (L[11][1]+L[12][1])/2)
-        elbow = ((L[13][0]+L[14][0])/2, (L[13][1]+L[14][1])/2)
-        wrist = ((L[15][0]+L[16][0])/2, (L[15][1]+L[16][1])/2)
-        hip = ((L[23][0]+L[24][0])/2, (L[23][1]+L[24][1])/2)
-        ankle = ((L[27][0]+L[28][0])/2, (L[27][1]+L[28][1])/2)
-
-        elbow_angle = calculate_angle(shoulder, elbow, wrist)
-        body_angle = calculate_angle(shoulder, hip, ankle)
-
-        score = 0.0
+        points = 0.0
         checks = 0
+        for col, score_if, fail_msg, messages, warnings in self._checks:
+            x = A[col]
+            if np.isnan(x):
+                continue
+            for conds, text in messages:
+                if self._all(conds, x):
+                    msgs.append(text)
+            if score_if is not None:
+                checks += 1
+                if self._all(score_if, x):
+                    points += 1.0
+                elif fail_msg:
+                    msgs.append(fail_msg)
+            for conds, text in warnings:
+                if self._all(conds, x):
+                    warns.append(text)
+
+        final_score = (points / max(1, checks)) * 100.0
+        op, v = self._pass
+        return PoseCheckResult(bool(op(final_score, v)), final_score, msgs, warns, {}, angles)
 
-        if elbow_angle is not None:
-            checks += 1
-            target = self.thresholds.get('elbow_target', 100)
-            
-            # If angle is large (> 150), arms are straight
-            # If angle is small (< target), reps are good
-            if elbow_angle <= target:
-                score += 1.0
-            elif elbow_angle < 150: # Mid-rep but not deep enough
-                msgs.append('Go Lower')
-
-        if body_angle is not None:
-            checks += 1
-            if body_angle >= self.thresholds.get('body_min', 160):
-                score += 1.0
-            else:
-                msgs.append('Fix Hip Sag')
-
-        final_score = (score / max(1, checks)) * 100.0
-        return PoseCheckResult(final_score > 60, final_score, msgs, warns, {})
+class ExerciseRule:
+    """
+    Posture rule driven by a declarative spec. `spec` defaults to
+    config.EXERCISES[name] for the named subclasses below.
+    """
+    name: Optional[str] = None
 
-class BicepCurlRule(ExerciseRule):
-    def evaluate(self, landmarks) -> PoseCheckResult:
-        msgs = []
-        warns = []
+    def __init__(self, thresholds: Dict, rolling: RollingStability, spec: Optional[Dict] = None):
+        self.thresholds = thresholds
+        self.rolling = rolling
+        self.spec = spec if spec is not None else config.EXERCISES[self.name]
+        self.compiled = CompiledExercise(self.spec, thresholds)
 
+    def evaluate(self, landmarks: Optional[Landmarks]) -> PoseCheckResult:
         if landmarks is None:
             return PoseCheckResult(False, 0.0, ["No person detected"], [], {})
 
-        L = landmarks
-
-        def arm_angle(s, e, w):
-            ang = calculate_angle(L[s][:2], L[e][:2], L[w][:2])
-            return ang
-
-        # Left & Right elbow angles
-        left = arm_angle(11, 13, 15)
-        right = arm_angle(12, 14, 16)
+        return self._with_stability(self.compiled.result(self.compiled.angles(landmarks)), self.rolling)
+
+    def evaluate_batch(self, poses: np.ndarray, rollings: List[RollingStability]) -> List[PoseCheckResult]:
+        """
+        Evaluates several people at once: (P, 33, 4) poses, one
+        RollingStability per person. All angles come from one batched call.
+        """
+        if not len(poses):
+            return []
+        A = self.compiled.angles(poses)
+        return [self._with_stability(self.compiled.result(a), rolling) for a, rolling in zip(A, rollings)]
+
+    def _with_stability(self, result: PoseCheckResult, rolling: RollingStability) -> PoseCheckResult:
+        for name, col in self.compiled.stability:
+            rolling.push(name, result.angles[name])
+            result.stability[name] = rolling.stability_score(name)
+        return result
+
+    def rep_angle(self, result: PoseCheckResult) -> Optional[float]:
+        """ The rep-counting angle, taken from an evaluate() result. """
+        return result.angles.get(self.compiled.angle_names[self.compiled.rep_col])
+
+    @property
+    def rep_thresholds(self) -> Tuple[float, float]:
+        """ (thresh_enter_peak, thresh_exit_peak) for RepCounter.process. """
+        return self.compiled.rep_enter, self.compiled.rep_exit
 
-        angles = [a for a in [left, right] if a is not None]
-        if not angles:
-            return PoseCheckResult(False, 0.0, ["Arms not visible"], [], {})
-
-        active_angle = min(angles)
-
-        checks = 0
-        score = 0.0
-
-        # 1️⃣ Curl depth check
-        checks += 1
-        flex_thresh = self.thresholds.get('curl_flexion_thresh', 60)
-
-        if active_angle <= flex_thresh:
-            score += 1.0
-        else:
-            msgs.append("Curl higher")
-
-        # 2️⃣ Extension check (no half reps)
-        checks += 1
-        ext_thresh = self.thresholds.get('curl_extension_thresh', 150)
-
-        if active_angle >= ext_thresh:
-            score += 1.0
-        else:
-            msgs.append("Fully extend arm")
-
-        # 3️⃣ Safety
-        if active_angle < self.thresholds.get('elbow_safe_min', 20):
-            warns.append("Elbow stress!")
+class SquatRule(ExerciseRule):
+    name = 'squat'
 
-        final_score = (score / checks) * 100.0
-        correct = final_score >= self.thresholds.get('pass_score', 60)
+class PushupRule(ExerciseRule):
+    name = 'pushup'
 
-        return PoseCheckResult(correct, final_score, msgs, warns, {})
\ No newline at end of file
+class BicepCurlRule(ExerciseRule):
+    name = 'bicep_curl'
+
+RULES = {
+    'squat': SquatRule,
+    'pushup': PushupRule,
+    'bicep_curl': BicepCurlRule,
+}
+
+def build_thresholds(exercise: str, mode: str) -> Dict:
+    """
+    config.THRESHOLDS for an exercise with the difficulty mode offsets applied.
+    """
+    t = config.THRESHOLDS.get(exercise, {}).copy()
+    for k, v in config.MODES.get(mode, {}).get(exercise, {}).items():
+        if k in t: t[k] += v
+    return t
+
+def make_rule(exercise: str, mode: str) -> ExerciseRule:
+    """
+    Rule for any exercise in config.EXERCISES; new exercises need no code.
+    """
+    thresholds = build_thresholds(exercise, mode)
+    cls = RULES.get(exercise)
+    if cls is not None:
+        return cls(thresholds, RollingStability())
+    return ExerciseRule(thresholds, RollingStability(), spec=config.EXERCISES[exercise])
@@ -0,0 +1,565 @@
+"""
+inference_service.py
+
+Shared local pose inference with micro-batching.
+
+Thin clients (dashboards, kiosks, the stream server) send frames over a unix
+socket instead of each loading and warming up its own MediaPipe graph. The
+service keeps a fixed set of warm detectors. It queues incoming frames per
+client and dispatches them in micro-batches: a batch goes out when it is
+full (`max_batch`) or when its oldest frame has waited `max_wait_ms`.
+Batches take frames round-robin, one per client per round, so one busy
+client can't starve the others. Frames still queued after `deadline_ms` are
+answered EXPIRED without inference, because a live video client has moved on
+by then.
+
+Backpressure: each client may have at most `max_inflight` frames queued or
+running. Beyond that the service stops reading its socket until answers go
+out, so a fast sender blocks on send() instead of growing server memory.
+
+Frames from different clients share detectors, so the detectors run
+MediaPipe in static-image mode: every frame is detected from scratch and no
+tracking state carries over from one client's stream to another's. Clients
+that need tracking continuity should use worker_pool.FramePool.
+
+Wire format (little-endian):
+    request   seq u32, height u16, width u16, channels u8, then h*w*c uint8 BGR
+              (height == width == 0 asks for the stats as JSON)
+    response  seq u32, status u8, then 33*4 float32 if DETECTED,
+              or a u32 length and JSON if STATS / UTF-8 message if ERROR
+
+Usage:
+    python inference_service.py --detectors 2 --socket /tmp/fitness_inference.sock
+    python inference_service.py --selftest 4      # stub detector, 4 local clients
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from landmarks import Landmarks, NUM_LANDMARKS
+from profiler import StageHistogram
+from synthetic_pose import synthetic_landmarks
+
+DEFAULT_SOCKET = '/tmp/fitness_inference.sock'
+
+REQUEST = struct.Struct('<IHHB')
+RESPONSE = struct.Struct('<IB')
+LENGTH = struct.Struct('<I')
+NOT_DETECTED, DETECTED, EXPIRED, STATS, ERROR = range(5)
+LANDMARK_BYTES = NUM_LANDMARKS * 4 * 4
+
+log = logging.getLogger(__name__)
+
+def _error_message(seq: int, message: str) -> bytes:
+    body = message.encode()
+    return RESPONSE.pack(seq, ERROR) + LENGTH.pack(len(body)) + body
+
+# =========================
+# Detectors
+# =========================
+class PoseBackend:
+    """
+    One warm PoseDetector behind the batch interface. MediaPipe Pose has no
+    batched graph, so a batch runs frame by frame on this detector. Batching
+    still saves a thread hop and a scheduling round per frame. The detector
+    runs in static-image mode because consecutive frames can belong to
+    different clients.
+    """
+    def __init__(self, **detector_kwargs):
+        from pose_detection import PoseDetector
+        self.detector = PoseDetector(static_image_mode=True, **detector_kwargs)
+        self.detector.warmup()
+
+    def detect_batch(self, frames: List[np.ndarray]) -> List[Optional[np.ndarray]]:
+        out = []
+        for frame in frames:
+            lm = self.detector.detect(frame, draw=False)['landmarks']
+            out.append(None if lm is None else lm.data)
+        return out
+
+    def close(self):
+        self.detector.close()
+
+class StubDetector:
+    """
+    Stand-in detector for localhost tests: sleeps `batch_s` per batch plus
+    `frame_s` per frame and returns the benchmark figure scaled to the frame.
+    Every `miss_every`-th frame finds nobody.
+    """
+    def __init__(self, frame_s: float = 0.005, batch_s: float = 0.002, miss_every: int = 0):
+        self.frame_s = frame_s
+        self.batch_s = batch_s
+        self.miss_every = miss_every
+        self.calls = 0
+        self._poses: Dict[Tuple[int, int], np.ndarray] = {}
+
+    def detect_batch(self, frames: List[np.ndarray]) -> List[Optional[np.ndarray]]:
+        time.sleep(self.batch_s + self.frame_s * len(frames))
+        out = []
+        for frame in frames:
+            self.calls += 1
+            if self.miss_every and self.calls % self.miss_every == 0:
+                out.append(None)
+                continue
+            h, w = frame.shape[:2]
+            pose = self._poses.get((w, h))
+            if pose is None:
+                pose = self._poses[(w, h)] = synthetic_landmarks(1, w, h)[0]
+            out.append(pose)
+        return out
+
+    def close(self):
+        pass
+
+# =========================
+# Service
+# =========================
+@dataclass
+class _Request:
+    client: '_Client'
+    seq: int
+    frame: np.ndarray
+    t: float  # arrival, perf_counter seconds
+
+class _Client:
+    def __init__(self, cid: int, writer: asyncio.StreamWriter, max_inflight: int):
+        self.id = cid
+        self.writer = writer
+        self.pending: Deque[_Request] = deque()
+        self.inflight = asyncio.Semaphore(max_inflight)
+        self.closed = False
+        self.requests = 0
+        self.completed = 0
+        self.expired = 0
+        self.failed = 0
+        self.latency = StageHistogram(f'client{cid}')
+
+    def stats(self) -> Dict:
+        return {'requests': self.requests, 'completed': self.completed, 'expired': self.expired,
+                'failed': self.failed, 'pending': len(self.pending), 'latency_ms': self.latency.summary()}
+
+class InferenceService:
+    """
+    Serves pose inference for many local clients from a fixed set of warm
+    detectors (anything with detect_batch(frames) and close()).
+
+        service = InferenceService([PoseBackend() for _ in range(2)])
+        asyncio.run(service.run())
+    """
+    def __init__(self, backends: List, max_batch: int = 8, max_wait_ms: float = 5.0,
+                 deadline_ms: Optional[float] = 200.0, max_inflight: int = 4,
+                 socket_path: str = DEFAULT_SOCKET):
+        self.backends = backends
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self.deadline = deadline_ms / 1000.0 if deadline_ms else None
+        self.max_inflight = max(1, max_inflight)
+        self.socket_path = socket_path
+
+        self._clients: Dict[int, _Client] = {}
+        self._next_id = 0
+        self._rr = 0
+        self._idle: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks = set()
+        self._pool = ThreadPoolExecutor(max_workers=len(backends), thread_name_prefix='inference')
+
+        # Stats (service totals include clients that have disconnected)
+        self.started = time.perf_counter()
+        self.clients_served = 0
+        self.requests = 0
+        self.dropped = 0  # still queued when their client disconnected
+        self.completed = 0
+        self.expired = 0
+        self.failed = 0
+        self.batches = 0
+        self.batched_frames = 0
+        self.queue_wait = StageHistogram('queue')
+        self.inference = StageHistogram('inference')
+        self.latency = StageHistogram('latency')
+
+    # --- Queueing ---
+    def pending(self) -> int:
+        return sum(len(c.pending) for c in self._clients.values())
+
+    def _oldest(self) -> float:
+        return min(c.pending[0].t for c in self._clients.values() if c.pending)
+
+    def _next_batch(self) -> List[_Request]:
+        """ Up to max_batch frames, one per client per round, starting client rotating. """
+        clients = [c for c in self._clients.values() if c.pending]
+        if not clients:
+            return []
+        start = self._rr % len(clients)
+        self._rr += 1
+        order = clients[start:] + clients[:start]
+        batch = []
+        while len(batch) < self.max_batch:
+            took = False
+            for c in order:
+                if c.pending and len(batch) < self.max_batch:
+                    batch.append(c.pending.popleft())
+                    took = True
+            if not took:
+                break
+        return batch
+
+    async def _dispatch_loop(self):
+        while True:
+            backend = await self._idle.get()
+            while not self.pending():
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            # Micro-batch window: until the batch is full or the oldest frame has waited max_wait
+            while 0 < self.pending() < self.max_batch:
+                remaining = self._oldest() + self.max_wait - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            now = time.perf_counter()
+            batch = []
+            for req in self._next_batch():
+                if self.deadline is not None and now - req.t > self.deadline:
+                    self._reply(req, EXPIRED)
+                else:
+                    batch.append(req)
+            if not batch:
+                self._idle.put_nowait(backend)
+                continue
+            task = asyncio.create_task(self._run_batch(backend, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, backend, batch: List[_Request]):
+        t0 = time.perf_counter()
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._pool, backend.detect_batch, [req.frame for req in batch])
+        except Exception as e:
+            log.exception("inference failed on a batch of %d frames", len(batch))
+            for req in batch:
+                self._reply(req, ERROR, error=f"inference failed: {type(e).__name__}: {e}")
+            return
+        finally:
+            self._idle.put_nowait(backend)
+        t1 = time.perf_counter()
+        self.inference.add(t1 - t0)
+        self.batches += 1
+        self.batched_frames += len(batch)
+        for req, data in zip(batch, results):
+            self.queue_wait.add(t0 - req.t)
+            self.latency.add(t1 - req.t)
+            req.client.latency.add(t1 - req.t)
+            self._reply(req, NOT_DETECTED if data is None else DETECTED, data)
+
+    def _reply(self, req: _Request, status: int, data: Optional[np.ndarray] = None,
+               error: Optional[str] = None):
+        client = req.client
+        client.inflight.release()
+        if status == EXPIRED:
+            client.expired += 1
+            self.expired += 1
+        elif status == ERROR:
+            client.failed += 1
+            self.failed += 1
+        else:
+            client.completed += 1
+            self.completed += 1
+        if client.closed:
+            return
+        if status == ERROR:
+            client.writer.write(_error_message(req.seq, error or "inference failed"))
+            return
+        msg = RESPONSE.pack(req.seq, status)
+        if data is not None:
+            msg += np.ascontiguousarray(data, dtype=np.float32).tobytes()
+        client.writer.write(msg)
+
+    # --- Connections ---
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = _Client(self._next_id, writer, self.max_inflight)
+        self._next_id += 1
+        self._clients[client.id] = client
+        try:
+            while True:
+                # Backpressure: stop reading while the client has max_inflight frames
+                # outstanding or hasn't read its answers
+                await client.inflight.acquire()
+                await writer.drain()
+                seq, h, w, channels = REQUEST.unpack(await reader.readexactly(REQUEST.size))
+                if h == 0 and w == 0:
+                    client.inflight.release()
+                    body = json.dumps(self.stats()).encode()
+                    writer.write(RESPONSE.pack(seq, STATS) + LENGTH.pack(len(body)) + body)
+                    continue
+                if channels != 3:
+                    log.warning("client %d sent %d-channel frames; closing", client.id, channels)
+                    writer.write(_error_message(seq, f"expected 3-channel BGR frames, got {channels} channels"))
+                    await writer.drain()
+                    break
+                buf = await reader.readexactly(h * w * channels)
+                client.requests += 1
+                client.pending.append(_Request(client, seq, np.frombuffer(buf, np.uint8).reshape(h, w, 3),
+                                               time.perf_counter()))
+                self._wakeup.set()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            client.closed = True
+            self._retire(client)
+            writer.close()
+
+    def _retire(self, client: _Client):
+        """ Folds a disconnected client's counters into the service totals. """
+        self.clients_served += 1
+        self.requests += client.requests
+        self.dropped += len(client.pending)
+        client.pending.clear()
+        del self._clients[client.id]
+
+    # --- Stats ---
+    def stats(self) -> Dict:
+        uptime = time.perf_counter() - self.started
+        return {
+            'uptime_s': round(uptime, 1),
+            'detectors': len(self.backends),
+            'clients': len(self._clients),
+            'clients_served': self.clients_served + len(self._clients),
+            'pending': self.pending(),
+            'requests': self.requests + sum(c.requests for c in self._clients.values()),
+            'completed': self.completed,
+            'expired': self.expired,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'throughput_fps': round(self.completed / uptime, 1) if uptime else 0.0,
+            'mean_batch': round(self.batched_frames / self.batches, 2) if self.batches else 0.0,
+            'queue_ms': self.queue_wait.summary(),
+            'inference_ms': self.inference.summary(),
+            'latency_ms': self.latency.summary(),
+            'per_client': {c.id: c.stats() for c in self._clients.values()},
+        }
+
+    # --- Lifecycle ---
+    async def run(self, ready: Optional[threading.Event] = None, stats_interval: Optional[float] = None):
+        """ Serves until cancelled. `ready` is set once the socket accepts connections. """
+        self._idle = asyncio.Queue()
+        for backend in self.backends:
+            self._idle.put_nowait(backend)
+        self._wakeup = asyncio.Event()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # stale socket from an earlier run
+        server = await asyncio.start_unix_server(self._handle, self.socket_path)
+        dispatcher = asyncio.create_task(self._dispatch_loop())
+        reporter = asyncio.create_task(self._report(stats_interval)) if stats_interval else None
+        self.started = time.perf_counter()
+        if ready is not None:
+            ready.set()
+        try:
+            await server.serve_forever()
+        finally:
+            dispatcher.cancel()
+            if reporter is not None:
+                reporter.cancel()
+            server.close()
+            self._pool.shutdown(wait=True)
+            for backend in self.backends:
+                backend.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    async def _report(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            s = self.stats()
+            log.info(f"{s['throughput_fps']} fps | batch {s['mean_batch']} | clients {s['clients']} | "
+                  f"latency p50 {s['latency_ms'].get('p50_ms', 0)} ms | expired {s['expired']}")
+
+# =========================
+# Client
+# =========================
+class InferenceClient:
+    """
+    Blocking client for thin front ends:
+
+        with InferenceClient() as client:
+            landmarks = client.detect(frame)   # Landmarks or None
+
+    submit()/receive() pipeline several frames (up to the service's
+    max_inflight); answers to one client may come back out of order.
+    Send frames at inference size: every pixel crosses the socket.
+    """
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, timeout: Optional[float] = None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(socket_path)
+        self._seq = 0
+        self.error: Optional[str] = None  # message of the last ERROR answer
+
+    def _recv_exact(self, n: int) -> bytes:
+        buf = bytearray(n)
+        view = memoryview(buf)
+        got = 0
+        while got < n:
+            k = self.sock.recv_into(view[got:])
+            if not k:
+                raise ConnectionError("inference service closed the connection")
+            got += k
+        return bytes(buf)
+
+    def submit(self, frame: np.ndarray) -> int:
+        """ Sends a BGR frame; returns its sequence number. """
+        h, w, channels = frame.shape
+        self._seq = (self._seq + 1) & 0xFFFFFFFF
+        self.sock.sendall(REQUEST.pack(self._seq, h, w, channels))
+        self.sock.sendall(np.ascontiguousarray(frame, dtype=np.uint8).data)
+        return self._seq
+
+    def receive(self) -> Tuple[int, int, Optional[Landmarks]]:
+        """ Next answer as (seq, status, landmarks); ERROR answers set `error`. """
+        seq, status = RESPONSE.unpack(self._recv_exact(RESPONSE.size))
+        if status == ERROR:
+            (n,) = LENGTH.unpack(self._recv_exact(LENGTH.size))
+            self.error = self._recv_exact(n).decode()
+        if status != DETECTED:
+            return seq, status, None
+        data = np.frombuffer(self._recv_exact(LANDMARK_BYTES), dtype=np.float32).reshape(NUM_LANDMARKS, 4)
+        return seq, status, Landmarks(data.copy())
+
+    def detect(self, frame: np.ndarray) -> Optional[Landmarks]:
+        seq = self.submit(frame)
+        while True:
+            got, status, landmarks = self.receive()
+            if got == seq:
+                if status == ERROR:
+                    raise RuntimeError(f"inference service: {self.error}")
+                return landmarks
+
+    def stats(self) -> Dict:
+        """ Service stats (call with no frames in flight). """
+        self._seq = (self._seq + 1) & 0xFFFFFFFF
+        self.sock.sendall(REQUEST.pack(self._seq, 0, 0, 0))
+        _, status = RESPONSE.unpack(self._recv_exact(RESPONSE.size))
+        (n,) = LENGTH.unpack(self._recv_exact(LENGTH.size))
+        return json.loads(self._recv_exact(n))
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# =========================
+# Self-test
+# =========================
+def selftest(clients: int = 4, frames: int = 200, depth: int = 2, **service_kwargs) -> Dict:
+    """
+    Runs a stub-detector service on a background event loop plus `clients`
+    client threads that each keep `depth` frames in flight, and returns the
+    service stats.
+    """
+    service = InferenceService([StubDetector(miss_every=10) for _ in range(2)], **service_kwargs)
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    runner = loop.create_task(service.run(ready))
+
+    def serve():
+        try:
+            loop.run_until_complete(runner)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            loop.close()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    ready.wait(5.0)
+
+    counts = [{} for _ in range(clients)]
+
+    def client_main(i: int):
+        frame = np.zeros((240, 320, 3), dtype=np.uint8)
+        with InferenceClient(service.socket_path) as client:
+            for _ in range(depth):
+                client.submit(frame)
+            for n in range(frames):
+                _, status, _ = client.receive()
+                counts[i][status] = counts[i].get(status, 0) + 1
+                if n + depth < frames:
+                    client.submit(frame)
+
+    threads = [threading.Thread(target=client_main, args=(i,)) for i in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    with InferenceClient(service.socket_path) as client:
+        stats = client.stats()
+    loop.call_soon_threadsafe(runner.cancel)
+    thread.join(5.0)
+    stats['wall_s'] = round(elapsed, 2)
+    stats['answers'] = counts
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared micro-batching pose inference for local clients.")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix socket to serve on")
+    parser.add_argument('--detectors', type=int, default=2, help="Warm PoseDetector instances")
+    parser.add_argument('--model-complexity', type=int, choices=[0, 1, 2], default=1)
+    parser.add_argument('--inference-width', type=int, default=None)
+    parser.add_argument('--max-batch', type=int, default=8)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0, help="Longest a frame waits for its batch to fill")
+    parser.add_argument('--deadline-ms', type=float, default=200.0,
+                        help="Frames queued longer than this are answered EXPIRED (0 = never)")
+    parser.add_argument('--max-inflight', type=int, default=4, help="Per-client queued/running frames")
+    parser.add_argument('--stats-interval', type=float, default=10.0, help="Print stats every N seconds (0 = off)")
+    parser.add_argument('--stub', action='store_true', help="Use the stub detector (no MediaPipe)")
+    parser.add_argument('--selftest', type=int, metavar='CLIENTS', default=None,
+                        help="Run a stub service with CLIENTS local clients, print stats and exit")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    service_kwargs = dict(max_batch=args.max_batch, max_wait_ms=args.max_wait_ms,
+                          deadline_ms=args.deadline_ms or None, max_inflight=args.max_inflight,
+                          socket_path=args.socket)
+    if args.selftest is not None:
+        print(json.dumps(selftest(args.selftest, **service_kwargs), indent=2))
+        return
+
+    if args.stub:
+        backends = [StubDetector() for _ in range(args.detectors)]
+    else:
+        backends = [PoseBackend(model_complexity=args.model_complexity, inference_width=args.inference_width)
+                    for _ in range(args.detectors)]
+    service = InferenceService(backends, **service_kwargs)
+    print(f"Serving {len(backends)} detector(s) on {args.socket}")
+    try:
+        asyncio.run(service.run(stats_interval=args.stats_interval or None))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
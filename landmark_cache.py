@@ -0,0 +1,158 @@
+"""
+landmark_cache.py
+
+On-disk cache of per-video landmark arrays.
+
+Re-scoring a recorded session after a change to config.THRESHOLDS or
+config.MODES does not change the landmarks, so the expensive detection pass
+can be skipped. Entries are keyed by a hash of the video content plus the
+PoseDetector settings, stored as .npy files and opened memory-mapped, and the
+cache evicts least recently used entries beyond `max_bytes`.
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+_HASH_CHUNK = 1 << 20
+_HASH_MEMO = 'hashes.json'
+
+class LandmarkCache:
+    def __init__(self, root: str, max_bytes: int = 2 << 30):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        # (path, size, mtime) -> content hash, so unchanged files aren't re-read
+        self._memo_path = os.path.join(root, _HASH_MEMO)
+        try:
+            with open(self._memo_path) as f:
+                self._memo: Dict[str, str] = json.load(f)
+        except (OSError, ValueError):
+            self._memo = {}
+
+    # --- Keys ---
+    def video_hash(self, path: str) -> str:
+        st = os.stat(path)
+        memo_key = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+        digest = self._memo.get(memo_key)
+        if digest is None:
+            h = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+                    h.update(chunk)
+            digest = h.hexdigest()
+            self._memo[memo_key] = digest
+            self._save_memo()
+        return digest
+
+    def key(self, path: str, settings: Dict) -> str:
+        """
+        Cache key for a video and PoseDetector.settings
+        (model_complexity and confidence thresholds).
+        """
+        h = hashlib.sha256(self.video_hash(path).encode())
+        h.update(json.dumps(settings, sort_keys=True).encode())
+        return h.hexdigest()[:32]
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.root, key)
+        return base + '.npy', base + '.json'
+
+    # --- Access ---
+    def get(self, path: str, settings: Dict) -> Optional[Tuple[np.ndarray, float]]:
+        """
+        Returns (landmarks, fps) with landmarks as a read-only memory-mapped
+        (N, 33, 4) float32 array, or None on a miss.
+        """
+        npy, meta = self._paths(self.key(path, settings))
+        try:
+            with open(meta) as f:
+                info = json.load(f)
+            frames = np.load(npy, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        os.utime(npy)  # LRU: mtime is last access
+        return frames, info['fps']
+
+    def put(self, path: str, settings: Dict, frames: np.ndarray, fps: float):
+        key = self.key(path, settings)
+        npy, meta = self._paths(key)
+        # Write then rename so a crash never leaves a truncated entry
+        tmp = npy + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, np.ascontiguousarray(frames, dtype=np.float32))
+        os.replace(tmp, npy)
+        with open(meta, 'w') as f:
+            json.dump({'source': os.path.abspath(path), 'fps': fps,
+                       'frames': len(frames), 'settings': settings}, f)
+        self.evict(keep=key)
+
+    def evict(self, keep: Optional[str] = None) -> List[str]:
+        """
+        Removes least recently used entries until the cache fits in max_bytes
+        (never the `keep` entry), then drops hash memo entries no remaining
+        entry needs. Returns the evicted keys.
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.root):
+            if not name.endswith('.npy'):
+                continue
+            p = os.path.join(self.root, name)
+            st = os.stat(p)
+            entries.append((st.st_mtime, st.st_size, name[:-4]))
+            total += st.st_size
+
+        evicted = []
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for p in self._paths(key):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+            total -= size
+            evicted.append(key)
+        self._prune_memo({key for _, _, key in entries} - set(evicted))
+        return evicted
+
+    def _prune_memo(self, keys):
+        """
+        Keeps memo entries only for videos a live cache entry came from and
+        whose size/mtime still match the file (anything else would be rehashed).
+        """
+        sources = set()
+        for key in keys:
+            try:
+                with open(self._paths(key)[1]) as f:
+                    sources.add(json.load(f)['source'])
+            except (OSError, ValueError, KeyError):
+                pass
+        memo = {}
+        for memo_key, digest in self._memo.items():
+            path, size, mtime = memo_key.rsplit('|', 2)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if path in sources and f"{st.st_size}|{st.st_mtime_ns}" == f"{size}|{mtime}":
+                memo[memo_key] = digest
+        if len(memo) != len(self._memo):
+            self._memo = memo
+            self._save_memo()
+
+    def size_bytes(self) -> int:
+        return sum(os.path.getsize(os.path.join(self.root, n))
+                   for n in os.listdir(self.root) if n.endswith('.npy'))
+
+    def _save_memo(self):
+        tmp = self._memo_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._memo, f)
+        os.replace(tmp, self._memo_path)
@@ -0,0 +1,155 @@
+"""
+landmarks.py
+
+Compact NumPy container for the 33 MediaPipe pose landmarks.
+"""
+
+import numpy as np
+from typing import Iterable, Iterator, Optional
+
+# MediaPipe Pose landmark order
+LANDMARK_NAMES = (
+    'nose',
+    'left_eye_inner', 'left_eye', 'left_eye_outer',
+    'right_eye_inner', 'right_eye', 'right_eye_outer',
+    'left_ear', 'right_ear',
+    'mouth_left', 'mouth_right',
+    'left_shoulder', 'right_shoulder',
+    'left_elbow', 'right_elbow',
+    'left_wrist', 'right_wrist',
+    'left_pinky', 'right_pinky',
+    'left_index', 'right_index',
+    'left_thumb', 'right_thumb',
+    'left_hip', 'right_hip',
+    'left_knee', 'right_knee',
+    'left_ankle', 'right_ankle',
+    'left_heel', 'right_heel',
+    'left_foot_index', 'right_foot_index',
+)
+NUM_LANDMARKS = len(LANDMARK_NAMES)
+
+# Left/right pairs that get a precomputed midpoint ('mid_hip' etc.)
+MIDPOINT_PAIRS = {
+    'shoulder': (11, 12),
+    'elbow': (13, 14),
+    'wrist': (15, 16),
+    'hip': (23, 24),
+    'knee': (25, 26),
+    'ankle': (27, 28),
+}
+
+# Row index of every named point in the extended (33 + midpoints, 4) array
+JOINT_INDEX = {name: i for i, name in enumerate(LANDMARK_NAMES)}
+for _k, _name in enumerate(MIDPOINT_PAIRS):
+    JOINT_INDEX['mid_' + _name] = NUM_LANDMARKS + _k
+NUM_EXTENDED = len(JOINT_INDEX)
+
+_LEFT = np.array([p[0] for p in MIDPOINT_PAIRS.values()], dtype=np.intp)
+_RIGHT = np.array([p[1] for p in MIDPOINT_PAIRS.values()], dtype=np.intp)
+
+# Columns
+X, Y, Z, VIS = 0, 1, 2, 3
+
+
+def extend(data: np.ndarray) -> np.ndarray:
+    """
+    Appends left/right midpoints to a (..., 33, 4) landmark array,
+    returning (..., NUM_EXTENDED, 4). Midpoint visibility is the lower of the pair.
+    """
+    data = np.asarray(data, dtype=np.float32)
+    left = data[..., _LEFT, :]
+    right = data[..., _RIGHT, :]
+    mids = (left + right) * 0.5
+    mids[..., VIS] = np.minimum(left[..., VIS], right[..., VIS])
+    return np.concatenate([data, mids], axis=-2)
+
+
+class Landmarks:
+    """
+    One frame of pose landmarks as a (33, 4) float32 array of
+    (x_px, y_px, z, visibility). z is scaled by image width (MediaPipe's
+    convention) so it shares units with x.
+
+    Indexing a row (`L[23]`) returns a view, so `L[23][:2]` still reads like
+    the old list-of-tuples format.
+    """
+    __slots__ = ('data', 'extended')
+
+    def __init__(self, data: np.ndarray):
+        self.data = np.asarray(data, dtype=np.float32).reshape(NUM_LANDMARKS, 4)
+        self.extended = extend(self.data)
+
+    @classmethod
+    def from_mediapipe(cls, pose_landmarks, width: int, height: int,
+                       x0: float = 0.0, y0: float = 0.0) -> 'Landmarks':
+        """
+        Converts MediaPipe's normalized landmarks of a width x height image
+        into pixels; (x0, y0) is that image's offset when it was a crop.
+        Accepts a Pose solution proto or a PoseLandmarker list of landmarks.
+        """
+        raw = np.array(
+            [(lm.x, lm.y, lm.z, lm.visibility or 0.0)
+             for lm in getattr(pose_landmarks, 'landmark', pose_landmarks)],
+            dtype=np.float32,
+        )
+        raw *= np.array([width, height, width, 1.0], dtype=np.float32)
+        if x0 or y0:
+            raw[:, X] += x0
+            raw[:, Y] += y0
+        return cls(raw)
+
+    def __getitem__(self, idx):
+        return self.data[idx]
+
+    def __len__(self):
+        return NUM_LANDMARKS
+
+    def __bool__(self):
+        return True
+
+    def __repr__(self):
+        return f"Landmarks({self.data!r})"
+
+    def point(self, name: str) -> np.ndarray:
+        """ (x, y, z, visibility) row for a joint or midpoint name. """
+        return self.extended[JOINT_INDEX[name]]
+
+    def xy(self, name: str) -> np.ndarray:
+        return self.extended[JOINT_INDEX[name], :2]
+
+    def mid(self, name: str) -> np.ndarray:
+        """ 2D midpoint of a left/right pair, e.g. mid('hip'). """
+        return self.extended[JOINT_INDEX['mid_' + name], :2]
+
+    @property
+    def visibility(self) -> np.ndarray:
+        return self.data[:, VIS]
+
+
+def _make_accessor(idx):
+    return property(lambda self: self.extended[idx])
+
+for _name, _idx in JOINT_INDEX.items():
+    setattr(Landmarks, _name, _make_accessor(_idx))
+
+
+def stack(frames: Iterable[Optional[Landmarks]]) -> np.ndarray:
+    """
+    Stacks per-frame landmarks into an (N, 33, 4) float32 array.
+    Frames with no detection (None) become rows of NaN.
+    """
+    frames = list(frames)
+    out = np.full((len(frames), NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+    for i, lm in enumerate(frames):
+        if lm is not None:
+            out[i] = lm.data if isinstance(lm, Landmarks) else lm
+    return out
+
+
+def unstack(frames: np.ndarray) -> Iterator[Optional[Landmarks]]:
+    """
+    Inverse of stack(): yields a Landmarks per row of an (N, 33, 4) array,
+    or None for rows that are NaN (no detection).
+    """
+    for row in frames:
+        yield None if np.isnan(row[0, X]) else Landmarks(row)
@@ -1,13 +1,27 @@
 import time
+_T0 = time.perf_counter()  # startup clock starts before any other import
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from profiler import PROFILER, StartupTimer
+STARTUP = StartupTimer(_T0)
+
 import cv2
 import numpy as np
 
-from pose_detection import PoseDetector
-from angle_calculation import calculate_angle, RollingStability
-from exercise_rules import SquatRule, PushupRule, BicepCurlRule
+from pose_detection import PoseDetector, MultiPoseDetector, InferenceScheduler, ComplexityController
+from exercise_rules import make_rule
 from session_summary import SessionSummary
+from utils import RepCounter
+from pipeline import FramePipeline
+from tracking import PoseTracker
+from smoothing import OneEuroFilter
+from renderer import OverlayRenderer
 import config
 
+STARTUP.mark('imports')
+
 # =========================
 # UI & STATE
 # =========================
@@ -20,93 +34,64 @@ BUTTON_DEFS = [
 ]
 
 class AppState:
-    def __init__(self):
+    def __init__(self, detector=None):
         self.exercise = 'squat'
         self.mode = 'beginner'
         self.running = True
         self.rules = {}
         self.counters = {}
         self.summaries = {}
-        self.detector = PoseDetector()
+        self.recorder = None
+        self.detector = detector or PoseDetector()
+        
+        # Multi-person mode: per-person state lives in the tracker
+        self.tracker = None
+        if isinstance(self.detector, MultiPoseDetector):
+            self.tracker = PoseTracker(self.exercise, self.mode)
         
         # Initialize
         self.refresh_rules()
 
     def refresh_rules(self):
         # Factory to create rules based on current mode
-        base_thresholds = config.THRESHOLDS
-        mode_mods = config.MODES.get(self.mode, {})
-        
-        def apply_mod(base, mods):
-            t = base.copy()
-            for k, v in mods.items():
-                if k in t: t[k] += v 
-            return t
-
-        self.rules = {
-            'squat': SquatRule(apply_mod(base_thresholds['squat'], mode_mods.get('squat', {})), RollingStability()),
-            'pushup': PushupRule(apply_mod(base_thresholds['pushup'], mode_mods.get('pushup', {})), RollingStability()),
-            'bicep_curl': BicepCurlRule(apply_mod(base_thresholds['bicep_curl'], mode_mods.get('bicep_curl', {})), RollingStability()),
-        }
+        self.rules = {ex: make_rule(ex, self.mode) for ex in config.EXERCISES}
+        if self.tracker is not None:
+            self.tracker.set_exercise(self.exercise, self.mode)
         
         # Reset counters/summaries if needed, or keep them persistent
         if not self.counters:
             self.counters = {k: RepCounter() for k in self.rules}
             self.summaries = {k: SessionSummary() for k in self.rules}
 
-class RepCounter:
-    """
-    Generic State Machine for Rep counting.
-    State 0: Rest (Extended/Standing)
-    State 1: Peak (Flexed/Deep)
-    """
-    def __init__(self):
-        self.in_peak = False
-    
-    def process(self, val_now, thresh_enter_peak, thresh_exit_peak):
-        """
-        Returns True if a full rep (Rest -> Peak -> Rest) just completed.
-        """
-        completed_rep = False
-        
-        # Transition to Peak (Down/Flexed)
-        if not self.in_peak and val_now < thresh_enter_peak:
-            self.in_peak = True
-            
-        # Transition to Rest (Up/Extended)
-        elif self.in_peak and val_now > thresh_exit_peak:
-            self.in_peak = False
-            completed_rep = True
-            
-        return completed_rep
+    def total_reps(self) -> int:
+        if self.tracker is not None:
+            return sum(t.summaries[self.exercise].total_reps for t in self.tracker.tracks)
+        return self.summaries[self.exercise].total_reps
 
-def draw_ui(frame, app_state: AppState, result):
-    # Overlay Box
-    cv2.rectangle(frame, (0, 0), (frame.shape[1], 80), (30, 30, 30), -1)
-    
-    # Stats
+# Static HUD parts (banner, buttons, labels) are cached layers
+overlay = OverlayRenderer()
+
+def draw_ui(frame, app_state: AppState, result, stats_text: str = None):
     ex = app_state.exercise
-    reps = app_state.summaries[ex].total_reps
-    score = int(result.score) if result else 0
-    
-    cv2.putText(frame, f"{ex.upper()} ({app_state.mode})", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-    cv2.putText(frame, f"Reps: {reps}", (10, 65), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 0), 2)
-    cv2.putText(frame, f"Form: {score}%", (200, 65), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
-
-    # Feedback Messages
-    if result:
-        y = 30
-        for msg in result.messages:
-            cv2.putText(frame, msg, (400, y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 165, 255), 2)
-            y += 30
-        for warn in result.warnings:
-            cv2.putText(frame, warn, (400, y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+    reps = app_state.total_reps()
+    lines = []
+
+    # Last rep: range of motion and tempo (down / up)
+    last = app_state.counters[ex].last_rep if app_state.tracker is None else None
+    if last is not None:
+        lines.append((f"Last rep: ROM {last.rom:.0f} deg, {last.eccentric_s:.1f}s down / {last.concentric_s:.1f}s up",
+                      (10, 120), 0.45, (200, 200, 200)))
+
+    # Pipeline stats (per-stage FPS / queue depth)
+    if stats_text:
+        lines.append((stats_text, (10, 100), 0.45, (200, 200, 200)))
 
     # Buttons
     h, w, _ = frame.shape
     btn_w, btn_h = 110, 40
     start_x = 10
     start_y = h - 50
+    buttons = []
     
     for i, btn in enumerate(BUTTON_DEFS):
         x1 = start_x + (i * (btn_w + 5))
@@ -121,14 +106,19 @@ def draw_ui(frame, app_state: AppState, result):
         if btn['action'] == 'toggle_mode': color = (100, 0, 100)
         if btn['action'] == 'quit': color = (0, 0, 200)
         
-        cv2.rectangle(frame, (x1, y1), (x2, y2), color, -1)
-        
         # Dynamic label for Mode button
         label = btn['label']
         if btn['action'] == 'toggle_mode':
             label = f"Mode: {app_state.mode[:3].upper()}"
             
-        cv2.putText(frame, label, (x1+5, y1+25), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+        buttons.append((label, btn['coords'], color))
+
+    # Banner, feedback, text lines and buttons in one pass over cached layers
+    overlay.draw(frame, result, reps, app_state.mode, ex, lines, buttons)
+
+    # Debug overlay: per-stage latency percentiles (--profile)
+    if PROFILER.enabled:
+        PROFILER.draw(frame)
 
 def on_mouse(event, x, y, flags, param):
     if event == cv2.EVENT_LBUTTONDOWN:
@@ -144,68 +134,192 @@ def on_mouse(event, x, y, flags, param):
                     app_state.refresh_rules()
                 else:
                     app_state.exercise = act
+                    if app_state.tracker is not None:
+                        app_state.tracker.set_exercise(act, app_state.mode)
 
-def main():
-    app = AppState()
-    cap = cv2.VideoCapture(0)
+def process_frame(app: AppState, frame):
+    """
+    Inference stage: detection, form check and rep counting for one frame.
+    Runs on the pipeline's inference thread so no rep is missed when the
+    render loop drops frames.
+    """
+    # Detection
+    # Frames come fresh from cap.read(), so annotate in place (no copy)
+    with PROFILER.span('detect'):
+        data = app.detector.detect(frame, inplace=True)
+    landmarks = data['landmarks']
     
-    cv2.namedWindow("Fitness Tracker")
-    cv2.setMouseCallback("Fitness Tracker", on_mouse, app)
+    ex = app.exercise
+    rule = app.rules[ex]
     
-    while app.running:
-        ret, frame = cap.read()
-        if not ret: break
-        
-        # Detection
-        data = app.detector.detect(frame)
-        frame = data['image']
-        landmarks = data['landmarks']
-        
-        ex = app.exercise
-        rule = app.rules[ex]
-        
-        # Evaluate Logic
+    # Evaluate Logic
+    with PROFILER.span('rules'):
         result = rule.evaluate(landmarks)
-        
-        # Rep Counting Logic
+    
+    # Rep Counting Logic
+    rep = 0
+    scheduler = app.detector.scheduler
+    with PROFILER.span('reps'):
         if landmarks:
-            # Calculate the primary angle for the current exercise
-            angle = None
-            if ex == 'squat': # Hip-Knee-Ankle
-                angle = calculate_angle(landmarks[23][:2], landmarks[25][:2], landmarks[27][:2])
-                thresh_enter = rule.thresholds['knee_angle_deep']
-                thresh_exit = rule.thresholds['knee_angle_high']
-                
-            elif ex == 'pushup': # Shoulder-Elbow-Wrist
-                angle = calculate_angle(landmarks[11][:2], landmarks[13][:2], landmarks[15][:2])
-                thresh_enter = rule.thresholds['elbow_target']
-                thresh_exit = rule.thresholds['elbow_reset']
-                
-            elif ex == 'bicep_curl': # Shoulder-Elbow-Wrist (taking min of left/right)
-                la = calculate_angle(landmarks[11][:2], landmarks[13][:2], landmarks[15][:2])
-                ra = calculate_angle(landmarks[12][:2], landmarks[14][:2], landmarks[16][:2])
-                # Use the arm that is more flexed (active)
-                if la and ra: angle = min(la, ra)
-                elif la: angle = la
-                elif ra: angle = ra
-                
-                thresh_enter = rule.thresholds['curl_flexion_thresh']
-                thresh_exit = rule.thresholds['curl_extension_thresh']
+            # Rep angle comes from the angles the rule already computed
+            angle = rule.rep_angle(result)
+            thresh_enter, thresh_exit = rule.rep_thresholds
+            if scheduler is not None:
+                scheduler.update(angle, thresh_enter, thresh_exit, data['inferred'])
 
             # Update Counter
             if angle is not None:
-                if app.counters[ex].process(angle, thresh_enter, thresh_exit):
+                if app.counters[ex].process(angle, thresh_enter, thresh_exit, time.perf_counter()):
                     app.summaries[ex].push_rep(result.correct, result.score)
+                    rep = app.summaries[ex].total_reps
+        elif scheduler is not None:
+            scheduler.update(None, 0, 0, data['inferred'])
 
-        draw_ui(frame, app, result)
-        cv2.imshow("Fitness Tracker", frame)
-        
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+    if app.recorder is not None:
+        with PROFILER.span('record'):
+            app.recorder.record(landmarks, result.score, result.correct, rep)
+
+    return data['image'], result
+
+def process_multi_frame(app: AppState, frame):
+    """
+    Multi-person inference stage: detects everyone, updates the tracker
+    (batched rule evaluation) and labels each person with ID, reps and score.
+    """
+    with PROFILER.span('detect'):
+        data = app.detector.detect(frame, inplace=True)
+    image = data['image']
+    with PROFILER.span('tracking'):
+        tracks = app.tracker.update(data['poses'])
+    for track in tracks:
+        x0, y0 = int(track.box[0]), int(track.box[1])
+        reps = track.summaries[app.exercise].total_reps
+        score = int(track.result.score)
+        color = (0, 255, 0) if track.result.correct else (0, 165, 255)
+        cv2.putText(image, f"#{track.id} Reps: {reps} Form: {score}%", (x0, max(15, y0 - 10)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+    return image, None
+
+def build_detector(args):
+    """
+    Creates and warms up the detector (mediapipe import, graph set-up and
+    first inferences). Runs on a worker thread while the camera opens.
+    """
+    if args.multi:
+        detector = MultiPoseDetector(args.multi, num_poses=args.num_poses,
+                                     inference_width=args.inference_width)
+    else:
+        auto = args.model_complexity == 'auto'
+        detector = PoseDetector(model_complexity=1 if auto else int(args.model_complexity),
+                                inference_width=args.inference_width, roi=args.roi,
+                                smoother=OneEuroFilter() if args.smooth else None,
+                                auto_complexity=ComplexityController(args.target_fps) if auto else None)
+    STARTUP.mark('detector')
+    detector.warmup()
+    STARTUP.mark('warmup')
+    return detector
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI Fitness Tracker (OpenCV window)")
+    parser.add_argument('--record', metavar='PATH',
+                        help="Record landmarks, angles and scores to a session file for replay")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="Lower the pose inference rate while idle/resting")
+    parser.add_argument('--cpu-budget', type=float, default=None,
+                        help="With --adaptive: max fraction of time spent in pose inference (0-1)")
+    parser.add_argument('--roi', action='store_true',
+                        help="Run pose inference only on a padded box around the last pose")
+    parser.add_argument('--inference-width', type=int, default=None,
+                        help="Downscale frames to this width for pose inference (display keeps full size)")
+    parser.add_argument('--model-complexity', choices=['0', '1', '2', 'auto'], default='1',
+                        help="Pose model size; 'auto' picks model and inference width to hold --target-fps")
+    parser.add_argument('--target-fps', type=float, default=30.0,
+                        help="With --model-complexity auto: frame rate to hold")
+    parser.add_argument('--smooth', action='store_true',
+                        help="Smooth landmarks over time (One Euro filter) for steadier rep counts")
+    parser.add_argument('--multi', metavar='MODEL',
+                        help="Multi-person mode using a pose_landmarker .task model file")
+    parser.add_argument('--num-poses', type=int, default=6,
+                        help="With --multi: max people tracked per frame")
+    parser.add_argument('--profile', action='store_true',
+                        help="Time each per-frame stage and show latency percentiles on screen")
+    parser.add_argument('--metrics-file', metavar='PATH',
+                        help="Rewrite stage metrics here every few seconds (.prom = Prometheus text, else JSON); implies --profile")
+    parser.add_argument('--metrics-port', type=int, default=None, metavar='PORT',
+                        help="Serve Prometheus metrics at http://127.0.0.1:PORT/metrics; implies --profile")
+    parser.add_argument('--startup-report', action='store_true',
+                        help="Print how long imports, model load, warm-up, camera and first frame took")
+    args = parser.parse_args(argv)
+    if args.multi and (args.record or args.adaptive or args.roi or args.smooth or args.model_complexity != '1'):
+        parser.error("--multi cannot be combined with --record, --adaptive, --roi, --smooth or --model-complexity")
+
+    # Model load + warm-up overlaps with opening the camera (which stays on
+    # the main thread: some capture backends insist on it)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        detector = pool.submit(build_detector, args)
+        cap = cv2.VideoCapture(0)
+        STARTUP.mark('camera')
+        app = AppState(detector.result())
+    if args.adaptive:
+        app.detector.scheduler = InferenceScheduler(cpu_budget=args.cpu_budget)
+    PROFILER.enabled = bool(args.profile or args.metrics_file or args.metrics_port)
+    if args.metrics_file:
+        PROFILER.export_to_file(args.metrics_file)
+    if args.metrics_port:
+        PROFILER.serve(args.metrics_port)
+    if args.record:
+        from session_recorder import SessionRecorder
+        app.recorder = SessionRecorder(args.record, exercise=app.exercise, mode=app.mode,
+                                       fps=cap.get(cv2.CAP_PROP_FPS) or 30.0)
+    
+    cv2.namedWindow("Fitness Tracker")
+    cv2.setMouseCallback("Fitness Tracker", on_mouse, app)
+    
+    process = process_multi_frame if app.tracker is not None else process_frame
+    pipeline = FramePipeline(cap, lambda frame: process(app, frame), profiler=PROFILER)
+    pipeline.start()
+    first_frame = True
+    
+    try:
+        while app.running:
+            item = pipeline.read()
+            if item is None:
+                if pipeline.running:
+                    cv2.waitKey(1)
+                    continue
+                break
+            
+            frame, result = item
+            stats_text = pipeline.stats_text()
+            if app.detector.scheduler is not None:
+                sched = app.detector.scheduler.stats()
+                stats_text += f" | infer x{sched['inference_rate']:.2f}"
+            if app.detector.auto_complexity is not None:
+                stats_text += f" | {app.detector.auto_complexity.label()}"
+            with PROFILER.span('draw_ui'):
+                draw_ui(frame, app, result, stats_text)
+            with PROFILER.span('display'):
+                cv2.imshow("Fitness Tracker", frame)
+                key = cv2.waitKey(1) & 0xFF
+            if first_frame:
+                first_frame = False
+                STARTUP.mark('first_frame')
+                if args.startup_report:
+                    print(STARTUP.summary())
             
-    cap.release()
-    app.detector.close()
-    cv2.destroyAllWindows()
+            if key == ord('q'):
+                break
+        # A failure in capture or processing ends the loop; don't exit silently
+        if pipeline.error is not None:
+            raise pipeline.error
+    finally:
+        pipeline.stop()
+        cap.release()
+        app.detector.close()
+        if app.recorder is not None:
+            app.recorder.close()
+        PROFILER.close()
+        cv2.destroyAllWindows()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
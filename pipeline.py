@@ -0,0 +1,227 @@
+"""
+pipeline.py
+
+Threaded capture -> inference -> render pipeline.
+
+Capture and pose inference each run on their own thread and hand frames
+forward through small bounded queues that drop the oldest item when full,
+so a slow stage never makes the camera buffer back up. The render stage is
+the caller's own loop (OpenCV windows and Streamlit both need to draw from
+the thread that owns them), which simply pulls the newest processed frame.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+
+class DropOldestQueue:
+    """
+    Bounded FIFO that discards the oldest item instead of blocking the producer.
+    """
+    def __init__(self, maxsize: int = 2):
+        self.maxsize = max(1, maxsize)
+        self._items = deque()
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item) -> bool:
+        """
+        Adds an item. Returns True if an older item had to be dropped.
+        """
+        with self._cond:
+            dropped = False
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+                dropped = True
+            self._items.append(item)
+            self._cond.notify()
+            return dropped
+
+    def get(self, timeout: Optional[float] = None):
+        """
+        Returns the oldest item, or None if nothing arrived within `timeout`.
+        """
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def clear(self):
+        with self._cond:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class StageStats:
+    """
+    Frame rate and latency of one pipeline stage (smoothed).
+    """
+    def __init__(self, name: str, smoothing: float = 0.9):
+        self.name = name
+        self.smoothing = smoothing
+        self.frames = 0
+        self.fps = 0.0
+        self.latency_ms = 0.0
+        self._last_tick = None
+
+    def tick(self, latency_s: float = 0.0):
+        now = time.perf_counter()
+        if self._last_tick is not None:
+            dt = now - self._last_tick
+            if dt > 0:
+                inst = 1.0 / dt
+                self.fps = inst if self.frames < 2 else self.smoothing * self.fps + (1 - self.smoothing) * inst
+        self.latency_ms = self.smoothing * self.latency_ms + (1 - self.smoothing) * latency_s * 1000.0
+        self._last_tick = now
+        self.frames += 1
+
+    def as_dict(self) -> Dict:
+        return {
+            'fps': round(self.fps, 1),
+            'latency_ms': round(self.latency_ms, 2),
+            'frames': self.frames,
+        }
+
+
+class FramePipeline:
+    """
+    Runs capture and processing on background threads.
+
+    `capture` is anything with an OpenCV-style `read() -> (ok, frame)`.
+    `process` is called on the inference thread with each captured frame and
+    its return value is handed to the render stage via `read()`. Do all the
+    per-frame bookkeeping that must not miss frames (rep counting etc.) inside
+    `process`; the render stage is allowed to skip frames when it falls behind.
+    An optional `profiler` (profiler.Profiler) gets a 'capture' span per read.
+    """
+    def __init__(self, capture, process: Callable[[Any], Any], queue_size: int = 2, profiler=None):
+        self.capture = capture
+        self.process = process
+        self.profiler = profiler
+        self.frame_queue = DropOldestQueue(queue_size)
+        self.result_queue = DropOldestQueue(queue_size)
+        self.stages = {
+            'capture': StageStats('capture'),
+            'inference': StageStats('inference'),
+            'render': StageStats('render'),
+        }
+        self.error: Optional[BaseException] = None
+        self._stop = threading.Event()
+        self._capture_done = threading.Event()
+        self._inference_done = threading.Event()
+        self._threads = []
+        self._last_read = None
+
+    # --- Lifecycle ---
+    def start(self):
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name='pipeline-capture', daemon=True),
+            threading.Thread(target=self._inference_loop, name='pipeline-inference', daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self, timeout: float = 2.0):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    @property
+    def running(self) -> bool:
+        return not self._stop.is_set() and not self._inference_done.is_set()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- Stages ---
+    def _capture_loop(self):
+        stats = self.stages['capture']
+        try:
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                ret, frame = self.capture.read()
+                if not ret:
+                    break
+                latency = time.perf_counter() - t0
+                stats.tick(latency)
+                if self.profiler is not None:
+                    self.profiler.record('capture', latency)
+                self.frame_queue.put(frame)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self._capture_done.set()
+
+    def _inference_loop(self):
+        stats = self.stages['inference']
+        try:
+            while not self._stop.is_set():
+                frame = self.frame_queue.get(timeout=0.05)
+                if frame is None:
+                    if self._capture_done.is_set() and not len(self.frame_queue):
+                        break
+                    continue
+                t0 = time.perf_counter()
+                out = self.process(frame)
+                stats.tick(time.perf_counter() - t0)
+                self.result_queue.put(out)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self._inference_done.set()
+
+    def read(self, timeout: float = 1.0):
+        """
+        Render stage: returns the next processed item, or None if the pipeline
+        has finished (camera closed, error) or nothing arrived within `timeout`.
+        """
+        deadline = time.perf_counter() + timeout
+        while True:
+            item = self.result_queue.get(timeout=0.05)
+            if item is not None:
+                now = time.perf_counter()
+                render = self.stages['render']
+                render.tick(now - self._last_read if self._last_read else 0.0)
+                self._last_read = now
+                return item
+            if self.error is not None or (self._inference_done.is_set() and not len(self.result_queue)):
+                return None
+            if time.perf_counter() >= deadline:
+                return None
+
+    def __iter__(self):
+        while True:
+            item = self.read()
+            if item is None:
+                if self.running and self.error is None:
+                    continue
+                return
+            yield item
+
+    # --- Reporting ---
+    def stats(self) -> Dict:
+        out = {name: s.as_dict() for name, s in self.stages.items()}
+        out['capture']['queue'] = len(self.frame_queue)
+        out['capture']['dropped'] = self.frame_queue.dropped
+        out['inference']['queue'] = len(self.result_queue)
+        out['inference']['dropped'] = self.result_queue.dropped
+        return out
+
+    def stats_text(self) -> str:
+        s = self.stats()
+        return (f"cap {s['capture']['fps']:.0f}fps q{s['capture']['queue']} | "
+                f"inf {s['inference']['fps']:.0f}fps q{s['inference']['queue']} | "
+                f"ren {s['render']['fps']:.0f}fps")
@@ -2,76 +2,715 @@
 pose_detection.py
 
 Handles the MediaPipe Pose pipeline.
+
+mediapipe is imported when a detector is built, not with this module: it
+takes most of a second to import, and InferenceScheduler, cached batch runs
+and the benchmarks don't need it.
+
+ComplexityController picks model_complexity and inference resolution at
+run time to hold a target frame rate (the "auto" model setting).
 """
 
+import math
+import os
+import threading
+import time
+import warnings
 import cv2
-import mediapipe as mp
 import numpy as np
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Optional, Tuple
+
+from landmarks import Landmarks, NUM_LANDMARKS, VIS
+from renderer import draw_skeleton
+from smoothing import OneEuroFilter
+
+class InferenceScheduler:
+    """
+    Adaptive-rate inference: decides per frame whether PoseDetector runs
+    MediaPipe or reuses a prediction.
+
+    Full rate whenever the primary angle is mid-rep or moving down toward the
+    rep threshold; while idle/resting (near the lockout angle and still), only
+    every `stride`-th frame is inferred. The idle stride is the smallest one
+    (at least `idle_stride`, at most `max_stride`) that keeps inference under
+    `cpu_budget`, the fraction of wall time MediaPipe may use, given measured
+    inference latency. Skipped frames get landmarks extrapolated at constant
+    velocity from the last two inferred frames.
+    """
+    def __init__(self, idle_stride: int = 2, max_stride: int = 6,
+                 cpu_budget: Optional[float] = None, approach_margin: float = 15.0,
+                 velocity_thresh: float = 1.5):
+        self.idle_stride = max(1, idle_stride)
+        self.max_stride = max(self.idle_stride, max_stride)
+        self.cpu_budget = cpu_budget
+        self.approach_margin = approach_margin
+        self.velocity_thresh = velocity_thresh  # deg per inferred frame
+
+        self.idle = True
+        self.stride = self.idle_stride
+        self.skipped = 0
+        self.inferred_frames = 0
+        self.total_frames = 0
+        self.infer_s = 0.0        # EWMA MediaPipe latency
+        self.frame_s = 1.0 / 30   # EWMA frame interval
+        self._last_frame_t = None
+        self._last_angle = None
+        self._velocity = 0.0
+        self._history = []        # last two inferred (frame index, landmarks array)
+
+    # --- Per-frame decisions ---
+    def should_infer(self) -> bool:
+        now = time.perf_counter()
+        if self._last_frame_t is not None:
+            self.frame_s = 0.9 * self.frame_s + 0.1 * (now - self._last_frame_t)
+        self._last_frame_t = now
+        self.total_frames += 1
+
+        stride = 1 if not self.idle else self.stride
+        # Always infer right after (re)acquiring someone: no velocity yet
+        if self.skipped + 1 >= stride or len(self._history) == 1 or not self.inferred_frames:
+            self.skipped = 0
+            return True
+        self.skipped += 1
+        return False
+
+    def record_inference(self, seconds: float, landmarks: Optional[Landmarks]):
+        self.infer_s = seconds if not self.inferred_frames else 0.9 * self.infer_s + 0.1 * seconds
+        self.inferred_frames += 1
+        if landmarks is None:
+            self._history.clear()
+        else:
+            self._history = (self._history + [(self.total_frames, landmarks.data)])[-2:]
+        self._update_stride()
+
+    def predict(self) -> Optional[Landmarks]:
+        """ Landmarks for a skipped frame, extrapolated from the last two inferences. """
+        if not self._history:
+            return None
+        f1, d1 = self._history[-1]
+        if len(self._history) < 2:
+            return Landmarks(d1)
+        f0, d0 = self._history[0]
+        step = (self.total_frames - f1) / max(1, f1 - f0)
+        pred = d1 + (d1 - d0) * step
+        pred[:, VIS] = d1[:, VIS]
+        return Landmarks(pred)
+
+    def update(self, angle: Optional[float], thresh_enter: float, thresh_exit: float,
+               inferred: bool = True):
+        """
+        Feed the primary rep angle after each frame. Only inferred frames
+        update the motion estimate.
+        """
+        if not inferred:
+            return
+        if angle is None:
+            # Nobody visible: idle rate until someone shows up
+            self._last_angle = None
+            self.idle = True
+            return
+        if self._last_angle is not None:
+            self._velocity = 0.5 * self._velocity + 0.5 * (angle - self._last_angle)
+        self._last_angle = angle
+
+        # Reps drive the angle down toward thresh_enter, then back up past thresh_exit
+        mid_rep = angle < thresh_exit - self.approach_margin
+        descending = self._velocity < -self.velocity_thresh
+        self.idle = not (mid_rep or descending)
+
+    def _update_stride(self):
+        stride = self.idle_stride
+        if self.cpu_budget:
+            # Share of wall time spent inferring at stride k is infer / (k * frame)
+            need = self.infer_s / (self.cpu_budget * max(self.frame_s, 1e-3))
+            stride = max(stride, math.ceil(need))
+        self.stride = min(stride, self.max_stride)
+
+    def stats(self) -> Dict:
+        rate = self.inferred_frames / self.total_frames if self.total_frames else 1.0
+        return {
+            'idle': self.idle,
+            'stride': 1 if not self.idle else self.stride,
+            'inference_rate': round(rate, 2),
+            'inference_ms': round(self.infer_s * 1000.0, 2),
+        }
+
+class ComplexityController:
+    """
+    Automatic model_complexity / inference resolution for PoseDetector.
+
+    Walks a ladder of (model_complexity, inference_width) levels, cheapest
+    first, to keep inference latency within the frame budget of
+    `target_fps`. Latency is an EWMA per level, seeded during warm-up and
+    updated on every inferred frame.
+
+    Hysteresis: the detector steps down once the current level's latency has
+    stayed above `high` x budget for `patience` inferences. It steps up only
+    after `cooldown` seconds at the current level, and only when the next
+    level is known (or estimated at twice the current cost) to stay under
+    `low` x budget. A level that had to be abandoned is retried only after a
+    backoff that doubles each time.
+    """
+    LEVELS = ((0, 480), (0, 640), (1, 640), (1, None), (2, None))
+
+    def __init__(self, target_fps: float = 30.0, levels: Tuple = LEVELS, start: Optional[int] = None,
+                 high: float = 0.9, low: float = 0.6, patience: int = 15, cooldown: float = 5.0):
+        self.levels = tuple(levels)
+        self.target_fps = target_fps
+        self.budget = 1.0 / target_fps
+        self.high = high
+        self.low = low
+        self.patience = patience
+        self.cooldown = cooldown
+        # Default: the fixed-mode default (complexity 1, native resolution)
+        if start is None:
+            start = self.levels.index((1, None)) if (1, None) in self.levels else len(self.levels) // 2
+        self.level = self._prev = start
+        self.latency: List[Optional[float]] = [None] * len(self.levels)  # EWMA seconds per level
+        self.switches = 0
+        self.unavailable: List[int] = []  # complexities whose model failed to load
+        self._over = 0
+        self._skip = 0
+        self._last_switch = time.perf_counter()
+        self._retry_at = [0.0] * len(self.levels)
+        self._backoff = [cooldown] * len(self.levels)
+
+    @property
+    def current(self) -> Tuple[int, Optional[int]]:
+        """ (model_complexity, inference_width) of the current level. """
+        return self.levels[self.level]
+
+    def _switch(self, level: int):
+        self._prev = self.level
+        self.level = level
+        self.switches += 1
+        self._over = 0
+        self._skip = 1  # first inference on a new graph includes its set-up
+        self._last_switch = time.perf_counter()
+
+    def calibrate(self, seconds: float) -> bool:
+        """
+        Warm-up measurement of the current level. Returns True after stepping
+        down (measure again at the new level). Blank warm-up frames only run
+        the person detector, so this is a lower bound that run time corrects.
+        """
+        self.latency[self.level] = seconds
+        if seconds > self.high * self.budget and self.level > 0:
+            self._switch(self.level - 1)
+            self._skip = 0
+            return True
+        return False
+
+    def record(self, seconds: float) -> bool:
+        """ Feed one inference latency; returns True if the level changed. """
+        if self._skip:
+            self._skip -= 1
+            return False
+        i = self.level
+        prev = self.latency[i]
+        self.latency[i] = seconds if prev is None else 0.9 * prev + 0.1 * seconds
+        now = time.perf_counter()
+
+        # Too slow: step down after `patience` inferences over budget
+        self._over = self._over + 1 if self.latency[i] > self.high * self.budget else 0
+        if self._over >= self.patience and i > 0:
+            self._retry_at[i] = now + self._backoff[i]
+            self._backoff[i] *= 2
+            self._switch(i - 1)
+            return True
+
+        # Headroom: step up when the next level should still fit
+        if i + 1 < len(self.levels) and now - self._last_switch >= self.cooldown \
+                and now >= self._retry_at[i + 1]:
+            nxt = self.latency[i + 1]
+            estimate = 2.0 * self.latency[i] if nxt is None else nxt
+            if estimate < self.low * self.budget:
+                self._switch(i + 1)
+                return True
+        return False
+
+    def drop_complexity(self, model_complexity: int):
+        """ Removes the levels of a model that failed to load and returns to the previous level. """
+        prev = self.levels[self._prev]
+        keep = [i for i, level in enumerate(self.levels) if level[0] != model_complexity]
+        if not keep or prev[0] == model_complexity:
+            raise RuntimeError(f"no usable model_complexity left after dropping {model_complexity}")
+        self.levels = tuple(self.levels[i] for i in keep)
+        self.unavailable.append(model_complexity)
+        self.latency = [self.latency[i] for i in keep]
+        self._retry_at = [self._retry_at[i] for i in keep]
+        self._backoff = [self._backoff[i] for i in keep]
+        self.level = self._prev = self.levels.index(prev)
+
+    def stats(self) -> Dict:
+        complexity, width = self.current
+        latency = self.latency[self.level]
+        return {
+            'model_complexity': complexity,
+            'inference_width': width,
+            'target_fps': self.target_fps,
+            'inference_ms': round(latency * 1000.0, 2) if latency is not None else None,
+            'switches': self.switches,
+            'unavailable': self.unavailable,
+        }
+
+    def label(self) -> str:
+        complexity, width = self.current
+        label = f"auto: model {complexity} @ {'native' if width is None else f'{width}px'}"
+        if self.unavailable:
+            label += f" (model {', '.join(map(str, self.unavailable))} unavailable)"
+        return label
 
 class PoseDetector:
     def __init__(self, 
                  model_complexity: int = 1, 
                  min_detection_confidence: float = 0.5, 
-                 min_tracking_confidence: float = 0.5):
+                 min_tracking_confidence: float = 0.5,
+                 scheduler: Optional[InferenceScheduler] = None,
+                 inference_width: Optional[int] = None,
+                 roi: bool = False,
+                 roi_padding: float = 0.3,
+                 smoother: Optional[OneEuroFilter] = None,
+                 auto_complexity: Optional[ComplexityController] = None,
+                 static_image_mode: bool = False):
+        import mediapipe as mp
+        
+        # Optional adaptive-rate inference (see InferenceScheduler)
+        self.scheduler = scheduler
+        
+        # Optional automatic model_complexity / inference_width (see
+        # ComplexityController); overrides both arguments
+        self.auto_complexity = auto_complexity
+        if auto_complexity is not None:
+            model_complexity, inference_width = auto_complexity.current
+        
+        # Optional temporal smoothing of the landmarks (see smoothing.py)
+        self.smoother = smoother
+        
+        # Inference resolution / region of interest (independent of display)
+        # inference_width: downscale what MediaPipe sees to at most this width
+        # roi: only send a padded box around the last pose to MediaPipe
+        self.inference_width = inference_width
+        self.roi = roi
+        self.roi_padding = roi_padding
+        self._roi_box = None
+        
+        # Reused conversion buffers (reallocated only when the size changes)
+        self._rgb_buf = None
+        self._resize_buf = None
+        
+        # Set by warmup()
+        self._warmup_thread = None
+        self.warmup_s = None
+        
+        # Everything that changes the landmarks (used as a cache key)
+        self.settings = self.settings_for(model_complexity, min_detection_confidence, min_tracking_confidence,
+                                          inference_width, roi, smoother.params if smoother else None,
+                                          static_image_mode)
         
         # STANDARD IMPORT
         self.mp_pose = mp.solutions.pose
         self.mp_drawing = mp.solutions.drawing_utils
         
-        # Initialize MediaPipe Pose
-        self.pose = self.mp_pose.Pose(
-            static_image_mode=False,
-            model_complexity=model_complexity,
-            min_detection_confidence=min_detection_confidence,
-            min_tracking_confidence=min_tracking_confidence
-        )
+        # Initialize MediaPipe Pose (one graph per complexity used, kept so
+        # auto mode can switch back without reloading). static_image_mode
+        # detects every frame from scratch instead of tracking, for callers
+        # whose consecutive frames may come from unrelated streams
+        self.static_image_mode = static_image_mode
+        self.model_complexity = model_complexity
+        self.min_detection_confidence = min_detection_confidence
+        self.min_tracking_confidence = min_tracking_confidence
+        self._graphs = {}
+        self.pose = self._graph(model_complexity)
         
         self.drawing_spec = self.mp_drawing.DrawingSpec(color=(0, 255, 0), thickness=2, circle_radius=2)
 
-    def detect(self, frame: np.ndarray) -> Dict:
+    @staticmethod
+    def settings_for(model_complexity: int = 1,
+                     min_detection_confidence: float = 0.5,
+                     min_tracking_confidence: float = 0.5,
+                     inference_width: Optional[int] = None,
+                     roi: bool = False,
+                     smoothing: Optional[Dict] = None,
+                     static_image_mode: bool = False) -> Dict:
+        """
+        Settings dict a PoseDetector built with these arguments would have.
+        `smoothing` is OneEuroFilter.params, if a smoother is used.
+        """
+        settings = {
+            'model_complexity': model_complexity,
+            'min_detection_confidence': min_detection_confidence,
+            'min_tracking_confidence': min_tracking_confidence,
+            'inference_width': inference_width,
+            'roi': roi,
+        }
+        if smoothing:
+            # Only present when set, so existing cache keys stay valid
+            settings['smoothing'] = smoothing
+        if static_image_mode:
+            settings['static_image_mode'] = True
+        return settings
+
+    def _graph(self, model_complexity: int):
+        pose = self._graphs.get(model_complexity)
+        if pose is None:
+            pose = self._graphs[model_complexity] = self.mp_pose.Pose(
+                static_image_mode=self.static_image_mode,
+                model_complexity=model_complexity,
+                min_detection_confidence=self.min_detection_confidence,
+                min_tracking_confidence=self.min_tracking_confidence
+            )
+        return pose
+
+    def set_model_complexity(self, model_complexity: int, inference_width: Optional[int] = None):
+        """ Switches model (and inference width); tracking restarts on the new graph. """
+        self._wait_warmup()  # don't swap the graph under a running warm-up
+        self._set_model(model_complexity, inference_width)
+
+    def _set_model(self, model_complexity: int, inference_width: Optional[int]):
+        self.pose = self._graph(model_complexity)
+        self.model_complexity = model_complexity
+        self.inference_width = inference_width
+        self.settings.update(model_complexity=model_complexity, inference_width=inference_width)
+        self._roi_box = None
+
+    def set_auto_complexity(self, controller: Optional[ComplexityController]):
+        """ Enables (or with None, disables) automatic complexity selection. """
+        self._wait_warmup()
+        self.auto_complexity = controller
+        if controller is not None:
+            self._apply_auto()
+
+    def _apply_auto(self):
+        """
+        Moves to the auto controller's level. MediaPipe downloads the lite and
+        heavy models on first use; if one can't be loaded (e.g. offline), its
+        levels are dropped and the previous level stays.
+        """
+        while True:
+            complexity, width = self.auto_complexity.current
+            try:
+                self._set_model(complexity, width)
+                return
+            except (OSError, RuntimeError) as e:
+                # Front ends show it through ComplexityController.label()
+                warnings.warn(f"model_complexity={complexity} unavailable, auto mode skips it: {e}")
+                self.auto_complexity.drop_complexity(complexity)
+
+    def _buffer(self, name: str, shape: Tuple) -> np.ndarray:
+        buf = getattr(self, name)
+        if buf is None or buf.shape != shape:
+            buf = np.empty(shape, dtype=np.uint8)
+            setattr(self, name, buf)
+        return buf
+
+    def warmup(self, frames: int = 2, shape: Tuple[int, int] = (480, 640), background: bool = False) -> Optional[float]:
+        """
+        Runs `frames` dummy inferences on a blank (h, w) frame so MediaPipe
+        sets up its graph and TFLite delegates now rather than on the first
+        camera frame. Tracking, smoothing and scheduler state are untouched.
+        With background=True it runs on a daemon thread and returns None at
+        once; detect() waits for it to finish. Returns the warm-up time in
+        seconds (also kept in `warmup_s`).
+        """
+        if background:
+            self._warmup_thread = threading.Thread(target=self.warmup, args=(frames, shape),
+                                                   name='pose-warmup', daemon=True)
+            self._warmup_thread.start()
+            return None
+        t0 = time.perf_counter()
+        blank = self._blank(shape)
+        for _ in range(frames):
+            self._warmup_frame(blank)
+        if self.auto_complexity is not None:
+            self._calibrate(shape)
+        self.warmup_s = time.perf_counter() - t0
+        return self.warmup_s
+
+    def _blank(self, shape: Tuple[int, int]) -> np.ndarray:
+        h, w = shape
+        if self.inference_width and w > self.inference_width:
+            h, w = max(1, round(h * self.inference_width / w)), self.inference_width
+        return np.zeros((h, w, 3), dtype=np.uint8)
+
+    def _calibrate(self, shape: Tuple[int, int]):
+        """ Times the auto level on warm-up frames, stepping down until it fits. """
+        while True:
+            blank = self._blank(shape)
+            self._warmup_frame(blank)  # sets up a newly selected graph
+            t0 = time.perf_counter()
+            self._warmup_frame(blank)
+            if not self.auto_complexity.calibrate(time.perf_counter() - t0):
+                return
+            self._apply_auto()
+
+    def _warmup_frame(self, image_rgb: np.ndarray):
+        self.pose.process(image_rgb)
+
+    def _wait_warmup(self):
+        thread = self._warmup_thread
+        if thread is not None:
+            thread.join()
+            self._warmup_thread = None
+
+    def detect(self, frame: np.ndarray, draw: bool = True, inplace: bool = False,
+               t: Optional[float] = None) -> Dict:
         """
         Processes frame and returns landmarks.
+        With draw=False the skeleton is not drawn and 'image' is the input frame.
+        With inplace=True the skeleton is drawn straight onto `frame` instead of
+        a copy (use when the caller owns the frame, e.g. fresh from cap.read()).
         Returns:
-            dict with keys: 'image', 'landmarks'
-            landmarks format: List of (x, y, z, visibility) tuples.
+            dict with keys: 'image', 'landmarks', 'inferred'
+            landmarks format: Landmarks, a (33, 4) float32 array of
+            (x_px, y_px, z, visibility), or None if nobody was found.
+            inferred: False if the scheduler skipped MediaPipe and the
+            landmarks are a prediction.
+        `t` is the frame time in seconds for the smoother (default: now).
         """
-        image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        if self._warmup_thread is not None:
+            self._wait_warmup()
+
+        if self.scheduler is not None and not self.scheduler.should_infer():
+            if self.smoother is not None:
+                predicted = self.smoother.predict(t)
+            else:
+                predicted = self.scheduler.predict()
+            annotated_image = frame.copy() if draw and not inplace else frame
+            if draw and predicted is not None:
+                self.draw_skeleton(annotated_image, predicted)
+            return {
+                'image': annotated_image,
+                'landmarks': predicted,
+                'inferred': False,
+            }
+
+        h, w, _ = frame.shape
+        x0, y0, x1, y1 = self._roi_box if self.roi and self._roi_box else (0, 0, w, h)
+        crop = frame[y0:y1, x0:x1]  # view, no copy
+        crop_w, crop_h = x1 - x0, y1 - y0
+        if self.inference_width and crop_w > self.inference_width:
+            size = (self.inference_width, max(1, round(crop_h * self.inference_width / crop_w)))
+            crop = cv2.resize(crop, size, dst=self._buffer('_resize_buf', (size[1], size[0], 3)),
+                              interpolation=cv2.INTER_LINEAR)
+
+        image_rgb = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB, dst=self._buffer('_rgb_buf', crop.shape))
         image_rgb.flags.writeable = False 
         
+        # Latency fed to the scheduler / auto complexity: the model alone
+        t0 = time.perf_counter()
         results = self.pose.process(image_rgb)
+        infer_s = time.perf_counter() - t0
         
         image_rgb.flags.writeable = True
-        annotated_image = frame.copy()
-        landmarks_px = []
+        annotated_image = frame.copy() if draw and not inplace else frame
+        landmarks_px = None
         
         if results.pose_landmarks:
-            h, w, _ = frame.shape
+            # Convert to full-frame pixel coordinates
+            landmarks_px = Landmarks.from_mediapipe(results.pose_landmarks, crop_w, crop_h, x0, y0)
             
-            # Draw skeletons
-            self.mp_drawing.draw_landmarks(
-                annotated_image, 
-                results.pose_landmarks, 
-                self.mp_pose.POSE_CONNECTIONS,
-                landmark_drawing_spec=self.drawing_spec,
-                connection_drawing_spec=self.drawing_spec
-            )
+            if self.smoother is not None:
+                landmarks_px = self.smoother(landmarks_px, t)
             
-            # Convert to pixel coordinates
-            for lm in results.pose_landmarks.landmark:
-                landmarks_px.append((
-                    int(lm.x * w), 
-                    int(lm.y * h), 
-                    lm.z, 
-                    lm.visibility
-                ))
-        else:
-            landmarks_px = None
+            # Draw skeleton from the (possibly cropped / smoothed) pixel array
+            if draw:
+                self.draw_skeleton(annotated_image, landmarks_px)
+
+        elif self.smoother is not None:
+            self.smoother.reset()
+
+        if self.roi:
+            self._update_roi(landmarks_px, w, h)
+
+        if self.scheduler is not None:
+            self.scheduler.record_inference(infer_s, landmarks_px)
+        if self.auto_complexity is not None and self.auto_complexity.record(infer_s):
+            self._apply_auto()
+
+        return {
+            'image': annotated_image,
+            'landmarks': landmarks_px,
+            'inferred': True,
+        }
+
+    def _update_roi(self, landmarks: Optional[Landmarks], w: int, h: int):
+        """
+        Keeps a padded box around the pose for the next frame. The box is
+        sticky: it only moves when the pose nears its edge or shrinks a lot,
+        so MediaPipe's own tracker sees a stable image geometry.
+        """
+        if landmarks is None:
+            self._roi_box = None  # lost: search the full frame again
+            return
+        pts = landmarks.data[landmarks.visibility > 0.3, :2]
+        if len(pts) < 4:
+            self._roi_box = None
+            return
+        (px0, py0), (px1, py1) = pts.min(axis=0), pts.max(axis=0)
+        pad = self.roi_padding * max(px1 - px0, py1 - py0)
+
+        if self._roi_box is not None:
+            bx0, by0, bx1, by1 = self._roi_box
+            margin = 0.5 * pad
+            inside = (px0 - margin >= bx0 or bx0 == 0) and (py0 - margin >= by0 or by0 == 0) \
+                and (px1 + margin <= bx1 or bx1 == w) and (py1 + margin <= by1 or by1 == h)
+            too_big = (bx1 - bx0) * (by1 - by0) > 2.5 * (px1 - px0 + 2 * pad) * (py1 - py0 + 2 * pad)
+            if inside and not too_big:
+                return
+
+        box = (int(max(0, px0 - pad)), int(max(0, py0 - pad)),
+               int(min(w, px1 + pad)), int(min(h, py1 + pad)))
+        # Don't bother cropping when the box is nearly the whole frame
+        if (box[2] - box[0]) * (box[3] - box[1]) > 0.8 * w * h or box[2] - box[0] < 32 or box[3] - box[1] < 32:
+            box = None
+        self._roi_box = box
+
+    def draw_skeleton(self, image: np.ndarray, landmarks):
+        """
+        Draws skeletons from a landmark array (Landmarks or (P, 33, 4)) in two
+        batched cv2.polylines calls. Same visibility cut-off as
+        mp_drawing.draw_landmarks.
+        """
+        spec = self.drawing_spec
+        draw_skeleton(image, landmarks, spec.color, spec.thickness, spec.circle_radius)
+
+    def detect_video(self, path: str, on_frame: Optional[Callable[[int, Dict], bool]] = None) -> Tuple[np.ndarray, float]:
+        """
+        Runs detection over every frame of a video file as fast as possible.
+        Returns (landmarks, fps) where landmarks is an (N, 33, 4) float32 array
+        with NaN rows for frames where nobody was found.
+        `on_frame(index, result)` is called per frame (result as from detect()
+        with the skeleton drawn); returning False stops early.
+        """
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise IOError(f"Cannot open video: {path}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+
+        rows = []
+        missing = np.full((NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+        if self.smoother is not None:
+            self.smoother.reset()
+        try:
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                # Video time, not wall time: files decode faster than real time
+                data = self.detect(frame, draw=on_frame is not None, t=len(rows) / fps)
+                lm = data['landmarks']
+                rows.append(lm.data if lm is not None else missing)
+                if on_frame is not None and on_frame(len(rows) - 1, data) is False:
+                    break
+        finally:
+            cap.release()
+
+        if not rows:
+            return np.empty((0, NUM_LANDMARKS, 4), dtype=np.float32), fps
+        return np.stack(rows), fps
+
+    def close(self):
+        for pose in self._graphs.values():
+            pose.close()
+        self._graphs = {}
+
+class MultiPoseDetector:
+    """
+    Multi-person pose detection with MediaPipe's PoseLandmarker task
+    (the legacy Pose solution only ever returns one person).
+
+    Needs a pose_landmarker_*.task model file, e.g. pose_landmarker_lite.task
+    from the MediaPipe model page; the lite model keeps 4-6 people real-time
+    on CPU.
+    """
+    def __init__(self,
+                 model_path: str,
+                 num_poses: int = 6,
+                 min_detection_confidence: float = 0.5,
+                 min_presence_confidence: float = 0.5,
+                 min_tracking_confidence: float = 0.5,
+                 inference_width: Optional[int] = None):
+        import mediapipe as mp
+        from mediapipe.tasks.python import BaseOptions
+        from mediapipe.tasks.python import vision
+
+        if not os.path.isfile(model_path):
+            raise IOError(f"Pose landmarker model not found: {model_path}")
+
+        self.num_poses = num_poses
+        self.inference_width = inference_width
+        self.scheduler = None  # adaptive-rate inference is single-person only
+        self.auto_complexity = None  # model is fixed by the .task file
+        self._rgb_buf = None
+        self._resize_buf = None
+        self._last_ts = -1
+        self._warmup_thread = None
+        self.warmup_s = None
+        self._mp_image = lambda rgb: mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb)
+
+        self.mp_pose = mp.solutions.pose
+        self.drawing_spec = mp.solutions.drawing_utils.DrawingSpec(color=(0, 255, 0), thickness=2, circle_radius=2)
+
+        options = vision.PoseLandmarkerOptions(
+            base_options=BaseOptions(model_asset_path=model_path),
+            running_mode=vision.RunningMode.VIDEO,
+            num_poses=num_poses,
+            min_pose_detection_confidence=min_detection_confidence,
+            min_pose_presence_confidence=min_presence_confidence,
+            min_tracking_confidence=min_tracking_confidence,
+        )
+        self.landmarker = vision.PoseLandmarker.create_from_options(options)
+
+    _buffer = PoseDetector._buffer
+    draw_skeleton = PoseDetector.draw_skeleton
+    warmup = PoseDetector.warmup
+    _blank = PoseDetector._blank
+    _wait_warmup = PoseDetector._wait_warmup
+
+    def _timestamp(self) -> int:
+        # VIDEO mode needs strictly increasing millisecond timestamps
+        ts = max(int(time.perf_counter() * 1000), self._last_ts + 1)
+        self._last_ts = ts
+        return ts
+
+    def _warmup_frame(self, image_rgb: np.ndarray):
+        self.landmarker.detect_for_video(self._mp_image(image_rgb), self._timestamp())
+
+    def detect(self, frame: np.ndarray, draw: bool = True, inplace: bool = False) -> Dict:
+        """
+        Processes frame and returns every detected person.
+        Returns:
+            dict with keys: 'image', 'poses', 'landmarks'
+            poses: (P, 33, 4) float32 array in full-frame pixels (P may be 0)
+            landmarks: list of P Landmarks (views into `poses`)
+        """
+        if self._warmup_thread is not None:
+            self._wait_warmup()
+
+        h, w, _ = frame.shape
+        crop = frame
+        if self.inference_width and w > self.inference_width:
+            size = (self.inference_width, max(1, round(h * self.inference_width / w)))
+            crop = cv2.resize(frame, size, dst=self._buffer('_resize_buf', (size[1], size[0], 3)),
+                              interpolation=cv2.INTER_LINEAR)
+        image_rgb = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB, dst=self._buffer('_rgb_buf', crop.shape))
+        results = self.landmarker.detect_for_video(self._mp_image(image_rgb), self._timestamp())
+
+        poses = np.empty((len(results.pose_landmarks), NUM_LANDMARKS, 4), dtype=np.float32)
+        for i, person in enumerate(results.pose_landmarks):
+            poses[i] = Landmarks.from_mediapipe(person, w, h).data
+        landmarks = [Landmarks(p) for p in poses]
+
+        annotated_image = frame.copy() if draw and not inplace else frame
+        if draw and len(poses):
+            self.draw_skeleton(annotated_image, poses)
 
         return {
             'image': annotated_image,
-            'landmarks': landmarks_px
+            'poses': poses,
+            'landmarks': landmarks,
         }
 
     def close(self):
-        self.pose.close()
\ No newline at end of file
+        self.landmarker.close()
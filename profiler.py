@@ -0,0 +1,252 @@
+"""
+profiler.py
+
+Low-overhead per-frame instrumentation.
+
+Stages are timed with monotonic-clock spans:
+
+    with PROFILER.span('detect'):
+        data = detector.detect(frame)
+
+and aggregated per stage into a rolling window (percentiles for the debug
+overlay) plus cumulative latency buckets (Prometheus histogram). While the
+profiler is disabled, span() hands back one shared no-op context manager,
+so instrumented code costs a method call and nothing else.
+
+Export: Profiler.write() (JSON, or Prometheus text for *.prom files),
+periodic file export, or a local HTTP /metrics endpoint via serve().
+
+StartupTimer records launch milestones (imports, model load, warm-up,
+camera, first frame) for the startup-time report.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Cumulative histogram bucket bounds (ms)
+BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 35, 50, 100, 250, 1000)
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class StageHistogram:
+    """ Latency samples for one stage: last `window` values plus cumulative buckets. """
+    __slots__ = ('name', 'samples', 'pos', 'filled', 'count', 'total_ms', 'buckets')
+
+    def __init__(self, name: str, window: int = 300):
+        self.name = name
+        self.samples = np.zeros(window)
+        self.pos = 0
+        self.filled = 0
+        self.count = 0
+        self.total_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)  # last one is +Inf
+
+    def add(self, seconds: float):
+        ms = seconds * 1000.0
+        self.samples[self.pos] = ms
+        self.pos = (self.pos + 1) % len(self.samples)
+        if self.filled < len(self.samples):
+            self.filled += 1
+        self.count += 1
+        self.total_ms += ms
+        self.buckets[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+
+    def summary(self) -> Dict:
+        if not self.filled:
+            return {'count': 0}
+        window = self.samples[:self.filled]
+        p50, p90, p99 = np.percentile(window, (50, 90, 99))
+        return {
+            'count': self.count,
+            'mean_ms': round(float(window.mean()), 3),
+            'p50_ms': round(float(p50), 3),
+            'p90_ms': round(float(p90), 3),
+            'p99_ms': round(float(p99), 3),
+            'max_ms': round(float(window.max()), 3),
+        }
+
+class _Span:
+    __slots__ = ('stage', 't0')
+
+    def __init__(self, stage: StageHistogram):
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stage.add(time.perf_counter() - self.t0)
+        return False
+
+class Profiler:
+    """
+    Collects stage spans from any thread. Disabled by default; use the
+    module-level PROFILER so every front end and the pipeline share one.
+    """
+    def __init__(self, enabled: bool = False, window: int = 300):
+        self.enabled = enabled
+        self.window = window
+        self._stages: Dict[str, StageHistogram] = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._export_stop = None
+        self._export_thread = None
+
+    # --- Recording ---
+    def span(self, name: str):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self._stage(name))
+
+    def record(self, name: str, seconds: float):
+        if self.enabled:
+            self._stage(name).add(seconds)
+
+    def _stage(self, name: str) -> StageHistogram:
+        stage = self._stages.get(name)
+        if stage is None:
+            with self._lock:
+                stage = self._stages.setdefault(name, StageHistogram(name, self.window))
+        return stage
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+
+    # --- Reporting ---
+    def stats(self) -> Dict[str, Dict]:
+        return {name: s.summary() for name, s in list(self._stages.items())}
+
+    def overlay_lines(self) -> List[str]:
+        lines = []
+        for name, s in self.stats().items():
+            if s['count']:
+                lines.append(f"{name:<10} p50 {s['p50_ms']:6.2f}  p90 {s['p90_ms']:6.2f} ms")
+        return lines
+
+    def draw(self, frame: np.ndarray, y: int = 130):
+        """ Debug overlay: per-stage p50/p90 in the top-right corner. """
+        lines = self.overlay_lines()
+        if not lines:
+            return
+        import cv2  # only the overlay needs it; keeps this module cheap to import first
+        x = max(0, frame.shape[1] - 300)
+        cv2.rectangle(frame, (x - 5, y - 15), (frame.shape[1], y + 18 * len(lines) - 8), (30, 30, 30), -1)
+        for i, line in enumerate(lines):
+            cv2.putText(frame, line, (x, y + 18 * i), cv2.FONT_HERSHEY_PLAIN, 0.9, (200, 255, 200), 1)
+
+    def prometheus_text(self, metric: str = 'fitness_stage_latency_seconds') -> str:
+        out = [f"# HELP {metric} Per-frame stage latency.", f"# TYPE {metric} histogram"]
+        for name, s in list(self._stages.items()):
+            cumulative = 0
+            for bound, n in zip(BUCKETS_MS + (None,), s.buckets):
+                cumulative += n
+                le = '+Inf' if bound is None else repr(bound / 1000.0)
+                out.append(f'{metric}_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            out.append(f'{metric}_sum{{stage="{name}"}} {s.total_ms / 1000.0:.6f}')
+            out.append(f'{metric}_count{{stage="{name}"}} {s.count}')
+        return "\n".join(out) + "\n"
+
+    # --- Export ---
+    def write(self, path: str):
+        """ Atomically writes Prometheus text (*.prom) or JSON stats (anything else). """
+        if path.endswith('.prom'):
+            body = self.prometheus_text()
+        else:
+            body = json.dumps({'time': time.time(), 'stages': self.stats()}, indent=2)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(body)
+        os.replace(tmp, path)
+
+    def export_to_file(self, path: str, interval: float = 5.0):
+        """ Rewrites `path` every `interval` seconds on a daemon thread. """
+        self.stop_export()
+        stop = self._export_stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                self.write(path)
+            self.write(path)
+
+        self._export_thread = threading.Thread(target=loop, name='profiler-export', daemon=True)
+        self._export_thread.start()
+
+    def stop_export(self):
+        """ Stops periodic export after one final write. """
+        if self._export_stop is not None:
+            self._export_stop.set()
+            self._export_thread.join(timeout=2.0)
+            self._export_stop = self._export_thread = None
+
+    def serve(self, port: int = 9108, host: str = '127.0.0.1'):
+        """ Serves Prometheus text at http://host:port/metrics on a daemon thread. """
+        profiler = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') != '/metrics':
+                    self.send_error(404)
+                    return
+                body = profiler.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name='profiler-http', daemon=True).start()
+        return self._server
+
+    def close(self):
+        self.stop_export()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+class StartupTimer:
+    """
+    Milestones from launch to the first annotated frame, in seconds since the
+    timer was created (create it before the heavy imports). Marks may come
+    from several threads, e.g. the camera opening while the model loads.
+    """
+    def __init__(self, t0: Optional[float] = None):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.marks: List[Tuple[str, float]] = []
+
+    def mark(self, name: str) -> float:
+        elapsed = time.perf_counter() - self.t0
+        self.marks.append((name, elapsed))
+        return elapsed
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(t, 3) for name, t in sorted(self.marks, key=lambda m: m[1])}
+
+    def summary(self) -> str:
+        return "startup: " + " | ".join(f"{name} {t:.2f}s" for name, t in self.as_dict().items())
+
+# Shared instance used by main.py, app.py, pipeline.py and utils.draw_overlay
+PROFILER = Profiler()
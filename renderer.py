@@ -0,0 +1,137 @@
+"""
+renderer.py
+
+Fast frame overlays.
+
+The HUD is mostly static, so it is rendered once into cached layers that
+are copied onto each frame: the banner (background, title, rep and score
+fields) is re-rendered only when one of its fields changes, and each button
+(rectangle plus label) is a cached tile per resolution and state. Feedback
+messages and status lines change with the video underneath them and stay
+plain cv2.putText calls. The skeleton is drawn from the landmark array with
+one cv2.polylines call for the bones and one for the joints.
+
+Output is pixel-identical to drawing the same elements with cv2.rectangle /
+cv2.putText / cv2.line / cv2.circle.
+"""
+
+from typing import Iterable, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from landmarks import Landmarks, VIS
+
+# MediaPipe Pose skeleton (mp.solutions.pose.POSE_CONNECTIONS)
+POSE_CONNECTIONS = np.array([
+    (0, 1), (0, 4), (1, 2), (2, 3), (3, 7), (4, 5), (5, 6), (6, 8), (9, 10),
+    (11, 12), (11, 13), (11, 23), (12, 14), (12, 24), (13, 15), (14, 16),
+    (15, 17), (15, 19), (15, 21), (16, 18), (16, 20), (16, 22), (17, 19),
+    (18, 20), (23, 24), (23, 25), (24, 26), (25, 27), (26, 28), (27, 29),
+    (27, 31), (28, 30), (28, 32), (29, 31), (30, 32),
+], dtype=np.intp)
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+# =========================
+# Skeleton
+# =========================
+def draw_skeleton(image: np.ndarray, landmarks, color=(0, 255, 0), thickness: int = 2,
+                  circle_radius: int = 2, min_visibility: float = 0.5):
+    """
+    Draws one or more skeletons: `landmarks` is a Landmarks, a (33, 4) or a
+    (P, 33, 4) pixel array. Bones and joints are each one batched
+    cv2.polylines call (a zero-length polyline of thickness 2r is exactly a
+    filled circle of radius r).
+    """
+    data = landmarks.data if isinstance(landmarks, Landmarks) else np.asarray(landmarks)
+    data = data.reshape(-1, data.shape[-2], data.shape[-1])
+    visible = data[..., VIS] >= min_visibility
+    with np.errstate(invalid='ignore'):  # NaN rows are never visible
+        pts = data[..., :2].astype(np.int32)
+
+    a, b = POSE_CONNECTIONS[:, 0], POSE_CONNECTIONS[:, 1]
+    bones = np.stack([pts[:, a], pts[:, b]], axis=2)[visible[:, a] & visible[:, b]]
+    if len(bones):
+        cv2.polylines(image, bones, False, color, thickness)
+
+    joints = pts[visible]
+    if len(joints):
+        cv2.polylines(image, np.repeat(joints[:, None], 2, axis=1), False, color, 2 * circle_radius)
+
+# =========================
+# HUD
+# =========================
+class OverlayRenderer:
+    """
+    Draws the exercise HUD (the layout of utils.draw_overlay and main.draw_ui)
+    from cached layers.
+
+        overlay = OverlayRenderer()
+        overlay.draw(frame, result, reps, mode, exercise,
+                     lines=[(text, (x, y), scale, color)],
+                     buttons=[(label, (x1, y1, x2, y2), color)])
+    """
+    def __init__(self, banner_height: int = 80, banner_color=(30, 30, 30)):
+        self.banner_height = banner_height
+        self.banner_color = banner_color
+        self._banner_key = self._banner = None
+        self._buttons_key = self._buttons = None
+
+    def banner(self, width: int, exercise: str, mode: str, reps: int, score: int) -> np.ndarray:
+        """ Banner layer; re-rendered only when one of its fields changes. """
+        key = (width, exercise, mode, reps, score)
+        if key != self._banner_key:
+            # +1: the cv2.rectangle this replaces includes its bottom edge
+            banner = np.empty((self.banner_height + 1, width, 3), dtype=np.uint8)
+            cv2.rectangle(banner, (0, 0), (width, self.banner_height), self.banner_color, -1)
+            cv2.putText(banner, f"{exercise.upper()} ({mode})", (10, 30), FONT, 0.7, (255, 255, 255), 2)
+            cv2.putText(banner, f"Reps: {reps}", (10, 65), FONT, 1.0, (0, 255, 0), 2)
+            cv2.putText(banner, f"Form: {score}%", (200, 65), FONT, 0.8, (0, 255, 255), 2)
+            self._banner_key, self._banner = key, banner
+        return self._banner
+
+    def button_tiles(self, width: int, height: int, buttons: Sequence) -> List[Tuple[Tuple[slice, slice], np.ndarray]]:
+        """ ((rows, cols), tile) per button given as (label, (x1, y1, x2, y2), color), clipped to the frame. """
+        key = (width, height, tuple((label, tuple(box), tuple(color)) for label, box, color in buttons))
+        if key != self._buttons_key:
+            tiles = []
+            for label, (x1, y1, x2, y2), color in buttons:
+                tile = np.empty((y2 - y1 + 1, x2 - x1 + 1, 3), dtype=np.uint8)
+                cv2.rectangle(tile, (0, 0), (x2 - x1, y2 - y1), color, -1)
+                cv2.putText(tile, label, (5, 25), FONT, 0.4, (255, 255, 255), 1)
+                # Clip to the frame (narrow windows cut the last buttons off)
+                r0, c0 = max(y1, 0), max(x1, 0)
+                r1, c1 = min(y2 + 1, height), min(x2 + 1, width)
+                if r0 < r1 and c0 < c1:
+                    tiles.append(((slice(r0, r1), slice(c0, c1)), tile[r0 - y1:r1 - y1, c0 - x1:c1 - x1]))
+            self._buttons_key, self._buttons = key, tiles
+        return self._buttons
+
+    def draw(self, frame: np.ndarray, result, reps: int, mode: str, exercise: str,
+             lines: Iterable = (), buttons: Sequence = ()):
+        """
+        Banner, feedback messages/warnings, extra `lines` given as
+        (text, org, scale, color) and an optional button bar.
+        """
+        h, w = frame.shape[:2]
+        score = int(result.score) if result else 0
+        banner = self.banner(w, exercise, mode, reps, score)
+        rows = min(h, len(banner))
+        frame[:rows] = banner[:rows]
+
+        # Feedback Messages
+        if result:
+            y = 30
+            for msg in result.messages:
+                cv2.putText(frame, msg, (400, y), FONT, 0.7, (0, 165, 255), 2)
+                y += 30
+            for warn in result.warnings:
+                cv2.putText(frame, warn, (400, y), FONT, 0.7, (0, 0, 255), 2)
+
+        for text, org, scale, color in lines:
+            cv2.putText(frame, text, org, FONT, scale, color, 1)
+
+        if buttons:
+            for region, tile in self.button_tiles(w, h, buttons):
+                frame[region] = tile
@@ -0,0 +1,219 @@
+"""
+session_recorder.py
+
+Compact binary recording and replay of workout sessions.
+
+A recording is an append-only file of fixed-width float32 records, one per
+frame (time, landmarks, joint angles, form score, rep events), written in
+chunks behind a small header, plus a sidecar chunk index (<file>.idx).
+SessionReplay memory-maps the records so a long session can be re-scored
+through any ExerciseRule / RepCounter configuration without decoding video.
+
+File layout:
+    b'FITREC\\x00\\x01' | u32 header_len | JSON schema (padded) | records...
+"""
+
+import json
+import os
+import struct
+import time
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+from angle_calculation import calculate_angles, joint_triples
+from landmarks import Landmarks, NUM_LANDMARKS, unstack
+import config
+
+MAGIC = b'FITREC\x00\x01'
+_PREFIX = struct.Struct('<8sI')
+_HEADER_ALIGN = 64
+
+def exercise_angles(exercises: Dict = None) -> Dict[str, Tuple[str, str, str]]:
+    """
+    Every joint triple the exercises use, by angle name. The alternatives of
+    an 'any' angle (e.g. either arm) are stored separately, named after their
+    middle joint; a name reused with different joints gets an
+    '<exercise>_' prefix.
+    """
+    angles = {}
+    for exercise, spec in (exercises or config.EXERCISES).items():
+        for name, triple in spec['angles'].items():
+            if isinstance(triple, dict):
+                alternatives = [(t[1], tuple(t)) for t in triple['any']]
+            else:
+                alternatives = [(name, tuple(triple))]
+            for key, t in alternatives:
+                if angles.setdefault(key, t) != t:
+                    angles.setdefault(f"{exercise}_{key}", t)
+    return angles
+
+# Angles stored with every frame (union of what the exercise rules use)
+RECORD_ANGLES = exercise_angles()
+
+# Chunk index rows: first frame, frame count, byte offset, time of first frame
+INDEX_DTYPE = np.dtype([('first', '<u8'), ('count', '<u4'), ('offset', '<u8'), ('t', '<f8')])
+
+def record_dtype(n_angles: int) -> np.dtype:
+    """ Fixed-width float32 record for one frame. """
+    return np.dtype([
+        ('t', '<f4'),                               # seconds since session start
+        ('landmarks', '<f4', (NUM_LANDMARKS, 4)),   # NaN when nobody detected
+        ('angles', '<f4', (n_angles,)),
+        ('score', '<f4'),
+        ('correct', '<f4'),
+        ('rep', '<f4'),                             # rep number completed on this frame, else 0
+    ])
+
+class SessionRecorder:
+    """
+    Streams per-frame data to disk with negligible cost on the live loop:
+    records go into a preallocated chunk buffer that is written out with a
+    single write() every `chunk_size` frames.
+    """
+    def __init__(self, path: str, exercise: str = '', mode: str = '', fps: float = 30.0,
+                 angles: Optional[Dict[str, Tuple[str, str, str]]] = None, chunk_size: int = 256):
+        self.path = path
+        self.angle_names = list((angles or RECORD_ANGLES).keys())
+        self.triples = joint_triples(list((angles or RECORD_ANGLES).values()))
+        self.dtype = record_dtype(len(self.angle_names))
+        self.chunk = np.zeros(chunk_size, dtype=self.dtype)
+        self.n_buffered = 0
+        self.n_written = 0
+        self.t0 = None
+
+        schema = {
+            'version': 1,
+            'exercise': exercise,
+            'mode': mode,
+            'fps': fps,
+            'angles': self.angle_names,
+            'triples': self.triples.tolist(),
+            'created': time.time(),
+        }
+        body = json.dumps(schema).encode()
+        header_len = _PREFIX.size + len(body)
+        header_len += (-header_len) % _HEADER_ALIGN
+        self.data_offset = header_len
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._f = open(path, 'wb')
+        self._f.write(_PREFIX.pack(MAGIC, header_len) + body.ljust(header_len - _PREFIX.size, b' '))
+        self._idx = open(path + '.idx', 'wb')
+
+    def record(self, landmarks: Optional[Landmarks], score: float = 0.0, correct: bool = False,
+               rep: int = 0, t: Optional[float] = None):
+        """
+        Appends one frame. `rep` is the rep number if a rep completed on this
+        frame, 0 otherwise.
+        """
+        now = time.perf_counter() if t is None else t
+        if self.t0 is None:
+            self.t0 = now
+        row = self.chunk[self.n_buffered]
+        row['t'] = now - self.t0
+        if landmarks is not None:
+            row['landmarks'] = landmarks.data
+            row['angles'] = calculate_angles(landmarks, self.triples)
+        else:
+            row['landmarks'] = np.nan
+            row['angles'] = np.nan
+        row['score'] = score
+        row['correct'] = correct
+        row['rep'] = rep
+        self.n_buffered += 1
+        if self.n_buffered == len(self.chunk):
+            self.flush()
+
+    def flush(self):
+        n = self.n_buffered
+        if not n:
+            return
+        entry = np.array([(self.n_written, n, self.data_offset + self.n_written * self.dtype.itemsize,
+                           self.chunk[0]['t'])], dtype=INDEX_DTYPE)
+        self._f.write(self.chunk[:n].tobytes())
+        self._f.flush()
+        self._idx.write(entry.tobytes())
+        self._idx.flush()
+        self.n_written += n
+        self.n_buffered = 0
+
+    def close(self):
+        if self._f.closed:
+            return
+        self.flush()
+        self._f.close()
+        self._idx.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class SessionReplay:
+    """
+    Memory-mapped read access to a recording. Columns are array views:
+    `times` (N,), `landmarks` (N, 33, 4), `angles` (N, A), `scores`, `reps`.
+    A partially written trailing record (crash mid-write) is ignored.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, header_len = _PREFIX.unpack(f.read(_PREFIX.size))
+            if magic != MAGIC:
+                raise ValueError(f"Not a session recording: {path}")
+            self.schema = json.loads(f.read(header_len - _PREFIX.size))
+
+        self.angle_names = self.schema['angles']
+        self.fps = self.schema.get('fps', 30.0)
+        self.dtype = record_dtype(len(self.angle_names))
+        n = (os.path.getsize(path) - header_len) // self.dtype.itemsize
+        if n > 0:
+            self.records = np.memmap(path, dtype=self.dtype, mode='r', offset=header_len, shape=(n,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+
+        idx_path = path + '.idx'
+        self.index = np.fromfile(idx_path, dtype=INDEX_DTYPE) if os.path.exists(idx_path) \
+            else np.zeros(0, dtype=INDEX_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def times(self) -> np.ndarray:
+        return self.records['t']
+
+    @property
+    def landmarks(self) -> np.ndarray:
+        return self.records['landmarks']
+
+    @property
+    def angles(self) -> np.ndarray:
+        return self.records['angles']
+
+    def angle(self, name: str) -> np.ndarray:
+        return self.records['angles'][:, self.angle_names.index(name)]
+
+    @property
+    def scores(self) -> np.ndarray:
+        return self.records['score']
+
+    @property
+    def reps(self) -> np.ndarray:
+        """ Frame indices on which a rep completed. """
+        return np.flatnonzero(self.records['rep'] > 0)
+
+    def frames(self) -> Iterator[Optional[Landmarks]]:
+        return unstack(self.landmarks)
+
+    def seek(self, t: float) -> int:
+        """ Index of the first frame at or after `t` seconds (via the chunk index). """
+        times = self.times
+        if len(self.index):
+            c = max(0, int(np.searchsorted(self.index['t'], t, side='right')) - 1)
+            lo = int(self.index['first'][c])
+            hi = min(len(times), lo + int(self.index['count'][c]) + 1)
+            return lo + int(np.searchsorted(times[lo:hi], t))
+        return int(np.searchsorted(times, t))
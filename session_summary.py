@@ -1,35 +1,105 @@
 """
 session_summary.py
 
-Tracks reps, correct vs incorrect, and average posture score for a session.
+Tracks reps, correct vs incorrect, and posture score statistics for a session.
+
+Memory is constant however long the session runs: scores are folded into
+running aggregates (Welford mean/variance, min/max) and a 101-bin histogram
+(one bin per whole score point, 0-100) that answers percentile queries.
+Summaries from different sessions or worker processes can be merged.
 """
-from dataclasses import dataclass, field
-from typing import Dict, List
+import math
+from typing import Dict, Iterable
+
+import numpy as np
+
+SCORE_BINS = 101  # posture scores are 0-100; one bin per point
 
-@dataclass
 class SessionSummary:
-    total_reps: int = 0
-    correct_reps: int = 0
-    incorrect_reps: int = 0
-    posture_scores: List[float] = field(default_factory=list)
+    __slots__ = ('total_reps', 'correct_reps', 'incorrect_reps',
+                 'score_min', 'score_max', '_mean', '_m2', '_hist')
+
+    def __init__(self):
+        self.total_reps = 0
+        self.correct_reps = 0
+        self.incorrect_reps = 0
+        self.score_min = math.inf
+        self.score_max = -math.inf
+        self._mean = 0.0
+        self._m2 = 0.0  # sum of squared deviations from the mean
+        self._hist = np.zeros(SCORE_BINS, dtype=np.int64)
 
     def push_rep(self, correct: bool, score: float):
+        score = float(score)
         self.total_reps += 1
         if correct:
             self.correct_reps += 1
         else:
             self.incorrect_reps += 1
-        self.posture_scores.append(score)
+
+        # Welford's online update
+        delta = score - self._mean
+        self._mean += delta / self.total_reps
+        self._m2 += delta * (score - self._mean)
+        if score < self.score_min: self.score_min = score
+        if score > self.score_max: self.score_max = score
+        self._hist[min(SCORE_BINS - 1, max(0, int(round(score))))] += 1
 
     def average_score(self) -> float:
-        if not self.posture_scores:
+        return self._mean if self.total_reps else 0.0
+
+    def score_std(self) -> float:
+        return math.sqrt(self._m2 / self.total_reps) if self.total_reps else 0.0
+
+    def quantile(self, q: float) -> float:
+        """
+        Score at quantile q (0-1) from the histogram; exact for whole-number
+        scores, otherwise within half a point.
+        """
+        if not self.total_reps:
             return 0.0
-        return sum(self.posture_scores) / len(self.posture_scores)
+        rank = max(1, math.ceil(q * self.total_reps))
+        value = float(np.searchsorted(np.cumsum(self._hist), rank))
+        return min(self.score_max, max(self.score_min, value))
+
+    def merge(self, other: 'SessionSummary') -> 'SessionSummary':
+        """ Folds another summary into this one (Chan et al. parallel update). """
+        if not other.total_reps:
+            return self
+        n_a, n_b = self.total_reps, other.total_reps
+        n = n_a + n_b
+        delta = other._mean - self._mean
+        self._mean += delta * n_b / n
+        self._m2 += other._m2 + delta * delta * n_a * n_b / n
+        self.total_reps = n
+        self.correct_reps += other.correct_reps
+        self.incorrect_reps += other.incorrect_reps
+        self.score_min = min(self.score_min, other.score_min)
+        self.score_max = max(self.score_max, other.score_max)
+        self._hist += other._hist
+        return self
+
+    @classmethod
+    def merged(cls, summaries: Iterable['SessionSummary']) -> 'SessionSummary':
+        out = cls()
+        for s in summaries:
+            out.merge(s)
+        return out
+
+    def __repr__(self):
+        return (f"SessionSummary(total_reps={self.total_reps}, correct_reps={self.correct_reps}, "
+                f"avg={self.average_score():.1f})")
 
     def as_dict(self) -> Dict:
+        has = self.total_reps > 0
         return {
             'total_reps': self.total_reps,
             'correct_reps': self.correct_reps,
             'incorrect_reps': self.incorrect_reps,
-            'avg_posture_score': round(self.average_score(), 2)
-        }
\ No newline at end of file
+            'avg_posture_score': round(self.average_score(), 2),
+            'std_posture_score': round(self.score_std(), 2),
+            'min_posture_score': round(self.score_min, 2) if has else 0.0,
+            'max_posture_score': round(self.score_max, 2) if has else 0.0,
+            'p50_posture_score': round(self.quantile(0.5), 2),
+            'p90_posture_score': round(self.quantile(0.9), 2),
+        }
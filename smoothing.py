@@ -0,0 +1,139 @@
+"""
+smoothing.py
+
+Temporal smoothing of pose landmarks.
+
+A One Euro filter (Casiez et al., CHI 2012) run over the whole (33, 4)
+landmark array at once: a low-pass filter whose cutoff rises with speed, so
+jitter is removed while the body is still and lag stays small during fast
+movement. Sits between PoseDetector and the exercise rules so joint angles,
+and with them RepCounter, don't flicker across the rep thresholds.
+"""
+
+import math
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from landmarks import Landmarks, NUM_LANDMARKS, VIS
+
+class OneEuroFilter:
+    """
+    Vectorized One Euro filter for pixel landmarks.
+
+    min_cutoff:     cutoff (Hz) at rest; lower = smoother but laggier
+    beta:           cutoff increase per px/s of speed; higher = less lag
+    d_cutoff:       cutoff (Hz) for the speed estimate
+    min_visibility: landmarks below this don't update the filter, they hold
+                    (and coast on) their last estimate instead
+    reset_after:    seconds a landmark may be hidden before it restarts from
+                    the raw value rather than gliding in from a stale one
+
+    Visibility is passed through unfiltered (the rules use it as a mask).
+    """
+    def __init__(self, min_cutoff: float = 1.5, beta: float = 0.01, d_cutoff: float = 1.0,
+                 min_visibility: float = 0.5, reset_after: float = 0.5):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.min_visibility = min_visibility
+        self.reset_after = reset_after
+        self.reset()
+
+    def reset(self):
+        self._x = None         # (33, 3) filtered x, y, z
+        self._dx = None        # (33, 3) filtered velocity, px/s
+        self._vis = None       # (33,) last visibility
+        self._seen = None      # (33,) time each landmark was last visible
+        self._t = None
+
+    @property
+    def params(self) -> Dict:
+        """ Settings that change the output (used in cache keys). """
+        return {
+            'filter': 'one_euro',
+            'min_cutoff': self.min_cutoff,
+            'beta': self.beta,
+            'd_cutoff': self.d_cutoff,
+            'min_visibility': self.min_visibility,
+            'reset_after': self.reset_after,
+        }
+
+    @staticmethod
+    def _alpha(dt: float, cutoff):
+        tau = 1.0 / (2.0 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def __call__(self, landmarks: Optional[Landmarks], t: Optional[float] = None) -> Optional[Landmarks]:
+        return self.filter(landmarks, t)
+
+    def filter(self, landmarks: Optional[Landmarks], t: Optional[float] = None) -> Optional[Landmarks]:
+        """
+        Smooths one frame. `t` is the frame time in seconds (defaults to
+        time.perf_counter(); pass frame_index / fps for video files).
+        None (nobody detected) resets the filter.
+        """
+        if landmarks is None:
+            self.reset()
+            return None
+        t = time.perf_counter() if t is None else t
+        raw = landmarks.data
+        x = raw[:, :VIS]
+        vis = raw[:, VIS]
+        visible = vis >= self.min_visibility
+
+        if self._x is None:
+            self._x = x.copy()
+            self._dx = np.zeros_like(x)
+            self._seen = np.where(visible, t, -np.inf)
+            self._vis = vis.copy()
+            self._t = t
+            return Landmarks(raw)
+
+        dt = t - self._t
+        if dt <= 0:
+            dt = 1e-3
+        self._t = t
+
+        # Speed estimate, low-passed at d_cutoff
+        dx = (x - self._x) / dt
+        a_d = self._alpha(dt, self.d_cutoff)
+        dx_hat = a_d * dx + (1.0 - a_d) * self._dx
+
+        # Speed-adaptive cutoff per landmark (shared across its x, y, z)
+        speed = np.linalg.norm(dx_hat[:, :2], axis=1, keepdims=True)
+        a = self._alpha(dt, self.min_cutoff + self.beta * speed)
+        x_hat = a * x + (1.0 - a) * self._x
+
+        # Hidden landmarks coast on their last velocity (decaying so they
+        # don't drift off); long-hidden ones that reappear restart from raw
+        stale = visible & (t - self._seen > self.reset_after)
+        hidden = ~visible[:, None]
+        x_hat = np.where(hidden, self._x + self._dx * dt, x_hat)
+        dx_hat = np.where(hidden, self._dx * math.exp(-dt / self.reset_after), dx_hat)
+        x_hat[stale] = x[stale]
+        dx_hat[stale] = 0.0
+
+        self._x = x_hat
+        self._dx = dx_hat
+        self._seen[visible] = t
+        self._vis = vis.copy()
+
+        out = np.empty((NUM_LANDMARKS, 4), dtype=np.float32)
+        out[:, :VIS] = x_hat
+        out[:, VIS] = vis
+        return Landmarks(out)
+
+    def predict(self, t: Optional[float] = None) -> Optional[Landmarks]:
+        """
+        Landmarks extrapolated at the filtered velocity to time `t`, for
+        frames where detection was skipped. Does not change the filter state.
+        """
+        if self._x is None:
+            return None
+        t = time.perf_counter() if t is None else t
+        out = np.empty((NUM_LANDMARKS, 4), dtype=np.float32)
+        out[:, :VIS] = self._x + self._dx * max(0.0, t - self._t)
+        out[:, VIS] = self._vis
+        return Landmarks(out)
@@ -0,0 +1,366 @@
+"""
+stream_server.py
+
+Multi-station ingestion server: one box serving a whole room of cameras.
+
+An asyncio event loop runs every local video source (camera index, video
+file, or a synthetic `test` stream) as its own task. Frames are read on a
+thread pool and detected in a FramePool of PoseDetector processes, both
+awaited, so the loop itself never blocks. Every source keeps its own rule,
+RepCounter and SessionSummary. Per-frame results are published as
+newline-delimited JSON over a unix socket (or localhost TCP) to any number of
+subscribers; slow subscribers drop their oldest messages instead of stalling
+the sources.
+
+Sources are SOURCE[=EXERCISE]: `0`, `1=pushup`, `clips/a.mp4=bicep_curl`,
+`test` (endless synthetic squats, no detector) or `test:300` (300 frames).
+A source given more than once is named SOURCE#<position> (`test#0`, `test#2`).
+Video files are replayed at their own frame rate, like a live camera.
+
+Subscribers may send one JSON command per line:
+    {"cmd": "summary"}
+    {"cmd": "set_exercise", "source": "1", "exercise": "squat", "mode": "advanced"}
+
+Usage:
+    python stream_server.py 0 1=pushup test --socket /tmp/fitness.sock
+    nc -U /tmp/fitness.sock
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+import cv2
+import numpy as np
+
+from exercise_rules import ExerciseRule, make_rule
+from landmarks import Landmarks, X, Y
+from session_summary import SessionSummary
+from synthetic_pose import synthetic_landmarks
+from utils import RepCounter
+from worker_pool import FramePool
+import config
+
+TEST_SOURCE = 'test'
+DEFAULT_SOCKET = '/tmp/fitness_tracker.sock'
+
+log = logging.getLogger(__name__)
+
+def parse_source(spec: str, default_exercise: str) -> Tuple[Union[int, str], str]:
+    """ 'SOURCE[=EXERCISE]' -> (camera index or path/test spec, exercise). """
+    src, sep, exercise = spec.rpartition('=')
+    if not sep or exercise not in config.EXERCISES:
+        src, exercise = spec, default_exercise
+    return (int(src) if src.isdigit() else src), exercise
+
+# =========================
+# Per-source state
+# =========================
+@dataclass
+class Station:
+    id: int
+    name: str
+    exercise: str
+    mode: str = 'beginner'
+    rule: Optional[ExerciseRule] = None
+    counter: RepCounter = field(default_factory=RepCounter)
+    summary: SessionSummary = field(default_factory=SessionSummary)
+    frames: int = 0
+    detected: int = 0
+
+    def __post_init__(self):
+        self.set_exercise(self.exercise, self.mode)
+
+    def set_exercise(self, exercise: str, mode: str):
+        """ Switches exercise/mode; counting starts fresh. """
+        self.exercise, self.mode = exercise, mode
+        self.rule = make_rule(exercise, mode)
+        self.counter = RepCounter()
+        self.summary = SessionSummary()
+
+    def update(self, landmarks: Optional[Landmarks], t: float) -> Dict:
+        """ Evaluates one frame and returns the message to publish. """
+        self.frames += 1
+        msg = {'source': self.name, 'exercise': self.exercise, 'frame': self.frames,
+               't': round(t, 3), 'detected': landmarks is not None}
+        if landmarks is None:
+            return msg
+        self.detected += 1
+        result = self.rule.evaluate(landmarks)
+        angle = self.rule.rep_angle(result)
+        thresh_enter, thresh_exit = self.rule.rep_thresholds
+        if angle is not None and self.counter.process(angle, thresh_enter, thresh_exit, t):
+            self.summary.push_rep(result.correct, result.score)
+            rep = self.counter.last_rep
+            msg['rep'] = {
+                'number': rep.number,
+                'correct': result.correct,
+                'score': round(result.score, 1),
+                'rom': round(rep.rom, 1),
+                'eccentric_s': round(rep.eccentric_s, 2),
+                'concentric_s': round(rep.concentric_s, 2),
+            }
+        msg.update(
+            score=round(result.score, 1),
+            correct=result.correct,
+            messages=result.messages,
+            warnings=result.warnings,
+            angle=None if angle is None else round(angle, 1),
+            reps=self.summary.total_reps,
+        )
+        return msg
+
+    def as_dict(self) -> Dict:
+        return {'exercise': self.exercise, 'mode': self.mode, 'frames': self.frames,
+                'detected_frames': self.detected, **self.summary.as_dict()}
+
+# =========================
+# Publishing
+# =========================
+class Publisher:
+    """
+    Fans messages out to socket subscribers, one bounded queue each; a full
+    queue drops its oldest line so a slow client never blocks the sources.
+    """
+    def __init__(self, queue_size: int = 256, on_command=None):
+        self.queue_size = queue_size
+        self.on_command = on_command
+        self.clients: Set[asyncio.Queue] = set()
+        self.dropped = 0
+
+    def publish(self, msg: Dict):
+        if not self.clients:
+            return
+        line = (json.dumps(msg) + '\n').encode()
+        for queue in self.clients:
+            self._put(queue, line)
+
+    def _put(self, queue: asyncio.Queue, line: bytes):
+        if queue.full():
+            queue.get_nowait()
+            self.dropped += 1
+        queue.put_nowait(line)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """ Connection callback for asyncio.start_unix_server / start_server. """
+        queue = asyncio.Queue(self.queue_size)
+        self.clients.add(queue)
+        commands = asyncio.create_task(self._read_commands(reader, queue))
+        try:
+            while True:
+                writer.write(await queue.get())
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.clients.discard(queue)
+            commands.cancel()
+            writer.close()
+
+    async def _read_commands(self, reader: asyncio.StreamReader, queue: asyncio.Queue):
+        while line := await reader.readline():
+            try:
+                reply = self.on_command(json.loads(line)) if self.on_command else None
+            except (ValueError, KeyError, TypeError) as e:
+                reply = {'error': f"bad command: {e}"}
+            if reply is not None:
+                self._put(queue, (json.dumps(reply) + '\n').encode())
+
+    async def flush(self, timeout: float = 1.0):
+        """ Waits (up to `timeout`) for subscribers to receive what's queued. """
+        deadline = time.perf_counter() + timeout
+        while any(not q.empty() for q in self.clients) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+
+# =========================
+# Server
+# =========================
+def _read_frame(cap: cv2.VideoCapture, width: Optional[int]) -> Tuple[bool, Optional[np.ndarray], float]:
+    """ Reads and downscales one frame (runs on the I/O pool). """
+    ok, frame = cap.read()
+    if not ok:
+        return False, None, 1.0
+    w = frame.shape[1]
+    if width and w > width:
+        h = max(1, round(frame.shape[0] * width / w))
+        return True, cv2.resize(frame, (width, h), interpolation=cv2.INTER_LINEAR), w / width
+    return True, frame, 1.0
+
+class StreamServer:
+    """
+    Runs many sources concurrently and publishes their results.
+
+        server = StreamServer([(0, 'squat'), ('test', 'squat')], socket_path='/tmp/fitness.sock')
+        asyncio.run(server.run())
+
+    inference_width: frames are downscaled to this width before they go to
+                     the detector processes (less to pickle, faster models);
+                     landmarks come back in full-frame pixels
+    """
+    def __init__(self, sources: List[Tuple[Union[int, str], str]], mode: str = 'beginner',
+                 workers: Optional[int] = None, inference_width: Optional[int] = 640,
+                 socket_path: Optional[str] = DEFAULT_SOCKET, port: Optional[int] = None,
+                 **detector_kwargs):
+        self.sources = [src for src, _ in sources]
+        self.stations = [Station(i, name, ex, mode)
+                         for i, (name, (_, ex)) in enumerate(zip(self._names(self.sources), sources))]
+        self.inference_width = inference_width
+        self.socket_path = socket_path
+        self.port = port
+        # Pool stream ids are camera ordinals, so cameras spread over every shard
+        # whatever test sources sit between them
+        self._streams = {st.id: k for k, st in
+                         enumerate(st for st, src in zip(self.stations, self.sources) if not self._is_test(src))}
+        cameras = len(self._streams)
+        self.pool = FramePool(min(workers or os.cpu_count(), cameras), **detector_kwargs) if cameras else None
+        self.publisher = Publisher(on_command=self.command)
+        self._io = ThreadPoolExecutor(max_workers=max(1, len(self.sources)), thread_name_prefix='capture')
+
+    @staticmethod
+    def _names(sources: List[Union[int, str]]) -> List[str]:
+        """ Station names: str(source), plus '#<index>' where several sources share one. """
+        names = [str(src) for src in sources]
+        return [f"{name}#{i}" if names.count(name) > 1 else name for i, name in enumerate(names)]
+
+    @staticmethod
+    def _is_test(source) -> bool:
+        return isinstance(source, str) and source.split(':')[0] == TEST_SOURCE
+
+    def station(self, name: str) -> Optional[Station]:
+        return next((st for st in self.stations if st.name == name), None)
+
+    def summaries(self) -> Dict[str, Dict]:
+        return {st.name: st.as_dict() for st in self.stations}
+
+    def command(self, cmd: Dict) -> Optional[Dict]:
+        """ Handles a subscriber command; the reply goes to that subscriber only. """
+        if cmd['cmd'] == 'summary':
+            return {'summaries': self.summaries()}
+        if cmd['cmd'] == 'set_exercise':
+            st = self.station(str(cmd['source']))
+            if st is None:
+                return {'error': f"unknown source: {cmd['source']}"}
+            if cmd['exercise'] not in config.EXERCISES:
+                return {'error': f"unknown exercise: {cmd['exercise']}"}
+            st.set_exercise(cmd['exercise'], cmd.get('mode', st.mode))
+            return {'ok': True, 'source': st.name, 'exercise': st.exercise, 'mode': st.mode}
+        return {'error': f"unknown command: {cmd['cmd']}"}
+
+    # --- Sources ---
+    async def _run_camera(self, station: Station, source: Union[int, str]):
+        loop = asyncio.get_running_loop()
+        cap = await loop.run_in_executor(self._io, cv2.VideoCapture, source)
+        if not cap.isOpened():
+            self.publisher.publish({'source': station.name, 'event': 'error', 'error': f"Cannot open source: {source}"})
+            return
+        # Files replay at their frame rate and use frame time; cameras use the clock
+        is_file = isinstance(source, str)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        stream = self._streams[station.id]
+        start = time.perf_counter()
+        try:
+            while True:
+                ok, frame, scale = await loop.run_in_executor(self._io, _read_frame, cap, self.inference_width)
+                if not ok:
+                    break
+                t = station.frames / fps if is_file else time.perf_counter() - start
+                data = await asyncio.wrap_future(self.pool.submit(stream, frame))
+                landmarks = None
+                if data is not None:
+                    data[:, [X, Y]] *= scale
+                    landmarks = Landmarks(data)
+                self.publisher.publish(station.update(landmarks, t))
+                if is_file:
+                    await asyncio.sleep(max(0.0, start + station.frames / fps - time.perf_counter()))
+        finally:
+            cap.release()
+            self.pool.release(stream)
+
+    async def _run_test(self, station: Station, source: str, fps: float = 30.0):
+        # Synthetic squat/curl figure (see synthetic_pose.py); no detector needed
+        _, _, limit = source.partition(':')
+        limit = int(limit) if limit else None
+        frames = synthetic_landmarks(300, fps=fps, seed=station.id)
+        start = time.perf_counter()
+        while limit is None or station.frames < limit:
+            t = station.frames / fps
+            self.publisher.publish(station.update(Landmarks(frames[station.frames % len(frames)]), t))
+            await asyncio.sleep(max(0.0, start + station.frames / fps - time.perf_counter()))
+
+    async def _run_source(self, station: Station, source):
+        # A failing source (bad URL, decode error, detector crash) ends only its own station
+        try:
+            if self._is_test(source):
+                await self._run_test(station, source)
+            else:
+                await self._run_camera(station, source)
+        except Exception as e:
+            log.exception("source %s failed", station.name)
+            self.publisher.publish({'source': station.name, 'event': 'error', 'error': f"{type(e).__name__}: {e}"})
+        finally:
+            self.publisher.publish({'source': station.name, 'event': 'end', 'summary': station.as_dict()})
+
+    # --- Lifecycle ---
+    async def _listen(self):
+        if self.port is not None:
+            return await asyncio.start_server(self.publisher.handle, '127.0.0.1', self.port)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # stale socket from an earlier run
+        return await asyncio.start_unix_server(self.publisher.handle, self.socket_path)
+
+    async def run(self):
+        """ Serves until every source has ended (cameras: until cancelled). """
+        server = await self._listen()
+        if self.pool is not None:
+            self.pool.start()
+        try:
+            await asyncio.gather(*(self._run_source(st, src) for st, src in zip(self.stations, self.sources)))
+            self.publisher.publish({'event': 'done', 'summaries': self.summaries()})
+            await self.publisher.flush()
+        finally:
+            server.close()
+            await server.wait_closed()
+            if self.pool is not None:
+                self.pool.close()
+            self._io.shutdown(wait=False)
+            if self.port is None and os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve rep counts and form scores for many cameras at once.")
+    parser.add_argument('sources', nargs='+', metavar='SOURCE[=EXERCISE]',
+                        help="Camera index, video file, or test[:FRAMES]; optional per-source exercise")
+    parser.add_argument('--exercise', choices=sorted(config.EXERCISES), default='squat',
+                        help="Exercise for sources without one")
+    parser.add_argument('--mode', choices=list(config.MODES), default='beginner')
+    parser.add_argument('--workers', type=int, default=None, help="Detector processes (default: CPU count)")
+    parser.add_argument('--inference-width', type=int, default=640,
+                        help="Downscale frames to this width before detection (0 = native)")
+    parser.add_argument('--model-complexity', type=int, choices=[0, 1, 2], default=1)
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix socket to publish results on")
+    parser.add_argument('--port', type=int, default=None,
+                        help="Publish on 127.0.0.1:PORT (TCP) instead of a unix socket")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    server = StreamServer([parse_source(s, args.exercise) for s in args.sources], mode=args.mode,
+                          workers=args.workers, inference_width=args.inference_width or None,
+                          socket_path=args.socket, port=args.port,
+                          model_complexity=args.model_complexity)
+    where = f"127.0.0.1:{args.port}" if args.port is not None else args.socket
+    print(f"Serving {len(server.stations)} source(s) on {where}")
+    try:
+        asyncio.run(server.run())
+    except KeyboardInterrupt:
+        pass
+    for name, summary in server.summaries().items():
+        print(f"{name}: {summary['total_reps']} reps, avg form {summary['avg_posture_score']:.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+synthetic_pose.py
+
+Synthetic landmark sequences: a side-view figure doing squats and curls.
+
+Used wherever a moving person is needed without a camera or a model: the
+benchmarks, the stream server's `test` source and the inference service's
+stub detector.
+"""
+
+import math
+
+import numpy as np
+
+from landmarks import JOINT_INDEX, NUM_LANDMARKS
+
+def _limb(origin, length, angle_deg):
+    a = math.radians(angle_deg)
+    return origin[0] + length * math.cos(a), origin[1] + length * math.sin(a)
+
+def synthetic_landmarks(n_frames: int = 300, width: int = 640, height: int = 480,
+                        seed: int = 0, fps: float = 30.0) -> np.ndarray:
+    """
+    (N, 33, 4) side-view figure doing squats and curls (knee and elbow
+    sweep through their rep ranges every ~3 s) with pixel jitter, so every
+    rule and RepCounter sees realistic transitions.
+    """
+    rng = np.random.default_rng(seed)
+    out = np.zeros((n_frames, NUM_LANDMARKS, 4), dtype=np.float32)
+    scale = height / 480.0
+    for i in range(n_frames):
+        phase = 0.5 - 0.5 * math.cos(2 * math.pi * i / (3.0 * fps))  # 0 = top, 1 = bottom
+        knee_flex = 100.0 * phase
+        elbow_flex = 130.0 * phase
+        pts = {}
+        hip = (width * 0.5, height * 0.55 + 60 * scale * phase)
+        pts['hip'] = hip
+        pts['knee'] = _limb(hip, 90 * scale, 90 - knee_flex * 0.5)
+        pts['ankle'] = _limb(pts['knee'], 90 * scale, 90 + knee_flex * 0.5)
+        pts['shoulder'] = _limb(hip, 130 * scale, -90 + knee_flex * 0.3)
+        pts['elbow'] = _limb(pts['shoulder'], 70 * scale, 90)
+        pts['wrist'] = _limb(pts['elbow'], 65 * scale, 90 - elbow_flex)
+        frame = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+        frame[:, :2] = pts['shoulder']  # face/hand/foot points sit near their parents
+        frame[:, 3] = 0.95
+        for side in ('left', 'right'):
+            for joint in ('shoulder', 'elbow', 'wrist', 'hip', 'knee', 'ankle'):
+                frame[JOINT_INDEX[f'{side}_{joint}'], :2] = pts[joint]
+        frame[:, :2] += rng.normal(0, 1.5 * scale, (NUM_LANDMARKS, 2))
+        out[i] = frame
+    return out
\ No newline at end of file
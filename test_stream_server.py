@@ -0,0 +1,28 @@
+"""
+test_stream_server.py
+
+Station naming in the multi-station server (run with pytest).
+"""
+
+import asyncio
+
+from stream_server import StreamServer, parse_source
+
+def _server(specs, tmp_path):
+    return StreamServer([parse_source(s, 'squat') for s in specs], socket_path=str(tmp_path / 'ss.sock'))
+
+def test_duplicate_sources_get_unique_names(tmp_path):
+    server = _server(['test:5', 'test:5=bicep_curl', 'test:3'], tmp_path)
+    assert [st.name for st in server.stations] == ['test:5#0', 'test:5#1', 'test:3']
+    asyncio.run(server.run())
+    summaries = server.summaries()
+    assert len(summaries) == 3
+    assert summaries['test:5#0']['exercise'] == 'squat'
+    assert summaries['test:5#1']['exercise'] == 'bicep_curl'
+
+def test_set_exercise_targets_one_duplicate(tmp_path):
+    server = _server(['test:5', 'test:5'], tmp_path)
+    reply = server.command({'cmd': 'set_exercise', 'source': 'test:5#1', 'exercise': 'pushup'})
+    assert reply['ok'] and reply['source'] == 'test:5#1'
+    assert [st.exercise for st in server.stations] == ['squat', 'pushup']
+    assert 'error' in server.command({'cmd': 'set_exercise', 'source': 'test:5', 'exercise': 'pushup'})
@@ -0,0 +1,176 @@
+"""
+tracking.py
+
+Multi-person tracking for group workouts.
+
+Associates the poses of each frame (e.g. from MultiPoseDetector) with
+persistent track IDs using bounding-box IoU, falling back to centroid
+distance for fast movers, and keeps RollingStability, RepCounter and
+SessionSummary state per track. Rule evaluation for all people in a frame
+is batched into one angle computation.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from angle_calculation import RollingStability
+from exercise_rules import PoseCheckResult, make_rule
+from landmarks import Landmarks, NUM_LANDMARKS, X, Y, VIS
+from session_summary import SessionSummary
+from utils import RepCounter
+
+def pose_boxes(poses: np.ndarray, min_visibility: float = 0.3) -> np.ndarray:
+    """
+    (P, 4) bounding boxes (x0, y0, x1, y1) of the visible landmarks of
+    (P, 33, 4) poses. Rows with fewer than 4 visible points are NaN.
+    """
+    poses = np.asarray(poses, dtype=np.float32)
+    visible = poses[..., VIS] > min_visibility
+    x, y = poses[..., X], poses[..., Y]
+    with np.errstate(invalid='ignore'):
+        boxes = np.stack([
+            np.where(visible, x, np.inf).min(axis=-1),
+            np.where(visible, y, np.inf).min(axis=-1),
+            np.where(visible, x, -np.inf).max(axis=-1),
+            np.where(visible, y, -np.inf).max(axis=-1),
+        ], axis=-1)
+    boxes[visible.sum(axis=-1) < 4] = np.nan
+    return boxes
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """ (A, B) IoU matrix between two sets of (x0, y0, x1, y1) boxes. """
+    a = a[:, None, :]
+    b = b[None, :, :]
+    iw = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    ih = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = iw * ih
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+def _greedy_match(score: np.ndarray, valid: np.ndarray, descending: bool) -> List:
+    """ Greedy one-to-one assignment over a (T, P) score matrix. """
+    rows, cols = np.nonzero(valid)
+    order = np.argsort(score[rows, cols])
+    if descending:
+        order = order[::-1]
+    used_r, used_c, pairs = set(), set(), []
+    for k in order:
+        r, c = int(rows[k]), int(cols[k])
+        if r not in used_r and c not in used_c:
+            used_r.add(r)
+            used_c.add(c)
+            pairs.append((r, c))
+    return pairs
+
+@dataclass
+class Track:
+    id: int
+    box: np.ndarray
+    landmarks: Optional[Landmarks] = None
+    rolling: RollingStability = field(default_factory=RollingStability)
+    counters: Dict[str, RepCounter] = field(default_factory=lambda: defaultdict(RepCounter))
+    summaries: Dict[str, SessionSummary] = field(default_factory=lambda: defaultdict(SessionSummary))
+    result: Optional[PoseCheckResult] = None
+    angle: Optional[float] = None
+    hits: int = 0
+    missed: int = 0
+
+    @property
+    def visible(self) -> bool:
+        return self.missed == 0
+
+class PoseTracker:
+    """
+    Keeps stable IDs and per-person workout state across frames.
+
+        tracker = PoseTracker('squat')
+        for track in tracker.update(detector.detect(frame)['poses']):
+            track.id, track.result.score, track.summaries['squat'].total_reps
+
+    iou_thresh:   minimum box IoU to continue a track
+    max_distance: centroid fallback, as a fraction of the track's box diagonal
+    max_missed:   frames a track survives without a match (occlusion)
+    """
+    def __init__(self, exercise: str, mode: str = 'beginner', iou_thresh: float = 0.3,
+                 max_distance: float = 0.5, max_missed: int = 15):
+        self.iou_thresh = iou_thresh
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.tracks: List[Track] = []
+        self._next_id = 1
+        self.set_exercise(exercise, mode)
+
+    def set_exercise(self, exercise: str, mode: str = 'beginner'):
+        """ Switches exercise/mode; rep counts per exercise are kept per track. """
+        self.exercise = exercise
+        self.mode = mode
+        self.rule = make_rule(exercise, mode)
+        for track in self.tracks:
+            track.rolling = RollingStability()
+
+    def _associate(self, boxes: np.ndarray) -> List:
+        if not self.tracks or not len(boxes):
+            return []
+        prev = np.stack([t.box for t in self.tracks])
+        iou = box_iou(prev, boxes)
+        pairs = _greedy_match(iou, iou >= self.iou_thresh, descending=True)
+
+        # Centroid fallback for whatever IoU left unmatched
+        free_t = [i for i in range(len(prev)) if i not in {r for r, _ in pairs}]
+        free_p = [j for j in range(len(boxes)) if j not in {c for _, c in pairs}]
+        if free_t and free_p:
+            pt, pb = prev[free_t], boxes[free_p]
+            ct = (pt[:, :2] + pt[:, 2:]) * 0.5
+            cb = (pb[:, :2] + pb[:, 2:]) * 0.5
+            dist = np.linalg.norm(ct[:, None] - cb[None], axis=-1)
+            diag = np.linalg.norm(pt[:, 2:] - pt[:, :2], axis=-1)[:, None]
+            near = dist <= self.max_distance * np.maximum(diag, 1.0)
+            pairs += [(free_t[r], free_p[c]) for r, c in _greedy_match(dist, near, descending=False)]
+        return pairs
+
+    def update(self, poses: np.ndarray) -> List[Track]:
+        """
+        Matches this frame's (P, 33, 4) poses to tracks, evaluates the rule
+        for every matched person in one batch and counts reps.
+        Returns the tracks seen in this frame.
+        """
+        poses = np.asarray(poses, dtype=np.float32).reshape(-1, NUM_LANDMARKS, 4)
+        boxes = pose_boxes(poses)
+        keep = ~np.isnan(boxes[:, 0])
+        poses, boxes = poses[keep], boxes[keep]
+
+        pairs = self._associate(boxes)
+        matched = {c: self.tracks[r] for r, c in pairs}
+        for track in self.tracks:
+            track.missed += 1
+        for j in range(len(poses)):
+            if j not in matched:
+                matched[j] = Track(self._next_id, boxes[j])
+                self._next_id += 1
+                self.tracks.append(matched[j])
+
+        order = sorted(matched)
+        seen = [matched[j] for j in order]
+        results = self.rule.evaluate_batch(poses[order], [t.rolling for t in seen])
+        thresh_enter, thresh_exit = self.rule.rep_thresholds
+        for j, track, result in zip(order, seen, results):
+            track.box = boxes[j]
+            track.landmarks = Landmarks(poses[j])
+            track.result = result
+            track.hits += 1
+            track.missed = 0
+            track.angle = self.rule.rep_angle(result)
+            if track.angle is not None and track.counters[self.exercise].process(track.angle, thresh_enter, thresh_exit):
+                track.summaries[self.exercise].push_rep(result.correct, result.score)
+
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+        return sorted(seen, key=lambda t: t.id)
+
+    def summaries(self, exercise: Optional[str] = None) -> Dict[int, Dict]:
+        """ {track id: SessionSummary.as_dict()} for one exercise. """
+        exercise = exercise or self.exercise
+        return {t.id: t.summaries[exercise].as_dict() for t in self.tracks}
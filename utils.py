@@ -1,47 +1,243 @@
+import math
+from typing import List, NamedTuple, Optional, Tuple
+
 import cv2
+import numpy as np
+
+from profiler import PROFILER
+from renderer import OverlayRenderer
+
+class Rep(NamedTuple):
+    """
+    One completed rep. Times are in seconds (frame time or wall clock,
+    whatever was passed to RepCounter.process).
+    """
+    number: int
+    start_t: float      # left the top (eccentric starts)
+    bottom_t: float     # entered the peak / bottom
+    rise_t: float       # last frame in the bottom (concentric starts)
+    end_t: float        # back at the top, rep counted
+    min_angle: float
+    max_angle: float
+
+    @property
+    def rom(self) -> float:
+        """ Range of motion in degrees. """
+        return self.max_angle - self.min_angle
+
+    @property
+    def eccentric_s(self) -> float:
+        return self.bottom_t - self.start_t
+
+    @property
+    def bottom_s(self) -> float:
+        return self.rise_t - self.bottom_t
+
+    @property
+    def concentric_s(self) -> float:
+        return self.end_t - self.rise_t
+
+    @property
+    def duration_s(self) -> float:
+        return self.end_t - self.start_t
 
 class RepCounter:
     """
     Generic State Machine for Rep counting.
     State 0: Rest (Extended/Standing)
     State 1: Peak (Flexed/Deep)
+
+    A transition needs `min_frames` consecutive samples past its threshold
+    (debounce; 1 = switch on the first sample). Alongside the count it
+    tracks the phase ('top', 'eccentric', 'bottom', 'concentric') and keeps
+    a Rep record (timestamps, min/max angle) per completed rep.
+    O(1) work per sample.
     """
-    def __init__(self):
+    def __init__(self, min_frames: int = 1, fps: float = 30.0):
+        self.min_frames = max(1, min_frames)
+        self.fps = fps
+        self.reset()
+
+    def reset(self):
         self.in_peak = False
-    
-    def process(self, val_now, thresh_enter_peak, thresh_exit_peak):
+        self.phase = 'top'
+        self.frames = 0
+        self.reps: List[Rep] = []
+        self._run = 0           # consecutive samples past the pending threshold
+        self._run_t = 0.0       # time of the first of them
+        self._top_t = None      # last time at the top
+        self._bottom_t = 0.0
+        self._rise_t = 0.0
+        self._min = math.inf
+        self._max = -math.inf
+
+    @property
+    def count(self) -> int:
+        return len(self.reps)
+
+    @property
+    def last_rep(self) -> Optional[Rep]:
+        return self.reps[-1] if self.reps else None
+
+    def process(self, val_now, thresh_enter_peak, thresh_exit_peak, t: Optional[float] = None):
         """
         Returns True if a full rep (Rest -> Peak -> Rest) just completed.
+        `t` is the sample time in seconds (default: frame count / fps).
         """
+        t = self.frames / self.fps if t is None else t
+        self.frames += 1
+        if self._top_t is None:
+            self._top_t = t
+        if val_now < self._min: self._min = val_now
+        if val_now > self._max: self._max = val_now
+        
         completed_rep = False
         
-        # Transition to Peak (Down/Flexed)
-        if not self.in_peak and val_now < thresh_enter_peak:
-            self.in_peak = True
-            
-        # Transition to Rest (Up/Extended)
-        elif self.in_peak and val_now > thresh_exit_peak:
-            self.in_peak = False
-            completed_rep = True
+        if not self.in_peak:
+            # Transition to Peak (Down/Flexed)
+            if val_now < thresh_enter_peak:
+                if not self._run:
+                    self._run_t = t
+                self._run += 1
+                if self._run >= self.min_frames:
+                    self.in_peak = True
+                    self.phase = 'bottom'
+                    self._bottom_t = self._run_t
+                    self._rise_t = t
+                    self._run = 0
+            else:
+                self._run = 0
+                if val_now > thresh_exit_peak:
+                    self.phase = 'top'
+                    self._top_t = t
+                else:
+                    self.phase = 'eccentric'
+        else:
+            # Transition to Rest (Up/Extended)
+            if val_now > thresh_exit_peak:
+                if not self._run:
+                    self._run_t = t
+                self._run += 1
+                if self._run >= self.min_frames:
+                    self.reps.append(Rep(len(self.reps) + 1, self._top_t, self._bottom_t, self._rise_t,
+                                         self._run_t, self._min, self._max))
+                    self.in_peak = False
+                    self.phase = 'top'
+                    self._top_t = t
+                    self._min = self._max = val_now
+                    self._run = 0
+                    completed_rep = True
+            else:
+                self._run = 0
+                if val_now < thresh_enter_peak:
+                    self.phase = 'bottom'
+                    self._rise_t = t
+                else:
+                    self.phase = 'concentric'
             
         return completed_rep
 
+    def process_array(self, angles: np.ndarray, thresh_enter_peak, thresh_exit_peak,
+                      times: Optional[np.ndarray] = None) -> List[Rep]:
+        """
+        Feeds a whole angle series (NaN = no angle, skipped) through the
+        state machine and returns the reps completed in it. `times` defaults
+        to frame index / fps.
+        """
+        angles = np.asarray(angles, dtype=np.float64)
+        if times is None:
+            times = (self.frames + np.arange(len(angles))) / self.fps
+        start = len(self.reps)
+        for val, t in zip(angles.tolist(), np.asarray(times, dtype=np.float64).tolist()):
+            if val == val:  # not NaN
+                self.process(val, thresh_enter_peak, thresh_exit_peak, t)
+        return self.reps[start:]
+
+def _run_lengths(mask: np.ndarray) -> np.ndarray:
+    """ Length of the run of True ending at each element (0 where False). """
+    idx = np.arange(len(mask))
+    last_false = np.maximum.accumulate(np.where(mask, -1, idx))
+    return np.where(mask, idx - last_false, 0)
+
+def _last_true(mask: np.ndarray, at: np.ndarray) -> np.ndarray:
+    """ Index of the most recent True at or before each index in `at` (-1 if none). """
+    hits = np.flatnonzero(mask)
+    k = np.searchsorted(hits, at, side='right') - 1
+    return np.where(k >= 0, hits[np.maximum(k, 0)] if len(hits) else -1, -1)
+
+def segment_reps(angles: np.ndarray, thresh_enter_peak: float, thresh_exit_peak: float,
+                 min_frames: int = 1, times: Optional[np.ndarray] = None,
+                 fps: float = 30.0) -> Tuple[np.ndarray, List[Rep]]:
+    """
+    Vectorized RepCounter for a whole angle series (NaN = no angle).
+    Finds every rep from threshold crossings without a per-frame Python
+    loop and gives exactly what a fresh RepCounter(min_frames, fps) would
+    from process_array() with the same thresholds and times.
+    Returns (frame index each rep was counted on, Rep records).
+    """
+    angles = np.asarray(angles, dtype=np.float64)
+    if thresh_enter_peak > thresh_exit_peak:
+        raise ValueError("thresh_enter_peak must not exceed thresh_exit_peak")
+    times = np.arange(len(angles)) / fps if times is None else np.asarray(times, dtype=np.float64)
+    frames = np.flatnonzero(~np.isnan(angles))  # NaN samples are skipped, as in process_array
+    v, t = angles[frames], times[frames]
+    n = max(1, min_frames)
+
+    below = v < thresh_enter_peak
+    above = v > thresh_exit_peak
+    # A transition fires on the n-th consecutive sample past its threshold.
+    # Every transition lands on a sample of the opposite class, so global
+    # run lengths equal the state machine's debounce counters.
+    if n > 1:
+        enter_ok = below & (_run_lengths(below) >= n)
+        exit_ok = above & (_run_lengths(above) >= n)
+    else:
+        enter_ok, exit_ok = below, above
+
+    # Hysteresis: keep only events whose kind differs from the previous one
+    events = np.flatnonzero(enter_ok | exit_ok)
+    kind = enter_ok[events]
+    changed = kind != np.concatenate(([False], kind[:-1]))
+    enters = events[changed & kind]
+    exits = events[changed & ~kind]
+    m = len(exits)
+    if not m:
+        return np.empty(0, dtype=np.intp), []
+    enters = enters[:m]
+
+    prev_end = np.concatenate(([0], exits[:-1]))
+    start = np.maximum(_last_true(above, enters), prev_end)
+    rise = _last_true(below, exits)
+    # Min/max since the previous rep was counted, both ends inclusive
+    head = v[:exits[-1] + 1]
+    lo = np.minimum(np.minimum.reduceat(head, prev_end), v[exits])
+    hi = np.maximum(np.maximum.reduceat(head, prev_end), v[exits])
+
+    reps = [Rep(k + 1, *vals) for k, vals in enumerate(zip(
+        t[start].tolist(), t[enters - n + 1].tolist(), t[rise].tolist(),
+        t[exits - n + 1].tolist(), lo.tolist(), hi.tolist()))]
+    return frames[exits], reps
+
+def encode_jpeg(frame: np.ndarray, width: Optional[int] = None, quality: int = 75) -> bytes:
+    """
+    JPEG bytes of a BGR frame, downscaled to `width` first if it is wider.
+    Used to stream the dashboard video cheaply.
+    """
+    h, w = frame.shape[:2]
+    if width and w > width:
+        frame = cv2.resize(frame, (width, round(h * width / w)), interpolation=cv2.INTER_LINEAR)
+    ok, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return buf.tobytes()
+
+# Banner, score and labels come from cached layers (see renderer.py)
+_overlay = OverlayRenderer()
+
 def draw_overlay(frame, result, reps, mode, exercise_name):
-    # Overlay Box (Top Banner)
-    cv2.rectangle(frame, (0, 0), (frame.shape[1], 80), (30, 30, 30), -1)
-    
-    # Stats
-    score = int(result.score) if result else 0
-    
-    cv2.putText(frame, f"{exercise_name.upper()} ({mode})", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-    cv2.putText(frame, f"Reps: {reps}", (10, 65), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 0), 2)
-    cv2.putText(frame, f"Form: {score}%", (200, 65), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
-
-    # Feedback Messages
-    if result:
-        y = 30
-        for msg in result.messages:
-            cv2.putText(frame, msg, (400, y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 165, 255), 2)
-            y += 30
-        for warn in result.warnings:
-            cv2.putText(frame, warn, (400, y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
\ No newline at end of file
+    # Top banner (exercise, reps, form score) and feedback messages
+    _overlay.draw(frame, result, reps, mode, exercise_name)
+
+    # Debug overlay: per-stage latency percentiles (profiler enabled)
+    if PROFILER.enabled:
+        PROFILER.draw(frame)
\ No newline at end of file
@@ -0,0 +1,327 @@
+"""
+worker_pool.py
+
+Multi-process pose detection.
+
+A single PoseDetector wraps one MediaPipe graph used serially, so one process
+tops out at roughly one core. These pools run one PoseDetector per worker
+process and hand landmarks back to the parent through shared memory
+((N, 33, 4) float32 blocks) rather than pickling frames or landmark lists.
+
+LandmarkPool  - shards video files across workers (offline analysis)
+StreamPool    - shards live camera sources across workers and publishes the
+                latest landmarks of every stream in one shared array
+FramePool     - per-frame detection for callers that own the capture (e.g.
+                the asyncio stream server); each stream sticks to one worker
+"""
+
+import multiprocessing
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from landmarks import Landmarks, NUM_LANDMARKS
+
+# Spawn keeps MediaPipe/OpenCV state out of the children regardless of platform
+_CTX = multiprocessing.get_context('spawn')
+
+# Per-process detector, created once by the pool initializer
+_detector = None
+
+def _init_worker(detector_kwargs: Dict):
+    global _detector
+    from pose_detection import PoseDetector
+    _detector = PoseDetector(**detector_kwargs)
+
+def _to_shared(arr: np.ndarray) -> Optional[str]:
+    """ Copies an array into a new shared memory block and returns its name. """
+    if arr.nbytes == 0:
+        return None
+    shm = shared_memory.SharedMemory(create=True, size=arr.nbytes)
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+    name = shm.name
+    shm.close()  # the parent unlinks it after reading
+    return name
+
+def _from_shared(name: Optional[str], n_frames: int) -> np.ndarray:
+    shape = (n_frames, NUM_LANDMARKS, 4)
+    if name is None:
+        return np.empty(shape, dtype=np.float32)
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return np.ndarray(shape, dtype=np.float32, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+def _discard_shared(name: Optional[str]):
+    """ Unlinks a result block nobody is going to read. """
+    if name is not None:
+        shm = shared_memory.SharedMemory(name=name)
+        shm.close()
+        shm.unlink()
+
+def _extract_task(path: str) -> Tuple:
+    t0 = time.perf_counter()
+    try:
+        frames, fps = _detector.detect_video(path)
+    except Exception as e:
+        # One bad clip must not abort imap_unordered for every other video
+        error = str(e) if isinstance(e, OSError) else f"{type(e).__name__}: {e}"
+        return path, None, 0, 0.0, time.perf_counter() - t0, error
+    return path, _to_shared(frames), len(frames), fps, time.perf_counter() - t0, None
+
+@dataclass
+class ExtractedVideo:
+    path: str
+    frames: Optional[np.ndarray]  # (N, 33, 4) float32, NaN rows = no detection
+    fps: float
+    elapsed_s: float
+    error: Optional[str] = None
+
+class LandmarkPool:
+    """
+    Process pool with one PoseDetector per worker for offline video files.
+
+        with LandmarkPool(workers=8) as pool:
+            for video in pool.extract(paths):
+                ...
+    """
+    def __init__(self, workers: Optional[int] = None, **detector_kwargs):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.detector_kwargs = detector_kwargs
+        self._pool = None
+
+    def start(self):
+        if self._pool is None:
+            self._pool = _CTX.Pool(self.workers, initializer=_init_worker,
+                                   initargs=(self.detector_kwargs,))
+        return self
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def extract(self, paths: Sequence[str]) -> Iterator[ExtractedVideo]:
+        """
+        Yields an ExtractedVideo per path, in completion order. If the caller
+        stops early, the remaining results are waited for and their shared
+        memory is released.
+        """
+        self.start()
+        # chunksize=1: clips vary wildly in length, keep shards balanced
+        results = self._pool.imap_unordered(_extract_task, paths, chunksize=1)
+        try:
+            for path, name, n, fps, elapsed, error in results:
+                if error:
+                    yield ExtractedVideo(path, None, 0.0, elapsed, error)
+                else:
+                    yield ExtractedVideo(path, _from_shared(name, n), fps, elapsed)
+        finally:
+            for _, name, *_ in results:
+                _discard_shared(name)
+
+
+# =========================
+# Live streams
+# =========================
+# Shared layout per stream slot: landmarks (33, 4) float32 plus a meta row of
+# float64 (seq, timestamp, detected). seq is a seqlock: odd while a writer is
+# mid-update, so readers retry instead of seeing a torn frame.
+_META_SEQ, _META_TIME, _META_DETECTED = 0, 1, 2
+
+def _stream_worker(slots: List[int], sources: List, lm_name: str, meta_name: str,
+                   n_streams: int, detector_kwargs: Dict, stop):
+    import cv2
+    from pose_detection import PoseDetector
+
+    lm_shm = shared_memory.SharedMemory(name=lm_name)
+    meta_shm = shared_memory.SharedMemory(name=meta_name)
+    lms = np.ndarray((n_streams, NUM_LANDMARKS, 4), dtype=np.float32, buffer=lm_shm.buf)
+    meta = np.ndarray((n_streams, 3), dtype=np.float64, buffer=meta_shm.buf)
+
+    # One detector per stream: MediaPipe tracking state is per video sequence
+    caps = [cv2.VideoCapture(src) for src in sources]
+    detectors = [PoseDetector(**detector_kwargs) for _ in sources]
+    try:
+        while not stop.is_set() and caps:
+            got_frame = False
+            for slot, cap, det in zip(slots, caps, detectors):
+                ret, frame = cap.read()
+                if not ret:
+                    continue
+                got_frame = True
+                lm = det.detect(frame, draw=False)['landmarks']
+                meta[slot, _META_SEQ] += 1
+                if lm is not None:
+                    lms[slot] = lm.data
+                meta[slot, _META_DETECTED] = lm is not None
+                meta[slot, _META_TIME] = time.time()
+                meta[slot, _META_SEQ] += 1
+            if not got_frame:
+                time.sleep(0.01)  # all sources stalled or ended
+    finally:
+        for cap in caps:
+            cap.release()
+        for det in detectors:
+            det.close()
+        del lms, meta
+        lm_shm.close()
+        meta_shm.close()
+
+class StreamPool:
+    """
+    Shards live sources (camera indices, stream URLs, files) across worker
+    processes. Each worker owns its sources and detectors and writes the
+    newest landmarks for each stream into one shared (S, 33, 4) array;
+    the parent reads them without any per-frame IPC.
+    """
+    def __init__(self, sources: Sequence[Union[int, str]], workers: Optional[int] = None, **detector_kwargs):
+        self.sources = list(sources)
+        self.workers = max(1, min(workers or multiprocessing.cpu_count(), len(self.sources)))
+        self.detector_kwargs = detector_kwargs
+        n = len(self.sources)
+        self._lm_shm = shared_memory.SharedMemory(create=True, size=max(1, n * NUM_LANDMARKS * 4 * 4))
+        self._meta_shm = shared_memory.SharedMemory(create=True, size=max(1, n * 3 * 8))
+        self._lms = np.ndarray((n, NUM_LANDMARKS, 4), dtype=np.float32, buffer=self._lm_shm.buf)
+        self._meta = np.ndarray((n, 3), dtype=np.float64, buffer=self._meta_shm.buf)
+        self._lms[:] = np.nan
+        self._meta[:] = 0
+        self._stop = _CTX.Event()
+        self._procs = []
+
+    def start(self):
+        n = len(self.sources)
+        for w in range(self.workers):
+            slots = list(range(w, n, self.workers))
+            p = _CTX.Process(
+                target=_stream_worker,
+                args=(slots, [self.sources[i] for i in slots], self._lm_shm.name,
+                      self._meta_shm.name, n, self.detector_kwargs, self._stop),
+                daemon=True,
+            )
+            p.start()
+            self._procs.append(p)
+        return self
+
+    def latest(self, stream: int, max_retries: int = 1000) -> Optional[Tuple[int, float, Optional[Landmarks]]]:
+        """
+        Returns (seq, timestamp, landmarks) for a stream. seq increases by 2
+        per processed frame, so callers can tell whether anything is new.
+        Returns None if no consistent read succeeds within `max_retries`
+        (e.g. the writer died mid-update and left seq odd).
+        """
+        for _ in range(max_retries):
+            seq = self._meta[stream, _META_SEQ]
+            if int(seq) % 2:
+                time.sleep(0)  # writer mid-update: yield instead of spinning
+                continue
+            data = self._lms[stream].copy()
+            t = self._meta[stream, _META_TIME]
+            detected = self._meta[stream, _META_DETECTED]
+            if self._meta[stream, _META_SEQ] == seq:
+                return int(seq), float(t), Landmarks(data) if detected else None
+            time.sleep(0)
+        return None
+
+    def snapshot(self) -> np.ndarray:
+        """ Copy of all streams' latest landmarks, (S, 33, 4). """
+        return self._lms.copy()
+
+    def stop(self, timeout: float = 2.0):
+        self._stop.set()
+        for p in self._procs:
+            p.join(timeout)
+            if p.is_alive():
+                p.terminate()
+        self._procs = []
+        del self._lms, self._meta
+        self._lm_shm.close()
+        self._lm_shm.unlink()
+        self._meta_shm.close()
+        self._meta_shm.unlink()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# =========================
+# Per-frame detection
+# =========================
+# Per-process detectors, one per stream id (MediaPipe tracks per sequence)
+_stream_detectors: Dict[int, object] = {}
+_detector_kwargs: Dict = {}
+
+def _init_frame_worker(detector_kwargs: Dict):
+    global _detector_kwargs
+    _detector_kwargs = detector_kwargs
+
+def _detect_frame(stream: int, frame: np.ndarray) -> Optional[np.ndarray]:
+    det = _stream_detectors.get(stream)
+    if det is None:
+        from pose_detection import PoseDetector
+        det = _stream_detectors[stream] = PoseDetector(**_detector_kwargs)
+    lm = det.detect(frame, draw=False)['landmarks']
+    return None if lm is None else lm.data
+
+def _release_stream(stream: int):
+    det = _stream_detectors.pop(stream, None)
+    if det is not None:
+        det.close()
+
+class FramePool:
+    """
+    Single-process executors with lazily created per-stream PoseDetectors.
+    submit() routes every frame of a stream to the same worker so MediaPipe
+    keeps tracking across that stream's frames, and returns a Future (wrap it
+    with asyncio.wrap_future to await it without blocking an event loop).
+    Frames are pickled to the worker, so send them at inference size.
+    """
+    def __init__(self, workers: Optional[int] = None, **detector_kwargs):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.detector_kwargs = detector_kwargs
+        self._shards: List[ProcessPoolExecutor] = []
+
+    def start(self):
+        if not self._shards:
+            self._shards = [
+                ProcessPoolExecutor(1, mp_context=_CTX, initializer=_init_frame_worker,
+                                    initargs=(self.detector_kwargs,))
+                for _ in range(self.workers)
+            ]
+        return self
+
+    def submit(self, stream: int, frame: np.ndarray) -> Future:
+        """ Future of the (33, 4) landmarks in `frame` pixels, or None. """
+        return self._shards[stream % len(self._shards)].submit(_detect_frame, stream, frame)
+
+    def release(self, stream: int):
+        """ Closes the detector of a finished stream (queued after its last frame). """
+        if self._shards:
+            self._shards[stream % len(self._shards)].submit(_release_stream, stream)
+
+    def close(self):
+        for shard in self._shards:
+            shard.shutdown(wait=True, cancel_futures=True)
+        self._shards = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
\ No newline at end of file